@@ -1,9 +1,133 @@
 import csv
+import glob
+import itertools
+import json
+import os
+import queue
+import re
+import shutil
+import subprocess
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
+from cassandra import InvalidRequest
 from cassandra.cluster import Cluster
 from cassandra.query import SimpleStatement
 
+from cache_control import check_state, drop_os_page_cache, restart_server, run_command, warn_once
+from fake_data_inserter import TABLE_COLUMNS
+from instrumentation import CountingSession, WireStats, disk_usage, time_breakdown
+from sampling import Sampler
+from text_search import matches, tokens
+from workload import PAGE_SIZE, PRICE_BAND, bind
+
+# Query tables the indexed configuration adds, clustered for the range and pagination queries:
+# products by price within a PRICE_BAND-wide partition, orders by (created_at, order_id) within a day
+QUERY_TABLES = {
+    'products_by_price': """CREATE TABLE IF NOT EXISTS products_by_price (
+              band int,
+              price int,
+              product_id int,
+              name text,
+              PRIMARY KEY ((band), price, product_id)
+            )""",
+    'orders_by_day': """CREATE TABLE IF NOT EXISTS orders_by_day (
+              day text,
+              created_at text,
+              order_id int,
+              user_id int,
+              status text,
+              PRIMARY KEY ((day), created_at, order_id)
+            )""",
+}
+
+# Match operator of an analyzed SAI index; rows match when they contain every token of the term
+TEXT_MATCH_OPERATOR = ':'
+
+# Partition key of every base table, for token() restrictions
+PARTITION_KEYS = {'countries': 'country_code', 'users': 'user_id', 'merchants': 'merchant_id', 'orders': 'order_id',
+                  'products': 'product_id', 'order_items': 'order_id, product_id'}
+
+# Parallel scans split the token ring into SCAN_SPLITS ranges read side by side; SCAN_FETCH_SIZE is the page
+# size of every scan query, the driver's default
+SCAN_SPLITS = 16
+SCAN_FETCH_SIZE = 5000
+# The row queue of a parallel scan holds at most this many pages; range readers wait while it is full
+SCAN_QUEUE_PAGES = 4
+# Seconds a range reader waits on a full queue before checking whether the scan was abandoned
+SCAN_PUT_TIMEOUT = 0.1
+
+# Put on the row queue by a range reader once its range is exhausted
+SCAN_DONE = object()
+
+# Keys per IN query of a batched join; the coordinator fans the list out to the partitions' replicas, so longer
+# lists only move the per-key cost there. Lookups that cannot use IN run JOIN_CONCURRENCY at a time.
+IN_BATCH_SIZE = 100
+JOIN_CONCURRENCY = 16
+
+# Filter columns of the indexed queries. order_items.order_id stays unindexed.
+INDEXED_COLUMNS = [('countries', 'continent_name'), ('users', 'country_code'), ('orders', 'status'),
+                   ('orders', 'user_id'), ('order_items', 'product_id'), ('products', 'merchant_id')]
+
+# legacy: the original secondary indexes; sai: Storage-Attached Indexes; mv: a materialized view per column,
+# <table>_by_<column>, partitioned by it (needs materialized_views_enabled in cassandra.yaml)
+INDEX_FLAVORS = ['legacy', 'sai', 'mv']
+
+
+# Table options of the server defaults, overridden per table by the table_options setting and per combination by
+# the table_options phase. chunk_length_kb is the compression chunk length; 'rows' caching needs row_cache_size.
+TABLE_OPTION_DEFAULTS = {'compaction': 'stcs', 'compression': 'lz4', 'chunk_length_kb': 16,
+                         'bloom_filter_fp_chance': 0.01, 'caching': 'keys', 'gc_grace_seconds': 864000}
+COMPACTION_STRATEGIES = {'stcs': 'SizeTieredCompactionStrategy', 'lcs': 'LeveledCompactionStrategy',
+                         'ucs': 'UnifiedCompactionStrategy'}
+COMPRESSORS = {'lz4': 'LZ4Compressor', 'zstd': 'ZstdCompressor', 'snappy': 'SnappyCompressor',
+               'deflate': 'DeflateCompressor', 'none': None}
+CACHING = {'keys': ('ALL', 'NONE'), 'rows': ('ALL', 'ALL'), 'none': ('NONE', 'NONE')}
+
+# Option -> values the table_options phase combines; options left out keep their configured value
+TABLE_OPTION_MATRIX = {'compaction': ['stcs', 'lcs', 'ucs'], 'compression': ['lz4', 'zstd', 'none']}
+
+
+def option_matrix(matrix):
+    # Every combination of the listed values, e.g. [{'compaction': 'stcs', 'compression': 'lz4'}, ...]
+    return [dict(zip(matrix, values)) for values in itertools.product(*matrix.values())]
+
+
+def table_options_cql(options):
+    # WITH clause of a complete set of table options (defaults filled in)
+    compressor = COMPRESSORS[options['compression']]
+    compression = (f"{{'class': '{compressor}', 'chunk_length_in_kb': {options['chunk_length_kb']}}}"
+                   if compressor else "{'enabled': 'false'}")
+    keys, rows = CACHING[options['caching']]
+    return (f"compaction = {{'class': '{COMPACTION_STRATEGIES[options['compaction']]}'}} "
+            f"AND compression = {compression} "
+            f"AND bloom_filter_fp_chance = {options['bloom_filter_fp_chance']} "
+            f"AND caching = {{'keys': '{keys}', 'rows_per_partition': '{rows}'}} "
+            f"AND gc_grace_seconds = {options['gc_grace_seconds']}")
+
+
+def index_ddl(flavor, table, column):
+    if flavor == 'legacy':
+        return f"CREATE INDEX IF NOT EXISTS ON {table} ({column});"
+    if flavor == 'sai':
+        return (f"CREATE CUSTOM INDEX IF NOT EXISTS {table}_{column}_sai ON {table} ({column}) "
+                "USING 'StorageAttachedIndex';")
+    # Every primary key column of the base table has to be in the view's primary key
+    key = [name for name in PARTITION_KEYS[table].split(', ') if name != column]
+    not_null = ' AND '.join(f"{name} IS NOT NULL" for name in [column] + key)
+    return (f"CREATE MATERIALIZED VIEW IF NOT EXISTS {table}_by_{column} AS SELECT * FROM {table} "
+            f"WHERE {not_null} PRIMARY KEY (({column}), {', '.join(key)});")
+
+
+def token_ranges(splits):
+    # (start, end] ranges covering the Murmur3Partitioner ring, whose tokens are signed 64-bit integers.
+    # The minimum token is never assigned to a key, so the first range can leave it out.
+    lowest, highest = -2 ** 63, 2 ** 63 - 1
+    step = (highest - lowest) // splits
+    bounds = [lowest + i * step for i in range(splits)] + [highest]
+    return list(zip(bounds, bounds[1:]))
+
 
 class CassandraConnector:
 
@@ -12,12 +136,53 @@ class CassandraConnector:
         self.port = port
         self._cluster = None
         self._session = None
+        self.samples = {}
+        self.sampler = Sampler()
+        self.wire = WireStats()
+        self.wire_stats = {}
+        # Trace every statement and sum the coordinator trace durations (tracing adds server overhead)
+        self.server_timing = False
+        self.server_times = []
+        self.breakdowns = {}
+        self.cache_state = 'warm'
+        self.nodetool = ['nodetool']
+        # e.g. ['sudo', 'systemctl', 'restart', 'cassandra']; also empties the chunk cache on cold runs
+        self.restart_command = None
+        # nodetool snapshots live next to the SSTables; restoring copies them back, so it needs file access
+        self.data_directory = '/var/lib/cassandra/data'
+        self.snapshot_dir = os.path.join('snapshots', 'cassandra')
+        # Query tables present in the keyspace, which writes to orders have to keep up to date
+        self.query_tables = set()
+        # With parallel_scans, the full-table and ALLOW FILTERING reads of the queries go through scan() as
+        # scan_splits token range queries at a time instead of one query through one coordinator. Keyed lookups
+        # (a condition on a key, as in the inner loops of the joins) always stay a single query.
+        self.parallel_scans = False
+        self.scan_splits = SCAN_SPLITS
+        self.scan_fetch_size = SCAN_FETCH_SIZE
+        # Which of INDEX_FLAVORS the indexed queries read through
+        self.index_flavor = 'legacy'
+        # Batched joins fetch the users and products of q2/q4 as IN lists of distinct keys and the other lookups
+        # concurrently; without them every joined row costs its own query, as in a nested loop
+        self.batched_joins = True
+        self.in_batch_size = IN_BATCH_SIZE
+        self.join_concurrency = JOIN_CONCURRENCY
+        # Table options of create_tables, {'*': {...}} for every table and {'<table>': {...}} for one, see
+        # TABLE_OPTION_DEFAULTS. applied_table_options is what the table_options phase set the tables to, None while
+        # they have the configured ones.
+        self.table_options = {}
+        self.applied_table_options = None
+
+    @property
+    def layout(self):
+        # Recorded with every stored run, like MySQL's schema and partitioning
+        options = self.configured_table_options() if self.applied_table_options is None else self.applied_table_options
+        return {'table_options': options} if options else None
 
     def connect(self):
         if self._cluster is None:
             self._cluster = Cluster(contact_points=self.contact_points, port=self.port)
         if self._session is None:
-            self._session = self._cluster.connect()
+            self._session = CountingSession(self._cluster.connect(), self.wire)
 
     def disconnect(self):
         if self._session is not None:
@@ -25,6 +190,53 @@ class CassandraConnector:
         if self._cluster is not None:
             self._cluster.shutdown()
 
+    def server_version(self):
+        self.connect()
+        return self._session.execute("SELECT release_version FROM system.local").one().release_version
+
+    def nodetool_command(self, *args):
+        return self.nodetool + ['-h', self.contact_points[0]] + list(args)
+
+    def reset_cache(self, state: str):
+        # Cassandra has no plan cache: plan_cold drops the key/row caches and keeps the OS page cache,
+        # cold drops the OS page cache (where SSTable data lives) as well
+        check_state(state)
+        if state == 'warm':
+            return
+        if state == 'cold' and self.restart_command:
+            restart_server(self.restart_command, lambda: self._session.execute("SELECT now() FROM system.local"))
+        for command in ['invalidatekeycache', 'invalidaterowcache', 'invalidatecountercache']:
+            run_command(self.nodetool_command(command))
+        if state == 'cold':
+            drop_os_page_cache()
+
+    def prepare_cache(self):
+        with self.wire.pause():
+            self.reset_cache(self.cache_state)
+
+    def before_iteration(self):
+        self.prepare_cache()
+        if self.server_timing:
+            self._session.traced = []
+            self._session.trace_requests = True
+
+    def record_server_time(self):
+        if not self.server_timing:
+            return
+        self._session.trace_requests = False
+        total = 0.0
+        with self.wire.pause():
+            for result in self._session.traced:
+                try:
+                    trace = result.get_query_trace()
+                except Exception as e:
+                    print(f"Trace unavailable: {e}")
+                    continue
+                if trace is not None and trace.duration is not None:
+                    total += trace.duration.total_seconds()
+        self._session.traced = []
+        self.server_times.append(total)
+
     def execute(self, cql: str, **kwargs):
         self.connect()
         self._session.execute(cql, **kwargs)
@@ -55,6 +267,38 @@ class CassandraConnector:
         cql = f"DROP KEYSPACE IF EXISTS {keyspace_name};"
         self._session.execute(cql)
 
+    def snapshot_marker(self, name: str):
+        return os.path.join(self.snapshot_dir, f"{name}.snapshot")
+
+    def has_snapshot(self, name: str):
+        return os.path.exists(self.snapshot_marker(name))
+
+    def snapshot(self, name: str, keyspace_name: str):
+        subprocess.run(self.nodetool_command('flush', keyspace_name), check=True)
+        subprocess.run(self.nodetool_command('snapshot', '-t', name, keyspace_name), check=True)
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        with open(self.snapshot_marker(name), 'w') as f:
+            f.write(keyspace_name + '\n')
+        print(f"Cassandra snapshot {name} of {keyspace_name} taken")
+
+    def restore(self, name: str, keyspace_name: str):
+        self.connect()
+        rows = self._session.execute("SELECT table_name FROM system_schema.tables WHERE keyspace_name = %s",
+                                     [keyspace_name])
+        for table in [row.table_name for row in rows]:
+            snapshot_dirs = glob.glob(os.path.join(self.data_directory, keyspace_name, f"{table}-*", 'snapshots', name))
+            if not snapshot_dirs:
+                continue
+            table_dir = os.path.dirname(os.path.dirname(snapshot_dirs[0]))
+            self._session.execute(f"TRUNCATE {keyspace_name}.{table}")
+            for file_name in os.listdir(snapshot_dirs[0]):
+                source = os.path.join(snapshot_dirs[0], file_name)
+                # manifest.json/schema.cql describe the snapshot, index SSTables live in subdirectories
+                if os.path.isfile(source) and file_name not in ('manifest.json', 'schema.cql'):
+                    shutil.copy2(source, table_dir)
+            subprocess.run(self.nodetool_command('refresh', keyspace_name, table), check=True)
+        print(f"Cassandra snapshot {name} restored into {keyspace_name}")
+
     def create_tables(self):
         cql = [
             """
@@ -104,6 +348,10 @@ class CassandraConnector:
             )""",
         ]
 
+        if self.table_options:
+            cql = [statement + " WITH " + table_options_cql(self.options_for(re.search(r'EXISTS (\w+)', statement)[1]))
+                   for statement in cql]
+        self.applied_table_options = None
         self.execute_multi(cql)
 
         #         cql = ["""CREATE TABLE IF NOT EXISTS countries (
@@ -157,7 +405,141 @@ class CassandraConnector:
         # );
         # """, ]
 
-    def insert_data(self):
+    def options_for(self, table: str, overrides: dict = None):
+        return dict(TABLE_OPTION_DEFAULTS, **self.table_options.get('*', {}), **self.table_options.get(table, {}),
+                    **(overrides or {}))
+
+    def configured_table_options(self):
+        # Options create_tables gives every table, {} when the tables keep the server defaults
+        return {table: self.options_for(table) for table in TABLE_COLUMNS} if self.table_options else {}
+
+    def set_table_options(self, keyspace_name: str, overrides: dict):
+        # ALTER TABLE every base table to its configured options with overrides on top; {} goes back to the
+        # configured ones. Existing SSTables keep their old format until compact() rewrites them.
+        self.connect()
+        applied = {table: self.options_for(table, overrides) for table in TABLE_COLUMNS}
+        for table, options in applied.items():
+            try:
+                self.execute(f"ALTER TABLE {keyspace_name}.{table} WITH {table_options_cql(options)};")
+            except InvalidRequest as e:
+                # e.g. UnifiedCompactionStrategy before Cassandra 5.0
+                raise ValueError(str(e)) from e
+        self.applied_table_options = applied if overrides else None
+
+    def compact(self, keyspace_name: str):
+        # Flushes the memtables and compacts every table, so each measurement starts from the same SSTable layout
+        # whatever the load or the previous writes left behind; returns the seconds it took
+        start = time.perf_counter()
+        run_command(self.nodetool_command('flush', keyspace_name))
+        run_command(self.nodetool_command('compact', keyspace_name))
+        return time.perf_counter() - start
+
+    def table_sizes(self, keyspace_name: str):
+        # Bytes and SSTable count of every base table on disk (SAI components included, legacy index
+        # directories, snapshots and backups not)
+        sizes = {}
+        for table in TABLE_COLUMNS:
+            files = [path for table_dir in glob.glob(os.path.join(self.data_directory, keyspace_name, f"{table}-*"))
+                     for path in glob.glob(os.path.join(table_dir, '*')) if os.path.isfile(path)]
+            if not files:
+                warn_once(f"no data directory for {keyspace_name}.{table} under {self.data_directory}, "
+                          "Cassandra table sizes need access to the server's data directory")
+            sizes[table] = {'bytes': sum(os.path.getsize(path) for path in files),
+                            'sstables': sum(1 for path in files if path.endswith('-Data.db'))}
+        return sizes
+
+    def get_fingerprint(self, keyspace_name: str):
+        self.connect()
+        try:
+            rows = self._session.execute(f"SELECT name, value FROM {keyspace_name}.dataset_meta")
+            meta = {row.name: row.value for row in rows}
+        except Exception:
+            return None
+        # Tables created with other options do not count as holding the dataset; keyspaces loaded before the
+        # options were recorded have the server defaults
+        if json.loads(meta.get('table_options', '{}')) != self.configured_table_options():
+            return None
+        return meta.get('fingerprint')
+
+    def set_fingerprint(self, keyspace_name: str, fingerprint: str):
+        self.connect()
+        self._session.execute(f"CREATE TABLE IF NOT EXISTS {keyspace_name}.dataset_meta (name text PRIMARY KEY, value text)")
+        self._session.execute(f"INSERT INTO {keyspace_name}.dataset_meta (name, value) VALUES ('fingerprint', %s)",
+                              [fingerprint])
+        self._session.execute(f"INSERT INTO {keyspace_name}.dataset_meta (name, value) VALUES ('table_options', %s)",
+                              [json.dumps(self.configured_table_options(), sort_keys=True)])
+
+    def drop_indexes(self, keyspace_name: str):
+        self.connect()
+        rows = self._session.execute("SELECT index_name FROM system_schema.indexes WHERE keyspace_name = %s",
+                                     [keyspace_name])
+        for row in list(rows):
+            self.execute(f"DROP INDEX IF EXISTS {keyspace_name}.{row.index_name};")
+        for view in self.views(keyspace_name):
+            self.execute(f"DROP MATERIALIZED VIEW IF EXISTS {keyspace_name}.{view};")
+        for table in QUERY_TABLES:
+            self.execute(f"DROP TABLE IF EXISTS {keyspace_name}.{table};")
+        self.query_tables = set()
+
+    def views(self, keyspace_name: str):
+        rows = self._session.execute("SELECT view_name FROM system_schema.views WHERE keyspace_name = %s",
+                                     [keyspace_name])
+        return [row.view_name for row in rows]
+
+    def find_query_tables(self, keyspace_name: str):
+        self.connect()
+        rows = self._session.execute("SELECT table_name FROM system_schema.tables WHERE keyspace_name = %s",
+                                     [keyspace_name])
+        self.query_tables = {row.table_name for row in rows} & set(QUERY_TABLES)
+        return self.query_tables
+
+    def wait_for_indexes(self, keyspace_name: str, timeout: int = 600):
+        # Secondary indexes and materialized views are built in the background; system."IndexInfo" and
+        # system.built_views list the finished ones
+        self.connect()
+        rows = self._session.execute("SELECT index_name FROM system_schema.indexes WHERE keyspace_name = %s",
+                                     [keyspace_name])
+        pending = {row.index_name for row in rows} | set(self.views(keyspace_name))
+        deadline = time.time() + timeout
+        while pending and time.time() < deadline:
+            built = self._session.execute('SELECT index_name FROM system."IndexInfo" WHERE table_name = %s',
+                                          [keyspace_name])
+            pending -= {row.index_name.split('.')[-1] for row in built}
+            built = self._session.execute("SELECT view_name FROM system.built_views WHERE keyspace_name = %s",
+                                          [keyspace_name])
+            pending -= {row.view_name for row in built}
+            if pending:
+                time.sleep(0.5)
+        if pending:
+            warn_once(f"indexes {sorted(pending)} still building after {timeout}s")
+        return not pending
+
+    def index_sizes(self, keyspace_name: str):
+        # Legacy index SSTables live in a .<index_name> directory inside their table's data directory, SAI
+        # components next to the table's SSTables with the index name in the file name, and a materialized
+        # view in a data directory of its own. Memtables are flushed first to get everything on disk.
+        self.connect()
+        run_command(self.nodetool_command('flush', keyspace_name))
+        rows = self._session.execute("SELECT table_name, index_name FROM system_schema.indexes "
+                                     "WHERE keyspace_name = %s", [keyspace_name])
+        sizes = {}
+        for row in rows:
+            table_dirs = glob.glob(os.path.join(self.data_directory, keyspace_name, f"{row.table_name}-*"))
+            if not table_dirs:
+                warn_once(f"no data directory for {keyspace_name}.{row.table_name} under {self.data_directory}, "
+                          "Cassandra index sizes need access to the server's data directory")
+                continue
+            sizes[f"{row.table_name}.{row.index_name}"] = sum(
+                disk_usage(os.path.join(table_dir, f".{row.index_name}"))
+                + sum(disk_usage(path) for path in glob.glob(os.path.join(table_dir, f"*SAI*+{row.index_name}+*")))
+                for table_dir in table_dirs)
+        # A query table is an index kept by hand and a view one kept by the server, so all of it counts
+        for table in sorted(self.find_query_tables(keyspace_name)) + self.views(keyspace_name):
+            sizes[table] = sum(disk_usage(table_dir) for table_dir in
+                               glob.glob(os.path.join(self.data_directory, keyspace_name, f"{table}-*")))
+        return sizes
+
+    def insert_data(self, data_dir: str = '.'):
         csv_files = {
             'countries': 'countries.csv',
             'users': 'users.csv',
@@ -170,7 +552,7 @@ class CassandraConnector:
         integer_columns = ['country_code', 'user_id', 'merchant_id', 'order_id', 'product_id', 'price', 'quantity']
 
         for table, csv_file in csv_files.items():
-            with open(csv_file, 'r') as f:
+            with open(os.path.join(data_dir, csv_file), 'r') as f:
                 reader = csv.DictReader(f)
                 for row in reader:
                     # Convert 'country_code' to integer
@@ -188,38 +570,158 @@ class CassandraConnector:
 
             print("Data imported successfully from " + csv_file)
 
-    def q1(self):
-        result = []
-        continent_name = 'North America'
-        query = SimpleStatement("SELECT country_code FROM countries WHERE continent_name = %s ALLOW FILTERING")
-        rows = self._session.execute(query, [continent_name])
-        for row in rows:
-            country_code = row.country_code
-            query = SimpleStatement("SELECT full_name, email FROM users WHERE country_code = %s ALLOW FILTERING")
-            user_rows = self._session.execute(query, [country_code])
-            for user_row in user_rows:
-                result.append(user_row)
-        print('q1 success')
-
-    def q2(self):
-        query = SimpleStatement("SELECT * FROM orders WHERE status = 'Shipped' ALLOW FILTERING")
-        orders = self._session.execute(query)
+    def insert_order(self, order):
+        self.connect()
+        self._session.execute("INSERT INTO orders (order_id, user_id, status, created_at) VALUES (%s, %s, %s, %s)",
+                              list(order))
+        if 'orders_by_day' in self.query_tables:
+            order_id, user_id, status, created_at = order
+            self._session.execute("INSERT INTO orders_by_day (day, created_at, order_id, user_id, status) "
+                                  "VALUES (%s, %s, %s, %s, %s)",
+                                  [created_at[:10], created_at, order_id, user_id, status])
+
+    def order_created_at(self, order_id: int):
+        # orders_by_day rows are addressed by created_at, which only the base table knows
+        row = self._session.execute("SELECT created_at FROM orders WHERE order_id = %s", [order_id]).one()
+        return row.created_at if row else None
+
+    def update_order_status(self, order_id: int, status: str):
+        self.connect()
+        self._session.execute("UPDATE orders SET status = %s WHERE order_id = %s", [status, order_id])
+        if 'orders_by_day' in self.query_tables:
+            created_at = self.order_created_at(order_id)
+            if created_at is not None:
+                self._session.execute("UPDATE orders_by_day SET status = %s "
+                                      "WHERE day = %s AND created_at = %s AND order_id = %s",
+                                      [status, created_at[:10], created_at, order_id])
+
+    def delete_order(self, order_id: int):
+        self.connect()
+        created_at = self.order_created_at(order_id) if 'orders_by_day' in self.query_tables else None
+        self._session.execute("DELETE FROM orders WHERE order_id = %s", [order_id])
+        if created_at is not None:
+            self._session.execute("DELETE FROM orders_by_day WHERE day = %s AND created_at = %s AND order_id = %s",
+                                  [created_at[:10], created_at, order_id])
+
+    def scan(self, table: str, columns: str = '*', condition: str = None, params: list = None, parallel: bool = None):
+        # Generator over the rows of a full table read, optionally filtered by condition (ALLOW FILTERING).
+        # Parallel reads split the token ring and page through every range on its own thread; rows are
+        # yielded as they arrive, so they come in no particular order.
+        parallel = self.parallel_scans if parallel is None else parallel
+        params = list(params or [])
+        filtering = f" AND {condition} ALLOW FILTERING" if condition else ''
+        if not parallel:
+            where = f" WHERE {condition} ALLOW FILTERING" if condition else ''
+            yield from self._session.execute(SimpleStatement(f"SELECT {columns} FROM {table}{where}",
+                                                             fetch_size=self.scan_fetch_size), params)
+            return
+        key = PARTITION_KEYS[table]
+        statement = SimpleStatement(f"SELECT {columns} FROM {table} "
+                                    f"WHERE token({key}) > %s AND token({key}) <= %s{filtering}",
+                                    fetch_size=self.scan_fetch_size)
+        rows = queue.Queue(maxsize=SCAN_QUEUE_PAGES * self.scan_fetch_size)
+        # Set when the consumer stops early (generator closed or an error), so the readers give up instead of
+        # blocking on a full queue forever
+        stop = threading.Event()
+
+        def offer(item):
+            while not stop.is_set():
+                try:
+                    rows.put(item, timeout=SCAN_PUT_TIMEOUT)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def read(start, end):
+            try:
+                if stop.is_set():
+                    return
+                for row in self._session.execute(statement, [start, end] + params):
+                    if not offer(row):
+                        return
+            finally:
+                offer(SCAN_DONE)
+
+        with ThreadPoolExecutor(max_workers=self.scan_splits) as executor:
+            futures = [executor.submit(read, start, end) for start, end in token_ranges(self.scan_splits)]
+            try:
+                finished = 0
+                while finished < len(futures):
+                    row = rows.get()
+                    if row is SCAN_DONE:
+                        finished += 1
+                    else:
+                        yield row
+            finally:
+                stop.set()
+            # Raises the error of a range that failed
+            for future in futures:
+                future.result()
+
+    def export_data(self, data_dir: str = '.', parallel: bool = None):
+        # Writes every base table to <table>.csv in the generated datasets' column order; returns the row counts
+        counts = {}
+        for table, columns in TABLE_COLUMNS.items():
+            with open(os.path.join(data_dir, f"{table}.csv"), 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                counts[table] = 0
+                for row in self.scan(table, ', '.join(columns), parallel=parallel):
+                    writer.writerow(row)
+                    counts[table] += 1
+            print(f"Data exported successfully to {table}.csv")
+        return counts
+
+    def select_one_or_all(self, table: str, key: str, value):
+        # Partition lookup when a parameter is given, full scan otherwise
+        if value is None:
+            return self.scan(table)
+        return self._session.execute(SimpleStatement(f"SELECT * FROM {table} WHERE {key} = %s"), [value])
+
+    def fetch_by_key(self, table: str, columns: str, key: str, keys: list, cache: dict):
+        # Rows of table by its single-column partition key, as {key: row}; columns has to include key.
+        # Batched: the distinct keys not in cache yet, in IN lists of at most in_batch_size keys, and the rows
+        # are added to cache, which lives as long as the query. Otherwise one query per key, repeats included,
+        # as the nested loops issue them.
+        if not self.batched_joins:
+            query = SimpleStatement(f"SELECT {columns} FROM {table} WHERE {key} = %s")
+            for value in keys:
+                cache[value] = self._session.execute(query, [value]).one()
+            return cache
+        missing = [value for value in dict.fromkeys(keys) if value not in cache]
+        for start in range(0, len(missing), self.in_batch_size):
+            batch = missing[start:start + self.in_batch_size]
+            query = SimpleStatement(f"SELECT {columns} FROM {table} WHERE {key} IN ({', '.join(['%s'] * len(batch))})")
+            for row in self._session.execute(query, batch):
+                cache[getattr(row, key)] = row
+        return cache
+
+    def fetch_each(self, fetch, keys: list):
+        # {key: rows} for lookups that cannot be batched into an IN list, e.g. order_items by one component of
+        # its partition key. Batched: every distinct key once, join_concurrency requests at a time.
+        keys = list(dict.fromkeys(keys))
+        if not self.batched_joins:
+            return {value: list(fetch(value)) for value in keys}
+        with ThreadPoolExecutor(max_workers=self.join_concurrency) as executor:
+            return dict(zip(keys, executor.map(lambda value: list(fetch(value)), keys)))
+
+    def order_items_of(self, order_id: int):
+        return self.scan('order_items', '*', 'order_id = %s', [order_id], parallel=False)
+
+    def order_details(self, orders: list):
+        # The joins of q2, one level at a time: the user of every order, the items of every order and the
+        # product of every item
+        users = self.fetch_by_key('users', 'user_id, full_name, email', 'user_id',
+                                  [order.user_id for order in orders], {})
+        items = self.fetch_each(self.order_items_of, [order.order_id for order in orders])
+        products = self.fetch_by_key('products', 'product_id, name, price', 'product_id',
+                                     [item.product_id for order in orders for item in items[order.order_id]], {})
         result = []
-
         for order in orders:
-            # Get user details for the order
-            query = SimpleStatement("SELECT full_name, email FROM users WHERE user_id = %s")
-            user = self._session.execute(query, [order.user_id]).one()
-
-            # Get order items for the order
-            query = SimpleStatement("SELECT * FROM order_items WHERE order_id = %s ALLOW FILTERING")
-            order_items = self._session.execute(query, [order.order_id])
-
-            for order_item in order_items:
-                # Get product details for the order item
-                query = SimpleStatement("SELECT name, price FROM products WHERE product_id = %s")
-                product = self._session.execute(query, [order_item.product_id]).one()
-
+            user = users[order.user_id]
+            for order_item in items[order.order_id]:
+                product = products[order_item.product_id]
                 result.append({
                     'order_id': order.order_id,
                     'user_name': user.full_name,
@@ -230,23 +732,64 @@ class CassandraConnector:
                     'status': order.status,
                     'created_at': order.created_at
                 })
+        return result
+
+    def average_order_values(self, users: list, orders_of):
+        # The joins of q4, one level at a time: the orders of every user, the items of every order that is not
+        # pending and the price of every item's product
+        orders = self.fetch_each(orders_of, [user.user_id for user in users])
+        placed = [order for user in users for order in orders[user.user_id] if order.status != 'Pending']
+        items = self.fetch_each(self.order_items_of, [order.order_id for order in placed])
+        prices = self.fetch_by_key('products', 'product_id, price', 'product_id',
+                                   [item.product_id for order in placed for item in items[order.order_id]], {})
+        result = []
+        for user in users:
+            total_order_value = 0
+            order_count = 0
+            for order in orders[user.user_id]:
+                if order.status == 'Pending':
+                    continue
+                for order_item in items[order.order_id]:
+                    total_order_value += prices[order_item.product_id].price * order_item.quantity
+                    order_count += 1
+
+            avg_order_value = total_order_value / order_count if order_count > 0 else 0
+
+            result.append({
+                'user_id': user.user_id,
+                'full_name': user.full_name,
+                'avg_order_value': avg_order_value
+            })
+        return result
+
+    def q1(self, continent_name: str = 'North America'):
+        result = []
+        rows = self.scan('countries', 'country_code', 'continent_name = %s', [continent_name])
+        for row in rows:
+            country_code = row.country_code
+            user_rows = self.scan('users', 'full_name, email', 'country_code = %s', [country_code], parallel=False)
+            for user_row in user_rows:
+                result.append(user_row)
+        print('q1 success')
+
+    def q2(self, status: str = 'Shipped'):
+        orders = self.scan('orders', '*', 'status = %s', [status])
+        result = self.order_details(list(orders))
         print('q2 success')
 
-    def q3(self):
-        query = SimpleStatement("SELECT * FROM merchants")
-        merchants = self._session.execute(query)
+    def merchant_revenues(self, merchant_id: int = None):
+        # Revenue of every merchant (or of merchant_id), shared by q3 and q7
+        merchants = self.select_one_or_all('merchants', 'merchant_id', merchant_id)
         result = []
 
         for merchant in merchants:
             # Get all products offered by the merchant
-            query = SimpleStatement("SELECT * FROM products WHERE merchant_id = %s ALLOW FILTERING")
-            products = self._session.execute(query, [merchant.merchant_id])
+            products = self.scan('products', '*', 'merchant_id = %s', [merchant.merchant_id], parallel=False)
 
             total_revenue = 0
             for product in products:
                 # Get all order items for the product
-                query = SimpleStatement("SELECT * FROM order_items WHERE product_id = %s ALLOW FILTERING")
-                order_items = self._session.execute(query, [product.product_id])
+                order_items = self.scan('order_items', '*', 'product_id = %s', [product.product_id], parallel=False)
 
                 for order_item in order_items:
                     total_revenue += product.price * order_item.quantity
@@ -256,137 +799,160 @@ class CassandraConnector:
                 'merchant_name': merchant.merchant_name,
                 'total_revenue': total_revenue
             })
-        print('q3 success')
-
-    def q4(self):
-        query = SimpleStatement("SELECT * FROM users")
-        users = self._session.execute(query)
-
-        result = []
-        for user in users:
-            query = SimpleStatement("SELECT * FROM orders WHERE user_id = %s ALLOW FILTERING")
-            orders = self._session.execute(query, [user.user_id])
+        return result
 
-            total_order_value = 0
-            order_count = 0
-            for order in orders:
-                if order.status == 'Pending':
-                    continue
-
-                query = SimpleStatement("SELECT * FROM order_items WHERE order_id = %s ALLOW FILTERING")
-                order_items = self._session.execute(query, [order.order_id])
-
-                for order_item in order_items:
-                    query = SimpleStatement("SELECT price FROM products WHERE product_id = %s")
-                    product = self._session.execute(query, [order_item.product_id]).one()
-
-                    total_order_value += product.price * order_item.quantity
-                    order_count += 1
-
-            avg_order_value = total_order_value / order_count if order_count > 0 else 0
+    def q3(self, merchant_id: int = None):
+        result = self.merchant_revenues(merchant_id)
+        print('q3 success')
+        return result
 
-            result.append({
-                'user_id': user.user_id,
-                'full_name': user.full_name,
-                'avg_order_value': avg_order_value
-            })
+    def q4(self, user_id: int = None):
+        users = self.select_one_or_all('users', 'user_id', user_id)
+        result = self.average_order_values(list(users),
+                                           lambda user_id: self.scan('orders', '*', 'user_id = %s', [user_id],
+                                                                     parallel=False))
         print('q4 success')
 
-    def avg_execution(self, func):
-        exe_time = []
-        for x in range(10):
-            start_time = time.time()
-            func()
-            end_time = time.time()
-            execution_time = end_time - start_time
-            exe_time.append(execution_time)
-        return sum(exe_time) / 10
-
-    def query(self):
-        functions = [self.q1, self.q2, self.q3, self.q4]
+    def q5(self, min_price: int = 50):
+        return list(self.scan('products', 'product_id, name, price', 'price >= %s AND price < %s',
+                              [min_price, min_price + PRICE_BAND]))
+
+    def q6(self, since: str = None):
+        if since is None:
+            return list(self.scan('orders', 'order_id, user_id, status, created_at'))
+        return list(self.scan('orders', 'order_id, user_id, status, created_at', 'created_at >= %s', [since]))
+
+    def q7(self, limit: int = 10):
+        # No aggregation in CQL: the revenue of every merchant is computed as in q3, then ranked here
+        return sorted(self.merchant_revenues(), key=lambda row: row['total_revenue'], reverse=True)[:limit]
+
+    def q8(self, after: tuple = None):
+        # Partitions come back in token order, so without a clustered table the whole table is sorted here
+        orders = sorted(self.scan('orders', 'order_id, user_id, status, created_at'),
+                        key=lambda row: (row.created_at, row.order_id))
+        if after is not None:
+            orders = [row for row in orders if (row.created_at, row.order_id) > tuple(after)]
+        return orders[:PAGE_SIZE]
+
+    def avg_execution(self, func, name):
+        self.wire.reset()
+        self.server_times = []
+        exe_time = self.sampler.collect(func, self.before_iteration, self.record_server_time)
+        self.samples[name] = exe_time
+        self.wire_stats[name] = self.wire.per_iteration(len(exe_time))
+        self.breakdowns[name] = time_breakdown(exe_time, self.sampler.cpu_samples, self.server_times)
+        return sum(exe_time) / len(exe_time)
+
+    def query(self, params=None):
+        # params maps query names to workload.ParameterStreams; without them the default literals are used
+        functions = [self.q1, self.q2, self.q3, self.q4, self.q5, self.q6, self.q7, self.q8]
         exe_time_q1234 = []
+        self.samples = {}
+        self.wire_stats = {}
+        self.breakdowns = {}
         for i, func in enumerate(functions, 1):
-            exe_time_q1234.append(self.avg_execution(func))
+            exe_time_q1234.append(self.avg_execution(bind(func, f'q{i}', params), f'q{i}'))
         return exe_time_q1234
 
-    def indexed_query(self):
-        functions = [self.indexed_q1, self.indexed_q2, self.indexed_q3, self.indexed_q4]
+    def indexed_query(self, params=None):
+        functions = [self.indexed_q1, self.indexed_q2, self.indexed_q3, self.indexed_q4,
+                     self.indexed_q5, self.indexed_q6, self.indexed_q7, self.indexed_q8]
         exe_time_q1234 = []
+        self.samples = {}
+        self.wire_stats = {}
+        self.breakdowns = {}
         for i, func in enumerate(functions, 1):
-            exe_time_q1234.append(self.avg_execution(func))
+            exe_time_q1234.append(self.avg_execution(bind(func, f'q{i}', params), f'q{i}'))
         return exe_time_q1234
 
-    def create_indexes(self):
-
-        self.execute("""CREATE INDEX IF NOT EXISTS ON countries (continent_name);""")
-        self.execute("""CREATE INDEX IF NOT EXISTS ON users (country_code);""")
-
-        self.execute("""CREATE INDEX IF NOT EXISTS ON orders (status);""")
-        self.execute("""CREATE INDEX IF NOT EXISTS ON orders (user_id);""")
-
-        # self.execute("""CREATE INDEX IF NOT EXISTS ON order_items (order_id);""")
-        self.execute("""CREATE INDEX IF NOT EXISTS ON order_items (product_id);""")
+    def create_indexes(self, flavor: str = 'legacy'):
+        for table, column in INDEXED_COLUMNS:
+            self.execute(index_ddl(flavor, table, column))
+        self.index_flavor = flavor
+
+        self.create_query_tables()
+
+    def lookup(self, table: str, columns: str, column: str, value, allow_filtering: bool = False):
+        # Rows whose indexed column equals value: through the index on the base table, or from the column's view
+        source = f"{table}_by_{column}" if self.index_flavor == 'mv' else table
+        filtering = ' ALLOW FILTERING' if allow_filtering and self.index_flavor != 'mv' else ''
+        return self._session.execute(SimpleStatement(f"SELECT {columns} FROM {source} WHERE {column} = %s{filtering}"),
+                                     [value])
+
+    def create_query_tables(self):
+        # Filled from the base tables; there is no server-side way to populate a new table from another one
+        for cql in QUERY_TABLES.values():
+            self.execute(cql)
+        for product in self.scan('products', 'product_id, name, price'):
+            self._session.execute("INSERT INTO products_by_price (band, price, product_id, name) "
+                                  "VALUES (%s, %s, %s, %s)",
+                                  [product.price // PRICE_BAND * PRICE_BAND, product.price, product.product_id,
+                                   product.name])
+        for order in self.scan('orders', 'order_id, user_id, status, created_at'):
+            self._session.execute("INSERT INTO orders_by_day (day, created_at, order_id, user_id, status) "
+                                  "VALUES (%s, %s, %s, %s, %s)",
+                                  [order.created_at[:10], order.created_at, order.order_id, order.user_id,
+                                   order.status])
+        self.query_tables = set(QUERY_TABLES)
+
+    def create_text_indexes(self, columns):
+        # SAI with the standard analyzer (lower-cased word tokens); there is no prefix or phrase matching
+        for table, column in columns:
+            self.execute(f"CREATE CUSTOM INDEX IF NOT EXISTS {table}_{column}_text ON {table} ({column}) "
+                         "USING 'StorageAttachedIndex' WITH OPTIONS = {'index_analyzer': 'standard'};")
+
+    def drop_text_indexes(self, columns):
+        for table, column in columns:
+            self.execute(f"DROP INDEX IF EXISTS {table}_{column}_text;")
+
+    def text_search(self, table: str, column: str, kind: str, value: str, use_index: bool = True):
+        # A phrase is looked up as the AND of its words, then checked for adjacency on the client;
+        # the scan reads the whole table and filters every row on the client
+        if use_index:
+            words = tokens(value)
+            if not words:
+                # Nothing the index could match, and an empty WHERE clause is a syntax error
+                return []
+            condition = ' AND '.join(f"{column} {TEXT_MATCH_OPERATOR} %s" for word in words)
+            rows = self._session.execute(SimpleStatement(f"SELECT * FROM {table} WHERE {condition}"), words)
+            if kind == 'term':
+                return list(rows)
+        else:
+            rows = self.scan(table)
+        return [row for row in rows if matches(kind, value, getattr(row, column))]
 
-        self.execute("""CREATE INDEX IF NOT EXISTS ON products (merchant_id);""")
+    def order_days(self):
+        # The day partitions of orders_by_day, oldest first
+        rows = self._session.execute(SimpleStatement("SELECT DISTINCT day FROM orders_by_day"))
+        return sorted(row.day for row in rows)
 
-    def indexed_q1(self):
+    def indexed_q1(self, continent_name: str = 'North America'):
         result = []
-        continent_name = 'North America'
-        query = SimpleStatement("SELECT country_code FROM countries WHERE continent_name = %s ")
-        rows = self._session.execute(query, [continent_name])
+        rows = self.lookup('countries', 'country_code', 'continent_name', continent_name)
         for row in rows:
             country_code = row.country_code
-            query = SimpleStatement("SELECT full_name, email FROM users WHERE country_code = %s ")
-            user_rows = self._session.execute(query, [country_code])
+            user_rows = self.lookup('users', 'full_name, email', 'country_code', country_code)
             for user_row in user_rows:
                 result.append(user_row)
         print('q1 success')
 
-    def indexed_q2(self):
-        query = SimpleStatement("SELECT * FROM orders WHERE status = 'Shipped' ")
-        orders = self._session.execute(query)
-        result = []
-
-        for order in orders:
-            # Get user details for the order
-            query = SimpleStatement("SELECT full_name, email FROM users WHERE user_id = %s")
-            user = self._session.execute(query, [order.user_id]).one()
-
-            # Get order items for the order
-            query = SimpleStatement("SELECT * FROM order_items WHERE order_id = %s ALLOW FILTERING")
-            order_items = self._session.execute(query, [order.order_id])
-
-            for order_item in order_items:
-                # Get product details for the order item
-                query = SimpleStatement("SELECT name, price FROM products WHERE product_id = %s")
-                product = self._session.execute(query, [order_item.product_id]).one()
-
-                result.append({
-                    'order_id': order.order_id,
-                    'user_name': user.full_name,
-                    'user_email': user.email,
-                    'product_name': product.name,
-                    'quantity': order_item.quantity,
-                    'price': product.price,
-                    'status': order.status,
-                    'created_at': order.created_at
-                })
+    def indexed_q2(self, status: str = 'Shipped'):
+        orders = self.lookup('orders', '*', 'status', status)
+        result = self.order_details(list(orders))
         print('q2 success')
 
-    def indexed_q3(self):
-        query = SimpleStatement("SELECT * FROM merchants")
-        merchants = self._session.execute(query)
+    def indexed_merchant_revenues(self, merchant_id: int = None):
+        # merchant_revenues through the indexes, shared by indexed_q3 and indexed_q7
+        merchants = self.select_one_or_all('merchants', 'merchant_id', merchant_id)
         result = []
 
         for merchant in merchants:
             # Get all products offered by the merchant
-            query = SimpleStatement("SELECT * FROM products WHERE merchant_id = %s ")
-            products = self._session.execute(query, [merchant.merchant_id])
+            products = self.lookup('products', '*', 'merchant_id', merchant.merchant_id)
 
             total_revenue = 0
             for product in products:
-                query = SimpleStatement("SELECT * FROM order_items WHERE product_id = %s ALLOW FILTERING")
-                order_items = self._session.execute(query, [product.product_id])
+                order_items = self.lookup('order_items', '*', 'product_id', product.product_id, allow_filtering=True)
 
                 for order_item in order_items:
                     total_revenue += product.price * order_item.quantity
@@ -396,38 +962,50 @@ class CassandraConnector:
                 'merchant_name': merchant.merchant_name,
                 'total_revenue': total_revenue
             })
+        return result
+
+    def indexed_q3(self, merchant_id: int = None):
+        result = self.indexed_merchant_revenues(merchant_id)
         print('q3 success')
+        return result
 
-    def indexed_q4(self):
-        query = SimpleStatement("SELECT * FROM users")
-        users = self._session.execute(query)
+    def indexed_q4(self, user_id: int = None):
+        users = self.select_one_or_all('users', 'user_id', user_id)
+        result = self.average_order_values(list(users), lambda user_id: self.lookup('orders', '*', 'user_id', user_id))
+        print('q4 success')
 
+    def indexed_q5(self, min_price: int = 50):
+        # One partition per PRICE_BAND, each read as a clustering range on price
         result = []
-        for user in users:
-            query = SimpleStatement("SELECT * FROM orders WHERE user_id = %s ")
-            orders = self._session.execute(query, [user.user_id])
-
-            total_order_value = 0
-            order_count = 0
-            for order in orders:
-                if order.status == 'Pending':
-                    continue
-
-                query = SimpleStatement("SELECT * FROM order_items WHERE order_id = %s ALLOW FILTERING")
-                order_items = self._session.execute(query, [order.order_id])
-
-                for order_item in order_items:
-                    query = SimpleStatement("SELECT price FROM products WHERE product_id = %s")
-                    product = self._session.execute(query, [order_item.product_id]).one()
-
-                    total_order_value += product.price * order_item.quantity
-                    order_count += 1
-
-            avg_order_value = total_order_value / order_count if order_count > 0 else 0
+        query = SimpleStatement("SELECT product_id, name, price FROM products_by_price "
+                                "WHERE band = %s AND price >= %s AND price < %s")
+        for band in range(min_price // PRICE_BAND * PRICE_BAND, min_price + PRICE_BAND, PRICE_BAND):
+            result.extend(self._session.execute(query, [band, min_price, min_price + PRICE_BAND]))
+        return result
 
-            result.append({
-                'user_id': user.user_id,
-                'full_name': user.full_name,
-                'avg_order_value': avg_order_value
-            })
-        print('q4 success')
+    def indexed_q6(self, since: str = None):
+        result = []
+        query = SimpleStatement("SELECT order_id, user_id, status, created_at FROM orders_by_day "
+                                "WHERE day = %s AND created_at >= %s")
+        for day in self.order_days():
+            if since is None or day >= since[:10]:
+                result.extend(self._session.execute(query, [day, since or '']))
+        return result
+
+    def indexed_q7(self, limit: int = 10):
+        return sorted(self.indexed_merchant_revenues(), key=lambda row: row['total_revenue'], reverse=True)[:limit]
+
+    def indexed_q8(self, after: tuple = None):
+        # Walks the day partitions from the cursor's day, each as a multi-column clustering slice
+        result = []
+        query = SimpleStatement("SELECT order_id, user_id, status, created_at FROM orders_by_day "
+                                "WHERE day = %s AND (created_at, order_id) > (%s, %s) LIMIT %s")
+        after_created_at, after_order_id = after if after is not None else ('', 0)
+        for day in self.order_days():
+            if day < after_created_at[:10]:
+                continue
+            result.extend(self._session.execute(query, [day, after_created_at, after_order_id,
+                                                        PAGE_SIZE - len(result)]))
+            if len(result) >= PAGE_SIZE:
+                break
+        return result
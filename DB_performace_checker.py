@@ -1,87 +1,668 @@
-from Cassandra import CassandraConnector
-from MongoDBConnection import MongoDBConnection
-from MySQLConnection import MySQLConnection
-from Neo4jConnection import Neo4jConnection
-from RedisConnection import RedisConnection
-
-
-def mysql():
-    mysql_connection = MySQLConnection("localhost", "root", "admin", "")
-    mysql_connection.connect()
-
-    mysql_results = []
-    mysql_results2 = []
-    if mysql_connection:
-        # mysql_connection.createtables()
-        # mysql_connection.insert_data()
-        # # mysql_connection.insert_new()
-        mysql_results.append(mysql_connection.complex_query_test("trade"))
-        # mysql_connection.copy_database()
-        # mysql_connection.create_index()
-        mysql_results2.append(mysql_connection.complex_query_test("new_trade"))
-        print(mysql_results)
-        print(mysql_results2)
-        mysql_connection.export_data()
-        mysql_connection.close()
-
-def mongo():
-    mongodb_connection = MongoDBConnection("mongodb://localhost:27017")
-    mongodb_connection.connect()
-    mongodb_results = []
-    if mongodb_connection:
-        mongodb_connection.insert_from_file('trade')
-        mongodb_results.append(mongodb_connection.complex_queries('trade'))
-        mongodb_connection.create_index('trade')
-        mongodb_results.append(mongodb_connection.complex_queries('trade'))
-        print(mongodb_results)
-        mongodb_connection.close()
-
-
-def redis():
-    redis_connection = RedisConnection("localhost", 6379, "")
-    redis_connection.connect()
-    redis_results = []
-    if redis_connection:
-        redis_connection.clear_db()
-        redis_connection.insert_data()
-        redis_results.append(redis_connection.complex_query_tester())
-        redis_connection.create_indexes()
-        redis_results.append(redis_connection.execute_all_queries())
-        print(redis_results)
-        redis_connection.close()
-
-
-def neo4j():
-    neo4j_connection = Neo4jConnection("bolt://localhost:7687", "neo4j", "adminadmin")
-    neo4j_connection.connect()
-    neo4j_results = []
-    if neo4j_connection:
-        neo4j_connection.insert_data()
-        neo4j_results.append(neo4j_connection.complex_queries_test())
-        neo4j_connection.create_indexes()
-        neo4j_results.append(neo4j_connection.complex_queries_test())
-        print(neo4j_results)
-        neo4j_connection.close()
-
-
-def cassandra():
-    connector = CassandraConnector(["localhost"])
-    connector.connect()
-    connector.drop_keyspace('trade')
-    connector.create_keyspace("trade")
-    connector.execute("USE trade;")
-    connector.create_tables()
-    connector.insert_data()
-    print(connector.query())
-    # connector.create_indexes()
-    # print(connector.indexed_query())
-    # connector.disconnect()
+import argparse
+import copy
+import json
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
+import fake_data_inserter
+import instrumentation
+import reference_engine
+import result_store
+import sampling
+import scaling
+import scan_benchmark
+import text_search
+import workload
+import write_benchmark
+from backends import BACKENDS, INDEX_CONFIGS, make_backend
 
-if __name__ == "__main__":
-    # mysql()
-    # neo4j()
-    # mongo()
-    # redis()
-    cassandra()
+PHASES = ['generate', 'load', 'index', 'bench', 'write', 'text', 'variants', 'protocol', 'scan', 'table_options']
+
+# Anything here can be overridden by a JSON config file (--config) and then by command line flags
+DEFAULT_CONFIG = {
+    'backends': list(BACKENDS),
+    # The full-text workload (text), the query rewrite matrix (variants), the client protocol matrix (protocol),
+    # the single vs parallel full table scans (scan) and the table option matrix (table_options) only run when
+    # asked for
+    'phases': [phase for phase in PHASES if phase not in ('text', 'variants', 'protocol', 'scan', 'table_options')],
+    # Generated datasets are cached in data_dir/<fingerprint>/
+    'data_dir': 'datasets',
+    'scale': 1,
+    # Unseeded datasets cannot be fingerprinted, so they are regenerated and reloaded on every run
+    'seed': 42,
+    # Foreign key skew, basket sizes and status/created_at correlation, see fake_data_inserter.SKEWABLE_KEYS,
+    # e.g. {"products.merchant_id": {"kind": "zipf", "s": 1.2}, "order_items.basket": {"kind": "power_law"}}
+    'distributions': {},
+    # Cassandra also knows indexed_sai and indexed_mv, the same indexes as SAI and as materialized views
+    'index_configs': INDEX_CONFIGS,
+    # Fixed number of runs per query, or adaptive sampling until the median's CI is tight enough
+    'iterations': 10,
+    'adaptive': False,
+    'target_width': 0.05,
+    'time_budget': 30.0,
+    # Any of cache_control.CACHE_STATES; each state is measured and stored as a separate run
+    'cache_states': ['warm'],
+    # Split each query into server, client and network time. MongoDB profiling and Cassandra tracing
+    # slow the queries down, so turn this off for pure latency numbers.
+    'server_timing': True,
+    # Draw each query's parameter (continent, status, merchant id, user id, ...) per iteration from 'fixed', 'uniform'
+    # or 'zipf'. None runs the original fixed-literal queries. Latency is reported per drawn value and selectivity.
+    'param_distribution': None,
+    'zipf_s': 1.1,
+    # Values used by the 'fixed' distribution, e.g. {"q2": "Pending"}; defaults to the original literals
+    'fixed_params': {},
+    # Number of clients running the query set at the same time, each on its own connection
+    'concurrency': 1,
+    # Orders inserted, moved through their status transitions and deleted again by the write phase
+    'write_rows': 1000,
+    # Scaling mode: load scales[0], then grow it step by step (e.g. [1, 2, 4, 8, 16]) by appending deltas,
+    # benchmarking every index configuration at each size and fitting latency ~ rows^exponent per query
+    'scales': [],
+    'cliff_margin': scaling.CLIFF_MARGIN,
+    # Regenerate and reload even when the cached dataset / loaded fingerprint already matches
+    'force': False,
+    # Snapshot the freshly loaded state once and restore it before every later index configuration, so each
+    # configuration starts from the same on-disk state. Needs access to the servers' files, see README.
+    'snapshots': False,
+    # Check the rows each backend returned for the last drawn parameter against the NumPy reference engine.
+    # Only connectors that keep their results (last_results) can be checked; MySQL does.
+    'verify': False,
+    # partitioning: {"orders": "list"} (status), {"orders": "range"} (monthly created_at, compact schema only)
+    # and/or {"order_items": "hash"} (order_id, hash_partitions partitions); applied to both index configurations.
+    # use_pure picks the pure Python connector over the C extension; prepared, buffered and reuse_cursor change
+    # how the bench phase runs its queries (see MySQLConnection.PROTOCOL_MODES).
+    # pool_size runs every query iteration on a connection checked out of a pool shared by all clients (and copies
+    # the indexed tables in parallel); a concurrency above pool_size makes clients wait for connections.
+    # session_variables are set on every pooled connection, e.g. {"optimizer_search_depth": 0}
+    'mysql': {'host': 'localhost', 'user': 'root', 'password': 'admin', 'restart_command': None,
+              'partitioning': {}, 'hash_partitions': 8, 'pool_size': None, 'pool_health_check': True,
+              'session_variables': {}},
+    # The same server with the compact schema, in the trade_compact/new_trade_compact databases
+    'mysql_compact': {'host': 'localhost', 'user': 'root', 'password': 'admin', 'restart_command': None,
+                      'partitioning': {}, 'hash_partitions': 8, 'pool_size': None, 'pool_health_check': True,
+                      'session_variables': {}},
+    'mongodb': {'uri': 'mongodb://localhost:27017', 'database': 'trade', 'restart_command': None},
+    'redis': {'host': 'localhost', 'port': 6379, 'password': '', 'restart_command': None},
+    'neo4j': {'uri': 'bolt://localhost:7687', 'user': 'neo4j', 'password': 'adminadmin', 'import_dir': None,
+              'restart_command': None, 'stop_command': None, 'start_command': None},
+    # parallel_scans makes the queries' full table and ALLOW FILTERING reads token range scans, scan_splits ranges
+    # read side by side with pages of scan_fetch_size rows.
+    # table_options: {"*": {"compaction": "lcs", "compression": "zstd", "chunk_length_kb": 4}, "orders": {...}},
+    # see Cassandra.TABLE_OPTION_DEFAULTS; table_option_matrix lists the values the table_options phase combines.
+    # batched_joins fetches the joined users and products of q2/q4 in IN lists of up to in_batch_size distinct keys
+    # and runs the other join lookups join_concurrency at a time; false issues one query per joined row
+    'cassandra': {'contact_points': ['localhost'], 'port': 9042, 'keyspace': 'trade', 'restart_command': None,
+                  'parallel_scans': False, 'scan_splits': 16, 'scan_fetch_size': 5000, 'table_options': {},
+                  'table_option_matrix': None, 'batched_joins': True, 'in_batch_size': 100, 'join_concurrency': 16},
+    # In-process NumPy engine; order_items is scanned chunk_rows rows at a time
+    'reference': {'chunk_rows': reference_engine.CHUNK_ROWS, 'restart_command': None},
+}
+
+# Optional per-backend settings that are copied onto the connector as attributes of the same name
+CONNECTOR_OPTIONS = ['snapshot_dir', 'nodetool', 'data_directory', 'mongodump', 'mongorestore', 'neo4j_admin',
+                     'stop_command', 'start_command', 'prepared', 'buffered', 'reuse_cursor', 'pool_size',
+                     'pool_health_check', 'session_variables', 'parallel_scans', 'scan_splits', 'scan_fetch_size',
+                     'table_options', 'batched_joins', 'in_batch_size', 'join_concurrency']
+
+
+def load_config(path=None):
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            overrides = json.load(f)
+        for key, value in overrides.items():
+            if isinstance(value, dict) and isinstance(config.get(key), dict):
+                config[key].update(value)
+            else:
+                config[key] = value
+    return config
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate, load, index and benchmark the trade dataset")
+    parser.add_argument('--config', help="JSON file overriding DEFAULT_CONFIG")
+    parser.add_argument('--backends', help=f"comma separated, any of {','.join(BACKENDS)}")
+    parser.add_argument('--phases', help=f"comma separated, any of {','.join(PHASES)}")
+    parser.add_argument('--index-configs', help=f"comma separated, any of {','.join(INDEX_CONFIGS)}")
+    parser.add_argument('--cache-states', help="comma separated, any of cold,plan_cold,warm")
+    parser.add_argument('--data-dir')
+    parser.add_argument('--scales', help="comma separated dataset scales, runs the scaling mode")
+    parser.add_argument('--scale', type=float)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--iterations', type=int)
+    parser.add_argument('--adaptive', action='store_true', default=None)
+    parser.add_argument('--concurrency', type=int)
+    parser.add_argument('--param-distribution', choices=workload.DISTRIBUTIONS)
+    parser.add_argument('--write-rows', type=int)
+    parser.add_argument('--no-server-timing', dest='server_timing', action='store_false', default=None)
+    parser.add_argument('--force', action='store_true', default=None)
+    parser.add_argument('--snapshots', action='store_true', default=None)
+    parser.add_argument('--verify', action='store_true', default=None)
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    for key in ['backends', 'phases', 'index_configs', 'cache_states']:
+        value = getattr(args, key)
+        if value:
+            config[key] = value.split(',')
+    for key in ['data_dir', 'scale', 'seed', 'iterations', 'adaptive', 'concurrency', 'server_timing', 'force',
+                'snapshots', 'write_rows', 'param_distribution', 'verify']:
+        value = getattr(args, key)
+        if value is not None:
+            config[key] = value
+
+    if args.scales:
+        config['scales'] = [float(scale) for scale in args.scales.split(',')]
+    if isinstance(config['scale'], float) and config['scale'].is_integer():
+        config['scale'] = int(config['scale'])
+    config['scales'] = [int(scale) if float(scale).is_integer() else scale for scale in config['scales']]
+    for name in config['backends']:
+        if name not in BACKENDS:
+            parser.error(f"unknown backend {name}")
+    for phase in config['phases']:
+        if phase not in PHASES:
+            parser.error(f"unknown phase {phase}")
+    return config
+
+
+def make_sampler(config):
+    return sampling.Sampler(runs=config['iterations'], adaptive=config['adaptive'],
+                            target_width=config['target_width'], time_budget=config['time_budget'])
+
+
+def connect_backend(name, config):
+    settings = config[name]
+    backend = make_backend(name, settings)
+    if not backend.connect():
+        return None
+    connection = backend.connection
+    connection.sampler = make_sampler(config)
+    connection.server_timing = config['server_timing']
+    connection.restart_command = settings.get('restart_command')
+    for option in CONNECTOR_OPTIONS:
+        if settings.get(option) is not None:
+            setattr(connection, option, settings[option])
+    return backend
+
+
+def current_dataset(config):
+    return config.get('dataset') or fake_data_inserter.dataset_info(config['scale'], config['seed'],
+                                                                    config['distributions'])
+
+
+def save_results(name, connection, index_config, config, extra):
+    # Connectors with more than one physical layout of the same data (MySQL schema and partitioning) record it
+    if getattr(connection, 'layout', None):
+        extra = dict(extra, layout=connection.layout)
+    # Pool wait and checkout times of the queries just run, when they ran on pooled connections
+    pool = {label: stats for label, stats in getattr(connection, 'pool_stats', {}).items()
+            if label in connection.samples}
+    if pool:
+        extra = dict(extra, pool={'pool_size': connection.pool_size, 'queries': pool})
+    result_store.save_run(name, connection.server_version(),
+                          current_dataset(config), index_config, connection.samples,
+                          dict({'sampling': connection.sampler.settings(), 'cache_state': connection.cache_state,
+                                'wire': connection.wire_stats, 'time_breakdown': connection.breakdowns}, **extra))
+
+
+def make_param_streams(config, client=0):
+    if not config['param_distribution']:
+        return None
+    # Every client draws its own sequence; the same seed gives the same sequences run after run
+    seed = None if config['seed'] is None else config['seed'] + 100 * client
+    return workload.make_streams(config['selectivity'], config['param_distribution'], config['fixed_params'],
+                                 config['zipf_s'], seed)
+
+
+def run_benchmark(name, backend, index_config, config, client=0):
+    connection = backend.connection
+    results = {}
+    samples = {}
+    for state in config['cache_states']:
+        connection.cache_state = state
+        streams = make_param_streams(config, client)
+        results[state] = backend.run_queries(index_config, streams)
+        print(f"{name} ({index_config}, {state}, client {client}): {results[state]}")
+        instrumentation.print_wire_stats(connection.samples, connection.wire_stats)
+        instrumentation.print_time_breakdown(connection.breakdowns)
+        if getattr(connection, 'pool_stats', None):
+            instrumentation.print_pool_stats(connection.samples, connection.pool_stats)
+        extra = {'client': client, 'concurrency': config['concurrency'], 'index_build': backend.index_build}
+        if streams:
+            report = workload.selectivity_report(connection.samples, streams)
+            workload.print_selectivity_report(report)
+            extra.update({'param_distribution': config['param_distribution'],
+                          'params': {query: stream.drawn for query, stream in streams.items()},
+                          'selectivity': report})
+        if config['verify'] and getattr(connection, 'last_results', None):
+            verification = reference_engine.verify_results(reference_engine.oracle(config['dataset_path']),
+                                                           connection.last_results, streams)
+            reference_engine.print_verification(verification)
+            extra['verification'] = verification
+        storage = backend.storage_stats(index_config)
+        if storage:
+            print_storage_stats(storage)
+            extra['storage'] = storage
+        save_results(name, connection, index_config, config, extra)
+        samples[state] = connection.samples
+    return results, samples
+
+
+def run_clients(name, backend, index_config, config):
+    # Extra clients get their own connection; client 0 reuses the one the index phase ran on
+    backends = [backend]
+    for i in range(1, config['concurrency']):
+        extra = connect_backend(name, config)
+        if extra is not None:
+            backends.append(extra)
+    if len(backends) == 1:
+        return run_benchmark(name, backend, index_config, config)
+
+    with ThreadPoolExecutor(max_workers=len(backends)) as pool:
+        futures = [pool.submit(run_benchmark, name, client_backend, index_config, config, client)
+                   for client, client_backend in enumerate(backends)]
+        outcomes = [future.result() for future in futures]
+    for extra in backends[1:]:
+        extra.close()
+    return outcomes[0]
+
+
+def run_writes(name, backend, index_config, config):
+    dataset = current_dataset(config)
+    orders = write_benchmark.make_orders(config['write_rows'], dataset['rows']['users'], config['seed'])
+    stats = write_benchmark.run_write_workload(backend, index_config, orders)
+    print(f"{name} ({index_config}) writes:")
+    write_benchmark.print_write_stats(stats)
+    instrumentation.print_wire_stats(backend.connection.samples, backend.connection.wire_stats)
+    save_results(name, backend.connection, index_config, config, {'workload': 'write', 'write_stats': stats,
+                                                                    'index_build': backend.index_build})
+    return stats
+
+
+def run_text(name, backend, config):
+    # Runs once per backend, on whatever index configuration the bench loop left behind, in the first cache state
+    backend.connection.cache_state = config['cache_states'][0]
+    stats = text_search.run_text_workload(backend, config['text_cases'])
+    print(f"{name} full-text search:")
+    text_search.print_text_results(stats)
+    save_results(name, backend.connection, config['index_configs'][-1], config, {'workload': 'text', 'text': stats})
+    return stats
+
+
+def run_scan(name, backend, config):
+    # Runs once per backend in the first cache state; full table reads do not depend on the index configuration
+    backend.connection.cache_state = config['cache_states'][0]
+    stats = scan_benchmark.run_scan_workload(backend)
+    print(f"{name} full table scans:")
+    scan_benchmark.print_scan_results(stats)
+    instrumentation.print_wire_stats(backend.connection.samples, backend.connection.wire_stats)
+    save_results(name, backend.connection, config['index_configs'][-1], config, {'workload': 'scan', 'scan': stats})
+    return stats
+
+
+def run_variants(name, backend, index_config, config):
+    # Every formulation of every query in each cache state, with its plan. Each formulation gets fresh parameter
+    # streams, so all formulations of a query see the same sequence of drawn values.
+    connection = backend.connection
+    samples = {}
+    for state in config['cache_states']:
+        connection.cache_state = state
+        connection.samples = {}
+        connection.wire_stats = {}
+        connection.breakdowns = {}
+        connection.last_results = {}
+        plans = {}
+        verification = {}
+        for query, variants in backend.query_variants.items():
+            for variant in variants:
+                label = f"{query}/{variant}"
+                streams = make_param_streams(config)
+                plans[label] = backend.run_query_variant(index_config, query, variant, streams)
+                if config['verify']:
+                    verification.update(reference_engine.verify_results(
+                        reference_engine.oracle(config['dataset_path']),
+                        {label: connection.last_results[label]}, streams))
+        print(f"{name} ({index_config}, {state}) query variants:")
+        print_variant_results(backend.query_variants, connection.samples)
+        instrumentation.print_wire_stats(connection.samples, connection.wire_stats)
+        extra = {'workload': 'variants', 'plans': plans, 'index_build': backend.index_build}
+        if verification:
+            reference_engine.print_verification(verification)
+            extra['verification'] = verification
+        save_results(name, connection, index_config, config, extra)
+        samples[state] = connection.samples
+    return samples
+
+
+def print_variant_results(query_variants, samples):
+    # Median of every formulation and its speedup over the first one, the formulation q1-q4 normally run
+    print(f"{'query':<8}{'variant':<18}{'median s':>12}{'speedup':>9}")
+    for query, variants in query_variants.items():
+        base = samples.get(f"{query}/{next(iter(variants))}")
+        for variant in variants:
+            times = samples.get(f"{query}/{variant}")
+            if not times:
+                continue
+            median = statistics.median(times)
+            speedup = statistics.median(base) / median if base and median else float('inf')
+            print(f"{query:<8}{variant:<18}{median:>12.6f}{speedup:>8.2f}x")
+
+
+def print_variant_matrix(config, variants_by_index):
+    # Median per formulation (rows) and index configuration (columns) in the first cache state,
+    # to set what a rewrite gains next to what an index gains
+    state = config['cache_states'][0]
+    index_configs = list(variants_by_index)
+    print(f"{'query/variant':<26}" + ''.join(f"{index_config:>14}" for index_config in index_configs))
+    for label in variants_by_index[index_configs[0]][state]:
+        row = ''.join(f"{statistics.median(samples[state][label]):>14.6f}" if samples[state].get(label)
+                      else f"{'n/a':>14}" for samples in variants_by_index.values())
+        print(f"{label:<26}{row}")
 
+
+def protocol_label(protocol):
+    return (f"{'pure' if protocol['use_pure'] else 'cext'}/{protocol['statement']}/"
+            f"{'buffered' if protocol['buffered'] else 'unbuffered'}")
+
+
+def run_protocol(name, backend, index_config, config):
+    # q1-q8 under every client protocol mode. The index configuration is the same throughout, so the spread
+    # between the modes is protocol and client-side parsing cost. Always warm: a cold run restarts the server,
+    # which would drop the prepared statements and reused cursors between iterations.
+    connection = backend.connection
+    connection.cache_state = 'warm'
+    medians = {}
+    try:
+        for mode in backend.protocol_modes:
+            protocol = backend.set_protocol(mode)
+            label = protocol_label(protocol)
+            try:
+                backend.run_queries(index_config, make_param_streams(config))
+            except ValueError as e:
+                # e.g. a connector without buffered prepared cursors
+                print(f"{name} ({index_config}) {label}: skipped, {e}")
+                continue
+            save_results(name, connection, index_config, config, {'workload': 'protocol', 'protocol': protocol,
+                                                                  'index_build': backend.index_build})
+            medians[label] = {query: (statistics.median(times), connection.breakdowns[query]['client'])
+                              for query, times in connection.samples.items()}
+    finally:
+        backend.set_protocol({})
+    print(f"{name} ({index_config}) client protocol modes, median s / client CPU s:")
+    print_protocol_matrix(medians)
+    return medians
+
+
+def print_protocol_matrix(medians):
+    if not medians:
+        return
+    queries = list(next(iter(medians.values())))
+    print(f"{'mode':<28}" + ''.join(f"{query:>20}" for query in queries))
+    for label, row in medians.items():
+        print(f"{label:<28}" + ''.join(f"{row[query][0]:>11.6f}/{row[query][1]:<8.6f}" if query in row
+                                      else f"{'n/a':>20}" for query in queries))
+
+
+def run_table_options(name, backend, index_config, config):
+    # Every table option combination: altered, flushed and compacted, sized, then q1-q8 in the first cache state and
+    # the write workload. The writes come last; the next combination's compaction folds them back in.
+    connection = backend.connection
+    connection.cache_state = config['cache_states'][0]
+    dataset = current_dataset(config)
+    orders = write_benchmark.make_orders(config['write_rows'], dataset['rows']['users'], config['seed'])
+    rows = {}
+    try:
+        for options in backend.table_option_sets():
+            label = '/'.join(str(value) for value in options.values())
+            try:
+                info = backend.set_table_options(options)
+            except ValueError as e:
+                print(f"{name} ({index_config}) {label}: skipped, {e}")
+                continue
+            backend.run_queries(index_config, make_param_streams(config))
+            save_results(name, connection, index_config, config, {'workload': 'table_options', 'table_options': info,
+                                                                  'index_build': backend.index_build})
+            medians = {query: statistics.median(times) for query, times in connection.samples.items()}
+            writes = write_benchmark.run_write_workload(backend, index_config, orders)
+            save_results(name, connection, index_config, config, {'workload': 'write', 'table_options': info,
+                                                                  'write_stats': writes,
+                                                                  'index_build': backend.index_build})
+            rows[label] = {'info': info, 'medians': medians, 'writes': writes}
+    finally:
+        backend.set_table_options({})
+    print(f"{name} ({index_config}) table options, median s per query and write ops/s:")
+    print_table_option_matrix(rows)
+    return rows
+
+
+def print_table_option_matrix(rows):
+    if not rows:
+        return
+    first = next(iter(rows.values()))
+    queries, ops = list(first['medians']), list(first['writes'])
+    print(f"{'options':<20}{'bytes':>14}{'sstables':>10}{'compact s':>11}"
+          + ''.join(f"{query:>11}" for query in queries) + ''.join(f"{op + ' /s':>13}" for op in ops))
+    for label, row in rows.items():
+        sizes = row['info']['sizes'].values()
+        print(f"{label:<20}{sum(size['bytes'] for size in sizes):>14}{sum(size['sstables'] for size in sizes):>10}"
+              f"{row['info']['compaction_seconds']:>11.2f}"
+              + ''.join(f"{row['medians'][query]:>11.6f}" for query in queries)
+              + ''.join(f"{row['writes'][op]['throughput']:>13.1f}" for op in ops))
+
+
+def print_storage_stats(storage):
+    print(f"{'table':<14}{'data bytes':>14}{'index bytes':>14}{'buffer pool':>14}")
+    for table, row in sorted(storage.items()):
+        print(f"{table:<14}{row['data_bytes']:>14}{row['index_bytes']:>14}{row['buffer_pool_bytes']:>14}")
+
+
+def print_index_builds(builds_by_index):
+    print(f"{'index config':<14}{'build s':>10}{'indexes':>9}{'index bytes':>14}")
+    for index_config, build in builds_by_index.items():
+        print(f"{index_config:<14}{build['seconds']:>10.3f}{len(build['sizes']):>9}{sum(build['sizes'].values()):>14}")
+        for index, size in sorted(build['sizes'].items()):
+            print(f"  {index:<48}{size:>14}")
+
+
+def print_index_comparison(config, samples_by_index):
+    baseline_config = config['index_configs'][0]
+    if baseline_config not in samples_by_index:
+        return
+    for index_config, samples in samples_by_index.items():
+        if index_config == baseline_config:
+            continue
+        for state in config['cache_states']:
+            print(f"{baseline_config} -> {index_config}, cache state: {state}")
+            sampling.print_comparison(samples_by_index[baseline_config][state], samples[state])
+
+
+def generate_phase(config):
+    path = None if config['force'] else fake_data_inserter.find_dataset(config['data_dir'], config['scale'],
+                                                                         config['seed'], config['distributions'])
+    if path:
+        print(f"Dataset cached in {path}, skipping generate")
+    else:
+        path = fake_data_inserter.write_dataset(config['data_dir'], config['scale'], config['seed'],
+                                                config['distributions'])
+    config['dataset_path'] = path
+    config['dataset'] = fake_data_inserter.read_dataset_info(path)
+
+
+def find_dataset(config):
+    path = fake_data_inserter.find_dataset(config['data_dir'], config['scale'], config['seed'],
+                                           config['distributions'])
+    if path is None:
+        raise SystemExit(f"No cached dataset for scale {config['scale']} and seed {config['seed']} "
+                         f"in {config['data_dir']}, run the generate phase first")
+    config['dataset_path'] = path
+    config['dataset'] = fake_data_inserter.read_dataset_info(path)
+
+
+def load_backend(name, config):
+    # Runs in a worker process, so it opens its own connection, with the same connector options as the other phases
+    backend = connect_backend(name, config)
+    if backend is None:
+        return name, 'connection failed'
+    try:
+        fingerprint = config['dataset']['fingerprint']
+        start = time.perf_counter()
+        if backend.load_dataset(config['dataset_path'], fingerprint, config['force']):
+            return name, f"loaded dataset {fingerprint} in {time.perf_counter() - start:.2f}s"
+        return name, f"already holds dataset {fingerprint}, skipped"
+    finally:
+        backend.close()
+
+
+def load_phase(config):
+    backends = [name for name in config['backends'] if not BACKENDS[name].in_process]
+    if not backends:
+        return
+    with ProcessPoolExecutor(max_workers=len(backends)) as pool:
+        for name, status in pool.map(load_backend, backends, [config] * len(backends)):
+            print(f"{name}: {status}")
+
+
+def backend_index_configs(name, backend, config):
+    # Engine-specific configurations, e.g. Cassandra's indexed_sai and indexed_mv, are skipped by the other backends
+    skipped = [index_config for index_config in config['index_configs'] if index_config not in backend.index_configs]
+    if skipped:
+        print(f"{name}: no index configuration {', '.join(skipped)}, skipping it")
+    return [index_config for index_config in config['index_configs'] if index_config in backend.index_configs]
+
+
+def bench_backend(name, config):
+    backend = connect_backend(name, config)
+    if backend is None:
+        print(f"{name}: connection failed, skipping")
+        return
+    samples_by_index = {}
+    writes_by_index = {}
+    variants_by_index = {}
+    builds_by_index = {}
+    snapshot = None
+    if config['snapshots']:
+        fingerprint = config['dataset']['fingerprint'] if config.get('dataset') else backend.get_fingerprint()
+        snapshot = f"loaded-{fingerprint}"
+    try:
+        if backend.in_process:
+            # Its tables live in this process, so they are loaded here instead of by the load phase
+            if 'dataset_path' not in config:
+                find_dataset(config)
+            backend.load_dataset(config['dataset_path'], config['dataset']['fingerprint'])
+        for position, index_config in enumerate(backend_index_configs(name, backend, config)):
+            if snapshot and position == 0 and (config['force'] or not backend.has_snapshot(snapshot)):
+                backend.snapshot(snapshot)
+            elif snapshot and position > 0:
+                start = time.perf_counter()
+                backend.restore(snapshot)
+                print(f"{name}: restored {snapshot} in {time.perf_counter() - start:.2f}s")
+            if 'index' in config['phases']:
+                backend.apply_index_config(index_config)
+                builds_by_index[index_config] = backend.index_build
+            if 'bench' in config['phases']:
+                results, samples_by_index[index_config] = run_clients(name, backend, index_config, config)
+            if 'write' in config['phases'] and backend.writable:
+                writes_by_index[index_config] = run_writes(name, backend, index_config, config)
+            if 'variants' in config['phases'] and backend.query_variants:
+                variants_by_index[index_config] = run_variants(name, backend, index_config, config)
+            if 'protocol' in config['phases'] and backend.protocol_modes:
+                run_protocol(name, backend, index_config, config)
+            if 'table_options' in config['phases'] and backend.table_option_sets():
+                run_table_options(name, backend, index_config, config)
+        if 'text' in config['phases'] and backend.full_text:
+            run_text(name, backend, config)
+        if 'scan' in config['phases'] and backend.parallel_scan:
+            run_scan(name, backend, config)
+        # Build cost, read gain and write cost of every index configuration, the latter two against the first one
+        if builds_by_index:
+            print_index_builds(builds_by_index)
+        if len(samples_by_index) > 1:
+            print_index_comparison(config, samples_by_index)
+        if len(writes_by_index) > 1:
+            write_benchmark.print_write_comparison(config['index_configs'][0], writes_by_index)
+        if variants_by_index:
+            print_variant_matrix(config, variants_by_index)
+    finally:
+        backend.close()
+
+
+def scaling_backend(name, config):
+    scales = config['scales']
+    base_path = fake_data_inserter.find_dataset(config['data_dir'], scales[0], config['seed'], config['distributions'])
+    if base_path is None or config['force']:
+        base_path = fake_data_inserter.write_dataset(config['data_dir'], scales[0], config['seed'],
+                                                     config['distributions'])
+    base = fake_data_inserter.read_dataset_info(base_path)
+
+    backend = connect_backend(name, config)
+    if backend is None:
+        print(f"{name}: connection failed, skipping")
+        return
+    # Parameter draws are computed for one dataset size only, so scaling runs the default literals.
+    # The oracle is loaded from a dataset directory, which the grown database no longer matches.
+    step_config = dict(config, param_distribution=None, verify=False)
+    rows = dict(base['rows'])
+    fingerprint = base['fingerprint']
+    points = {}
+    try:
+        backend.load_dataset(base_path, fingerprint, config['force'])
+        for step, scale in enumerate(scales):
+            if step > 0:
+                delta_path = fake_data_inserter.write_delta(base_path, scales[step - 1], scale, config['seed'],
+                                                            config['distributions'])
+                start = time.perf_counter()
+                backend.append(delta_path)
+                print(f"{name}: appended delta {scales[step - 1]} -> {scale} in {time.perf_counter() - start:.2f}s")
+                delta = fake_data_inserter.read_dataset_info(delta_path)
+                rows = {table: rows[table] + delta['rows'][table] for table in rows}
+                # Marks the database as no longer holding the plain base dataset
+                fingerprint = f"{base['fingerprint']}-x{scale}"
+                backend.set_fingerprint(fingerprint)
+            total_rows = sum(rows.values())
+            step_config['dataset'] = dict(base, scale=scale, fingerprint=fingerprint, rows=rows)
+            for index_config in backend_index_configs(name, backend, config):
+                backend.apply_index_config(index_config)
+                results, samples = run_benchmark(name, backend, index_config, step_config)
+                for state, state_samples in samples.items():
+                    label = index_config if len(samples) == 1 else f"{index_config}/{state}"
+                    for query, times in state_samples.items():
+                        points.setdefault((label, query), []).append((total_rows, statistics.median(times)))
+        scaling.print_analysis(name, scaling.analyse(points, config['cliff_margin']))
+    finally:
+        backend.close()
+
+
+def main(argv=None):
+    config = parse_args(argv)
+    if config['scales']:
+        for name in config['backends']:
+            scaling_backend(name, config)
+        return
+    if 'generate' in config['phases']:
+        generate_phase(config)
+    if 'load' in config['phases']:
+        if 'dataset_path' not in config:
+            find_dataset(config)
+        load_phase(config)
+    if config['param_distribution'] and {'bench', 'variants', 'protocol', 'table_options'} & set(config['phases']):
+        # Selectivity of every parameter value comes from the generated dataset, not from the backends
+        if 'dataset_path' not in config:
+            find_dataset(config)
+        config['selectivity'] = workload.param_selectivity(
+            workload.as_int_tables(fake_data_inserter.read_csv(config['dataset_path'])))
+    if config['verify'] and {'bench', 'variants'} & set(config['phases']) and 'dataset_path' not in config:
+        find_dataset(config)
+    if 'text' in config['phases']:
+        # Search terms are picked by how many rows of the generated dataset contain them
+        if 'dataset_path' not in config:
+            find_dataset(config)
+        config['text_cases'] = text_search.pick_cases(fake_data_inserter.read_csv(config['dataset_path']))
+    # Index builds and measurements run one backend at a time so they do not compete for the machine
+    if {'index', 'bench', 'write', 'text', 'variants', 'protocol', 'scan', 'table_options'} & set(config['phases']):
+        for name in config['backends']:
+            bench_backend(name, config)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,42 @@
+import os
+import subprocess
 import time
+from datetime import datetime
 
 import pandas as pd
 import pymongo
 
+from cache_control import check_state, drop_os_page_cache, restart_server, warn_once
+from instrumentation import WireStats, mongo_listener, time_breakdown
+from sampling import Sampler
+from text_search import index_query, scan_pattern
+from workload import PAGE_SIZE, PRICE_BAND, bind
+
 
 class MongoDBConnection:
     def __init__(self, connection_string):
         self.connection_string = connection_string
         self.client = None
+        self.samples = {}
+        self.sampler = Sampler()
+        self.wire = WireStats()
+        self.wire_stats = {}
+        # Run with profiling level 2 and sum the profiler's millis per iteration (adds profiler overhead)
+        self.server_timing = False
+        self.server_times = []
+        self.breakdowns = {}
+        self._profile_mark = None
+        self.snapshot_dir = os.path.join('snapshots', 'mongodb')
+        self.mongodump = ['mongodump']
+        self.mongorestore = ['mongorestore']
+        self.cache_state = 'warm'
+        # e.g. ['sudo', 'systemctl', 'restart', 'mongod']; without it cold runs shrink the WiredTiger cache
+        self.restart_command = None
+        self.current_db = None
 
     def connect(self):
         try:
-            self.client = pymongo.MongoClient(self.connection_string)
+            self.client = pymongo.MongoClient(self.connection_string, event_listeners=[mongo_listener(self.wire)])
             print("Connected to MongoDB successfully!")
             return self.client
         except Exception as e:
@@ -23,19 +48,77 @@ class MongoDBConnection:
             self.client.close()
             print("Connection to MongoDB closed.")
 
+    def server_version(self):
+        return self.client.server_info()['version']
+
+    def evict_wiredtiger_cache(self, timeout=10):
+        # Shrinking the cache makes WiredTiger evict almost everything; the old size is restored afterwards
+        cache = self.client.admin.command('serverStatus')['wiredTiger']['cache']
+        cache_bytes = int(cache['maximum bytes configured'])
+        self.client.admin.command('setParameter', 1, wiredTigerEngineRuntimeConfig='cache_size=1M')
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            cache = self.client.admin.command('serverStatus')['wiredTiger']['cache']
+            if cache['bytes currently in the cache'] <= 2 * 1024 * 1024:
+                break
+            time.sleep(0.1)
+        self.client.admin.command('setParameter', 1, wiredTigerEngineRuntimeConfig=f'cache_size={cache_bytes}')
+
+    def reset_cache(self, state):
+        check_state(state)
+        if state == 'warm':
+            return
+        if state == 'cold':
+            if self.restart_command:
+                restart_server(self.restart_command, lambda: self.client.admin.command('ping'))
+            else:
+                self.evict_wiredtiger_cache()
+            drop_os_page_cache()
+
+        db = self.client[self.current_db]
+        for collection_name in db.list_collection_names():
+            db.command('planCacheClear', collection_name)
+
+    def prepare_cache(self):
+        with self.wire.pause():
+            self.reset_cache(self.cache_state)
+
+    def before_iteration(self):
+        self.prepare_cache()
+        if not self.server_timing:
+            return
+        with self.wire.pause():
+            last = self.client[self.current_db].system.profile.find_one(sort=[('ts', pymongo.DESCENDING)])
+        self._profile_mark = last['ts'] if last else datetime.min
+
+    def record_server_time(self):
+        if not self.server_timing:
+            return
+        db = self.client[self.current_db]
+        with self.wire.pause():
+            entries = db.system.profile.find({
+                'ts': {'$gt': self._profile_mark},
+                'ns': {'$ne': f'{self.current_db}.system.profile'},
+                'command.planCacheClear': {'$exists': False},
+            }, {'millis': 1})
+            self.server_times.append(sum(entry.get('millis', 0) for entry in entries) / 1000)
+
     def insert_data(self, collection_name, dataframe, db):
         collection_data = dataframe.to_dict(orient='records')
-        db[collection_name].insert_many(collection_data)
+        if collection_data:
+            db[collection_name].insert_many(collection_data)
 
-    def insert_from_file(self, db_name):
-        self.client.drop_database(db_name)
+    def insert_from_file(self, db_name, data_dir='.', append=False):
+        # append adds the files to the existing data, e.g. the delta between two dataset sizes
+        if not append:
+            self.client.drop_database(db_name)
         db = self.client[db_name]
-        countries_df = pd.read_csv('countries.csv')
-        users_df = pd.read_csv('users.csv')
-        merchants_df = pd.read_csv('merchants.csv')
-        orders_df = pd.read_csv('orders.csv')
-        products_df = pd.read_csv('products.csv')
-        order_items_df = pd.read_csv('order_items.csv')
+        countries_df = pd.read_csv(os.path.join(data_dir, 'countries.csv'))
+        users_df = pd.read_csv(os.path.join(data_dir, 'users.csv'))
+        merchants_df = pd.read_csv(os.path.join(data_dir, 'merchants.csv'))
+        orders_df = pd.read_csv(os.path.join(data_dir, 'orders.csv'))
+        products_df = pd.read_csv(os.path.join(data_dir, 'products.csv'))
+        order_items_df = pd.read_csv(os.path.join(data_dir, 'order_items.csv'))
 
         self.insert_data('countries', countries_df, db)
         self.insert_data('users', users_df, db)
@@ -64,28 +147,33 @@ class MongoDBConnection:
 
         db['order_items'].drop()
 
-    def complex_queries(self, db_name):
+    def get_fingerprint(self, db_name):
+        meta = self.client[db_name]['_dataset_meta'].find_one({'_id': 'fingerprint'})
+        return meta['value'] if meta else None
+
+    def set_fingerprint(self, db_name, fingerprint):
+        self.client[db_name]['_dataset_meta'].replace_one({'_id': 'fingerprint'}, {'value': fingerprint}, upsert=True)
+
+    def drop_indexes(self, db_name):
         db = self.client[db_name]
+        for collection_name in db.list_collection_names():
+            if not collection_name.startswith('system.'):
+                db[collection_name].drop_indexes()
 
-        query_exe_time = []
+    def complex_queries(self, db_name, params=None):
+        # params maps query names to workload.ParameterStreams; without them the default literals are used
+        db = self.client[db_name]
+        self.current_db = db_name
 
-        q1_exe = []
-        for x in range(10):
-            start_time_q1 = time.time()
-            result_q1 = db.users.find(
+        def q1(continent):
+            result_q1 = list(db.users.find(
                 {'country_code': {
-                    '$in': db.countries.find({'continent_name': 'North America'}).distinct('country_code')}}
-            )
-            end_time_q1 = time.time()
-            execution_time_q1 = end_time_q1 - start_time_q1
-            q1_exe.append(execution_time_q1)
-        query_exe_time.append(sum(q1_exe) / 10)
-
-        q2_exe = []
-        for x in range(10):
-            start_time_q2 = time.time()
-            result_q2 = db.orders.aggregate([
-                {'$match': {'status': 'Shipped'}},
+                    '$in': db.countries.find({'continent_name': continent}).distinct('country_code')}}
+            ))
+
+        def q2(status):
+            result_q2 = list(db.orders.aggregate([
+                {'$match': {'status': status}},
                 {'$lookup': {
                     'from': 'users',
                     'localField': 'user_id',
@@ -111,16 +199,11 @@ class MongoDBConnection:
                     'status': 1,
                     'created_at': 1
                 }}
-            ])
-            end_time_q2 = time.time()
-            execution_time_q2 = end_time_q2 - start_time_q2
-            q2_exe.append(execution_time_q2)
-        query_exe_time.append(sum(q2_exe) / 10)
-
-        q3_exe = []
-        for x in range(10):
-            start_time_q3 = time.time()
-            result_q3 = db.merchants.aggregate([
+            ]))
+
+        def q3(merchant_id):
+            result_q3 = list(db.merchants.aggregate(([{'$match': {'merchant_id': merchant_id}}]
+                                                     if merchant_id is not None else []) + [
                 {'$lookup': {
                     'from': 'products',
                     'localField': 'merchant_id',
@@ -139,16 +222,10 @@ class MongoDBConnection:
                     '_id': {'merchant_id': '$merchant_id', 'merchant_name': '$merchant_name'},
                     'total_revenue': {'$sum': {'$multiply': ['$products.price', '$order.products_info.quantity']}}
                 }}
-            ])
-            end_time_q3 = time.time()
-            execution_time_q3 = end_time_q3 - start_time_q3
-            q3_exe.append(execution_time_q3)
-        query_exe_time.append(sum(q3_exe) / 10)
-
-        q4_exe = []
-        for x in range(10):
-            start_time_q4 = time.time()
-            result_q4 = db.users.aggregate([
+            ]))
+
+        def q4(user_id):
+            result_q4 = list(db.users.aggregate(([{'$match': {'user_id': user_id}}] if user_id is not None else []) + [
                 {'$lookup': {
                     'from': 'orders',
                     'localField': 'user_id',
@@ -169,18 +246,146 @@ class MongoDBConnection:
                     '_id': {'user_id': '$user_id', 'full_name': '$full_name'},
                     'avg_order_value': {'$avg': {'$multiply': ['$product.price', '$orders.products_info.quantity']}}
                 }}
-            ])
-            end_time_q4 = time.time()
-            execution_time_q4 = end_time_q4 - start_time_q4
-            q4_exe.append(execution_time_q4)
-        query_exe_time.append(sum(q4_exe) / 10)
-
-    # print(f"Query 1 Execution Time: {execution_time_q1:.8f} seconds\n")
-    # print(f"Query 2 Execution Time: {execution_time_q2:.8f} seconds\n")
-    # print(f"Query 3 Execution Time: {execution_time_q3:.8f} seconds\n")
-    # print(f"Query 4 Execution Time: {execution_time_q4:.8f} seconds\n")
+            ]))
+
+        def q5(min_price):
+            result_q5 = list(db.products.find({'price': {'$gte': min_price, '$lt': min_price + PRICE_BAND}},
+                                              {'_id': 0, 'product_id': 1, 'name': 1, 'price': 1}))
+
+        def q6(since):
+            result_q6 = list(db.orders.find({'created_at': {'$gte': since}} if since is not None else {},
+                                            {'_id': 0, 'order_id': 1, 'user_id': 1, 'status': 1, 'created_at': 1}))
+
+        def q7(limit):
+            result_q7 = list(db.orders.aggregate([
+                {'$unwind': '$products_info'},
+                {'$lookup': {
+                    'from': 'products',
+                    'localField': 'products_info.product_id',
+                    'foreignField': 'product_id',
+                    'as': 'product'
+                }},
+                {'$unwind': '$product'},
+                {'$group': {
+                    '_id': '$product.merchant_id',
+                    'total_revenue': {'$sum': {'$multiply': ['$product.price', '$products_info.quantity']}}
+                }},
+                {'$sort': {'total_revenue': -1}},
+                {'$limit': limit},
+                {'$lookup': {
+                    'from': 'merchants',
+                    'localField': '_id',
+                    'foreignField': 'merchant_id',
+                    'as': 'merchant'
+                }},
+                {'$unwind': '$merchant'},
+                {'$project': {'merchant_id': '$_id', 'merchant_name': '$merchant.merchant_name', 'total_revenue': 1}}
+            ]))
+
+        def q8(after):
+            # Keyset pagination on (created_at, order_id); the $or is one range per branch on the compound index
+            query = {}
+            if after is not None:
+                after_created_at, after_order_id = after
+                query = {'$or': [{'created_at': {'$gt': after_created_at}},
+                                 {'created_at': after_created_at, 'order_id': {'$gt': after_order_id}}]}
+            result_q8 = list(db.orders.find(query, {'_id': 0, 'order_id': 1, 'user_id': 1, 'status': 1,
+                                                    'created_at': 1})
+                             .sort([('created_at', pymongo.ASCENDING), ('order_id', pymongo.ASCENDING)])
+                             .limit(PAGE_SIZE))
+
+        query_exe_time = []
+        self.samples = {}
+        self.wire_stats = {}
+        self.breakdowns = {}
+        if self.server_timing:
+            db.command('profile', 2)
+        for name, query in [('q1', q1), ('q2', q2), ('q3', q3), ('q4', q4),
+                            ('q5', q5), ('q6', q6), ('q7', q7), ('q8', q8)]:
+            self.wire.reset()
+            self.server_times = []
+            exe_time = self.sampler.collect(bind(query, name, params), self.before_iteration,
+                                            self.record_server_time)
+            self.samples[name] = exe_time
+            self.wire_stats[name] = self.wire.per_iteration(len(exe_time))
+            self.breakdowns[name] = time_breakdown(exe_time, self.sampler.cpu_samples, self.server_times)
+            query_exe_time.append(sum(exe_time) / len(exe_time))
+        if self.server_timing:
+            db.command('profile', 0)
         return query_exe_time
 
+    def wait_for_index_builds(self, db_name, timeout=600):
+        # create_index returns once the build is committed on recent servers, but a build started
+        # elsewhere (or on an older server in the background) is still visible in $currentOp
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            builds = list(self.client.admin.aggregate([
+                {'$currentOp': {'allUsers': True}},
+                {'$match': {'command.createIndexes': {'$exists': True}, 'command.$db': db_name}}]))
+            if not builds:
+                return True
+            time.sleep(0.5)
+        warn_once(f"index builds on {db_name} still running after {timeout}s")
+        return False
+
+    def index_sizes(self, db_name):
+        db = self.client[db_name]
+        sizes = {}
+        for collection_name in db.list_collection_names():
+            if collection_name.startswith('system.'):
+                continue
+            for index_name, size in db.command('collStats', collection_name)['indexSizes'].items():
+                sizes[f"{collection_name}.{index_name}"] = size
+        return sizes
+
+    def create_text_indexes(self, db_name, columns):
+        # A collection has at most one text index; language 'none' turns off stemming and stop words
+        db = self.client[db_name]
+        for collection_name, field in columns:
+            db[collection_name].create_index([(field, pymongo.TEXT)], name=f"{field}_text", default_language='none')
+
+    def drop_text_indexes(self, db_name, columns):
+        db = self.client[db_name]
+        for collection_name, field in columns:
+            db[collection_name].drop_index(f"{field}_text")
+
+    def text_search(self, db_name, collection_name, field, kind, value, use_index=True):
+        # $text has no prefix form, so prefixes only run as the $regex scan
+        if use_index:
+            query = {'$text': {'$search': index_query(kind, value)}}
+        else:
+            query = {field: {'$regex': scan_pattern(kind, value), '$options': 'i'}}
+        return list(self.client[db_name][collection_name].find(query))
+
+    def insert_order(self, db_name, order):
+        self.client[db_name].orders.insert_one(dict(zip(['order_id', 'user_id', 'status', 'created_at'], order)))
+
+    def update_order_status(self, db_name, order_id, status):
+        self.client[db_name].orders.update_one({'order_id': order_id}, {'$set': {'status': status}})
+
+    def delete_order(self, db_name, order_id):
+        self.client[db_name].orders.delete_one({'order_id': order_id})
+
+    def snapshot_path(self, name):
+        return os.path.join(self.snapshot_dir, f"{name}.archive")
+
+    def has_snapshot(self, name):
+        return os.path.exists(self.snapshot_path(name))
+
+    def snapshot(self, name, db_name):
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        # Dump to a temporary name first so a failed dump never looks like a usable snapshot
+        partial = self.snapshot_path(name) + '.partial'
+        subprocess.run(self.mongodump + [f'--uri={self.connection_string}', f'--db={db_name}',
+                                         f'--archive={partial}'], check=True)
+        os.replace(partial, self.snapshot_path(name))
+        print(f"MongoDB snapshot {name} written to {self.snapshot_path(name)}")
+
+    def restore(self, name, db_name):
+        subprocess.run(self.mongorestore + [f'--uri={self.connection_string}', f'--archive={self.snapshot_path(name)}',
+                                            f'--nsInclude={db_name}.*', '--drop'], check=True)
+        print(f"MongoDB snapshot {name} restored into {db_name}")
+
     def create_index(self, db_name):
         db = self.client[db_name]
         db.countries.create_index([('continent_name', 1), ('country_code', 1)])
@@ -189,4 +394,7 @@ class MongoDBConnection:
         db.users.create_index('user_id', unique=True)
         db.merchants.create_index('merchant_id', unique=True)
         db.products.create_index([("product_id", pymongo.DESCENDING), ("merchant_id", pymongo.ASCENDING)], unique=True)
+        # Range and sort queries: q5 is covered by (price, product_id, name), q6/q8 walk (created_at, order_id)
+        db.products.create_index([('price', 1), ('product_id', 1), ('name', 1)])
+        db.orders.create_index([('created_at', 1), ('order_id', 1)])
 
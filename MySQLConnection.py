@@ -1,27 +1,499 @@
+import csv
+import glob
+import json
+import os
+import re
+import shutil
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import mysql.connector
+import mysql.connector.pooling
 import pandas as pd
 
 import fake_data_inserter
+from cache_control import check_state, drop_os_page_cache, restart_server, warn_once
+from instrumentation import CountingConnection, WireStats, pool_stats, time_breakdown
+from sampling import Sampler
+from text_search import index_query, scan_pattern
+from workload import DEFAULT_PARAMS, PAGE_SIZE, PRICE_BAND, bind, named_params
+
+
+# Table definitions of each schema variant. 'varchar' is the original schema; 'compact' stores the same generated
+# data with real date types, ENUMs for the status-like columns and integers sized to their key ranges.
+# Foreign key columns have to match the type of the key they reference exactly.
+SCHEMAS = {
+    'varchar': [
+        """
+        CREATE TABLE countries (
+          country_code INT NOT NULL,
+          name VARCHAR(255) NOT NULL,
+          continent_name VARCHAR(255) NOT NULL,
+          PRIMARY KEY (country_code)
+        );""",
+
+        """
+        CREATE TABLE users (
+          user_id INT NOT NULL AUTO_INCREMENT,
+          full_name VARCHAR(255) NOT NULL,
+          email VARCHAR(255) NOT NULL,
+          gender VARCHAR(255) NOT NULL,
+          date_of_birth VARCHAR(255) NOT NULL,
+          country_code INT NOT NULL,
+          PRIMARY KEY (user_id),
+          FOREIGN KEY (country_code) REFERENCES countries(country_code)
+        );""",
+
+        """
+        CREATE TABLE merchants (
+          merchant_id INT NOT NULL AUTO_INCREMENT,
+          merchant_name VARCHAR(255) NOT NULL,
+          user_id INT NOT NULL,
+          country_code INT NOT NULL,
+          PRIMARY KEY (merchant_id),
+          FOREIGN KEY (user_id) REFERENCES users(user_id),
+          FOREIGN KEY (country_code) REFERENCES countries(country_code)
+        );""",
+
+        """CREATE TABLE orders (
+            order_id INT NOT NULL AUTO_INCREMENT,
+            user_id INT NOT NULL,
+            status VARCHAR(255) NOT NULL,
+            created_at VARCHAR(255) NOT NULL,
+            PRIMARY KEY (order_id),
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        );""",
+
+        """
+        CREATE TABLE products (
+          product_id INT NOT NULL AUTO_INCREMENT,
+          merchant_id INT NOT NULL,
+          name VARCHAR(255) NOT NULL,
+          price INT NOT NULL,
+          status VARCHAR(255) NOT NULL,
+          created_at VARCHAR(255) NOT NULL,
+          PRIMARY KEY (product_id),
+          FOREIGN KEY (merchant_id) REFERENCES merchants(merchant_id)
+        );""",
+
+        """CREATE TABLE order_items (
+          order_id INT NOT NULL,
+          product_id INT NOT NULL,
+          quantity INT NOT NULL,
+          PRIMARY KEY (order_id,product_id),
+          FOREIGN KEY (order_id) REFERENCES orders(order_id),
+          FOREIGN KEY (product_id) REFERENCES products(product_id)
+        );""",
+    ],
+    'compact': [
+        """
+        CREATE TABLE countries (
+          country_code SMALLINT UNSIGNED NOT NULL,
+          name VARCHAR(64) NOT NULL,
+          continent_name ENUM('Africa', 'Asia', 'Europe', 'North America', 'Oceania', 'South America') NOT NULL,
+          PRIMARY KEY (country_code)
+        );""",
+
+        """
+        CREATE TABLE users (
+          user_id INT UNSIGNED NOT NULL AUTO_INCREMENT,
+          full_name VARCHAR(100) NOT NULL,
+          email VARCHAR(100) NOT NULL,
+          gender ENUM('Male', 'Female') NOT NULL,
+          date_of_birth DATE NOT NULL,
+          country_code SMALLINT UNSIGNED NOT NULL,
+          PRIMARY KEY (user_id),
+          FOREIGN KEY (country_code) REFERENCES countries(country_code)
+        );""",
+
+        """
+        CREATE TABLE merchants (
+          merchant_id MEDIUMINT UNSIGNED NOT NULL AUTO_INCREMENT,
+          merchant_name VARCHAR(100) NOT NULL,
+          user_id INT UNSIGNED NOT NULL,
+          country_code SMALLINT UNSIGNED NOT NULL,
+          PRIMARY KEY (merchant_id),
+          FOREIGN KEY (user_id) REFERENCES users(user_id),
+          FOREIGN KEY (country_code) REFERENCES countries(country_code)
+        );""",
+
+        """CREATE TABLE orders (
+            order_id INT UNSIGNED NOT NULL AUTO_INCREMENT,
+            user_id INT UNSIGNED NOT NULL,
+            status ENUM('Pending', 'Shipped', 'Delivered') NOT NULL,
+            created_at DATETIME NOT NULL,
+            PRIMARY KEY (order_id),
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        );""",
+
+        """
+        CREATE TABLE products (
+          product_id MEDIUMINT UNSIGNED NOT NULL AUTO_INCREMENT,
+          merchant_id MEDIUMINT UNSIGNED NOT NULL,
+          name VARCHAR(100) NOT NULL,
+          price SMALLINT UNSIGNED NOT NULL,
+          status ENUM('Available', 'Out of Stock') NOT NULL,
+          created_at DATETIME NOT NULL,
+          PRIMARY KEY (product_id),
+          FOREIGN KEY (merchant_id) REFERENCES merchants(merchant_id)
+        );""",
+
+        """CREATE TABLE order_items (
+          order_id INT UNSIGNED NOT NULL,
+          product_id MEDIUMINT UNSIGNED NOT NULL,
+          quantity TINYINT UNSIGNED NOT NULL,
+          PRIMARY KEY (order_id,product_id),
+          FOREIGN KEY (order_id) REFERENCES orders(order_id),
+          FOREIGN KEY (product_id) REFERENCES products(product_id)
+        );""",
+    ],
+}
+
+
+# q1-q8 as complex_query_test runs them. params map query names to workload.ParameterStreams; without them the
+# default literals are used. The client interpolates the values, so "NULL IS NULL OR ..." is folded away by the
+# optimizer.
+Q1 = """SELECT full_name, email
+        FROM users
+        WHERE country_code IN (SELECT country_code FROM countries WHERE continent_name = %(continent)s);
+        """
+
+Q2 = """SELECT
+        orders.order_id,
+        users.full_name AS user_name,
+        users.email AS user_email,
+        products.name AS product_name,
+        order_items.quantity,
+        products.price,
+        orders.status,
+        orders.created_at
+        FROM orders
+        JOIN users ON orders.user_id = users.user_id
+        JOIN order_items ON orders.order_id = order_items.order_id
+        JOIN products ON order_items.product_id = products.product_id
+        WHERE orders.status = %(status)s;"""
+
+Q3 = """SELECT
+        merchants.merchant_id,
+        merchants.merchant_name,
+        SUM(products.price * order_items.quantity) AS total_revenue
+        FROM merchants
+        JOIN products ON merchants.merchant_id = products.merchant_id
+        JOIN order_items ON products.product_id = order_items.product_id
+        WHERE %(merchant_id)s IS NULL OR merchants.merchant_id = %(merchant_id)s
+        GROUP BY merchants.merchant_id, merchants.merchant_name;
+    """
+
+Q4 = """SELECT
+        users.user_id,
+        users.full_name,
+        AVG(products.price * order_items.quantity) AS avg_order_value
+        FROM users
+        JOIN orders ON users.user_id = orders.user_id
+        JOIN order_items ON orders.order_id = order_items.order_id
+        JOIN products ON order_items.product_id = products.product_id
+        WHERE orders.status != 'Pending'
+        AND (%(user_id)s IS NULL OR users.user_id = %(user_id)s)
+        GROUP BY users.user_id, users.full_name;
+    """
+
+Q5 = f"""SELECT product_id, name, price
+        FROM products
+        WHERE price >= %(min_price)s AND price < %(min_price)s + {PRICE_BAND};
+    """
+
+Q6 = """SELECT order_id, user_id, status, created_at
+        FROM orders
+        WHERE %(since)s IS NULL OR created_at >= %(since)s;
+    """
+
+Q7 = """SELECT
+        merchants.merchant_id,
+        merchants.merchant_name,
+        SUM(products.price * order_items.quantity) AS total_revenue
+        FROM merchants
+        JOIN products ON merchants.merchant_id = products.merchant_id
+        JOIN order_items ON products.product_id = order_items.product_id
+        GROUP BY merchants.merchant_id, merchants.merchant_name
+        ORDER BY total_revenue DESC
+        LIMIT %(limit)s;
+    """
+
+# Keyset pagination: the first condition is a range on (created_at, order_id), the second skips the
+# rows of the cursor's own second that were already on the previous page
+Q8 = f"""SELECT order_id, user_id, status, created_at
+        FROM orders
+        WHERE %(after_created_at)s IS NULL
+        OR (created_at >= %(after_created_at)s
+            AND (created_at > %(after_created_at)s OR order_id > %(after_order_id)s))
+        ORDER BY created_at, order_id
+        LIMIT {PAGE_SIZE};
+    """
+
+QUERIES = {'q1': Q1, 'q2': Q2, 'q3': Q3, 'q4': Q4, 'q5': Q5, 'q6': Q6, 'q7': Q7, 'q8': Q8}
+
+# Partitioning schemes per table, each mapped to its partitioning column: LIST on the order status, monthly RANGE
+# on created_at and HASH on order_id. Every unique key of a partitioned table has to include that column, and
+# InnoDB has no foreign keys on partitioned tables, in either direction.
+PARTITION_SCHEMES = {
+    'orders': {'list': 'status', 'range': 'created_at'},
+    'order_items': {'hash': 'order_id'},
+}
+HASH_PARTITIONS = 8
+
+# Client protocol combinations of the protocol phase. 'text' sends the SQL text on a new cursor every iteration,
+# as the bench phase does; 'text_reused' keeps one cursor per query; 'prepared' prepares each query once on the
+# server and only sends the parameters after that. use_pure False is the C extension when it is installed.
+PROTOCOL_MODES = [{'use_pure': use_pure, 'statement': statement, 'buffered': buffered}
+                  for use_pure in (False, True) for statement in ('text', 'text_reused', 'prepared')
+                  for buffered in (False, True)]
+
+# Equivalent formulations of q1-q4, each returning the same rows as the query complex_query_test runs,
+# which is listed first. Optimizer hints naming an index that does not exist (the 'none' configuration)
+# are ignored with a warning, so every variant runs under every index configuration.
+QUERY_VARIANTS = {
+    'q1': {
+        'in': Q1,
+        'exists': """SELECT full_name, email
+            FROM users
+            WHERE EXISTS (SELECT 1 FROM countries
+                          WHERE countries.country_code = users.country_code
+                          AND countries.continent_name = %(continent)s);
+        """,
+        'join': """SELECT users.full_name, users.email
+            FROM users
+            JOIN countries ON users.country_code = countries.country_code
+            WHERE countries.continent_name = %(continent)s;
+        """,
+        'cte': """WITH continent_countries AS (
+                SELECT country_code FROM countries WHERE continent_name = %(continent)s)
+            SELECT users.full_name, users.email
+            FROM users
+            JOIN continent_countries ON users.country_code = continent_countries.country_code;
+        """,
+        'in_materialized': """SELECT /*+ SEMIJOIN(@countries MATERIALIZATION) */ full_name, email
+            FROM users
+            WHERE country_code IN (SELECT /*+ QB_NAME(countries) */ country_code
+                                   FROM countries WHERE continent_name = %(continent)s);
+        """,
+        'in_no_semijoin': """SELECT /*+ NO_SEMIJOIN(@countries) */ full_name, email
+            FROM users
+            WHERE country_code IN (SELECT /*+ QB_NAME(countries) */ country_code
+                                   FROM countries WHERE continent_name = %(continent)s);
+        """,
+        'join_order': """SELECT /*+ JOIN_ORDER(countries, users) */ users.full_name, users.email
+            FROM users
+            JOIN countries ON users.country_code = countries.country_code
+            WHERE countries.continent_name = %(continent)s;
+        """,
+    },
+    'q2': {
+        'join': Q2,
+        'cte': """WITH status_orders AS (
+                SELECT order_id, user_id, status, created_at FROM orders WHERE status = %(status)s)
+            SELECT
+            status_orders.order_id,
+            users.full_name AS user_name,
+            users.email AS user_email,
+            products.name AS product_name,
+            order_items.quantity,
+            products.price,
+            status_orders.status,
+            status_orders.created_at
+            FROM status_orders
+            JOIN users ON status_orders.user_id = users.user_id
+            JOIN order_items ON status_orders.order_id = order_items.order_id
+            JOIN products ON order_items.product_id = products.product_id;
+        """,
+        'join_order': Q2.replace('SELECT', 'SELECT /*+ JOIN_ORDER(orders, order_items, products, users) */', 1),
+        'index_status': Q2.replace('SELECT', 'SELECT /*+ INDEX(orders idx_orders_status) */', 1),
+        'no_index_status': Q2.replace('SELECT', 'SELECT /*+ NO_INDEX(orders idx_orders_status) */', 1),
+    },
+    'q3': {
+        'join': Q3,
+        # Sums the quantity of each product once, then joins the much smaller per-product totals
+        'derived': """SELECT
+            merchants.merchant_id,
+            merchants.merchant_name,
+            SUM(products.price * product_totals.quantity) AS total_revenue
+            FROM merchants
+            JOIN products ON merchants.merchant_id = products.merchant_id
+            JOIN (SELECT product_id, SUM(quantity) AS quantity
+                  FROM order_items GROUP BY product_id) AS product_totals
+              ON products.product_id = product_totals.product_id
+            WHERE %(merchant_id)s IS NULL OR merchants.merchant_id = %(merchant_id)s
+            GROUP BY merchants.merchant_id, merchants.merchant_name;
+        """,
+        'cte': """WITH product_totals AS (
+                SELECT product_id, SUM(quantity) AS quantity FROM order_items GROUP BY product_id)
+            SELECT
+            merchants.merchant_id,
+            merchants.merchant_name,
+            SUM(products.price * product_totals.quantity) AS total_revenue
+            FROM merchants
+            JOIN products ON merchants.merchant_id = products.merchant_id
+            JOIN product_totals ON products.product_id = product_totals.product_id
+            WHERE %(merchant_id)s IS NULL OR merchants.merchant_id = %(merchant_id)s
+            GROUP BY merchants.merchant_id, merchants.merchant_name;
+        """,
+        'join_order': Q3.replace('SELECT', 'SELECT /*+ JOIN_ORDER(merchants, products, order_items) */', 1),
+    },
+    'q4': {
+        'join': Q4,
+        # Revenue and item count per order first; their ratio per user is the same average as AVG over the items
+        'derived': """SELECT
+            users.user_id,
+            users.full_name,
+            SUM(order_totals.revenue) / SUM(order_totals.items) AS avg_order_value
+            FROM users
+            JOIN orders ON users.user_id = orders.user_id
+            JOIN (SELECT order_items.order_id, SUM(products.price * order_items.quantity) AS revenue,
+                         COUNT(*) AS items
+                  FROM order_items
+                  JOIN products ON order_items.product_id = products.product_id
+                  GROUP BY order_items.order_id) AS order_totals
+              ON orders.order_id = order_totals.order_id
+            WHERE orders.status != 'Pending'
+            AND (%(user_id)s IS NULL OR users.user_id = %(user_id)s)
+            GROUP BY users.user_id, users.full_name;
+        """,
+        'join_order': Q4.replace('SELECT', 'SELECT /*+ JOIN_ORDER(orders, users, order_items, products) */', 1),
+    },
+}
+
+
+# Connection pools shared by every MySQLConnection of the process, i.e. by the concurrent clients, keyed by
+# server, database, pool size and connector implementation
+POOLS = {}
+POOLS_LOCK = threading.Lock()
+
+
+class ConnectionPool:
+    # mysql.connector's pool raises PoolError when every connection is checked out instead of waiting, so a
+    # checkout first queues on a semaphore with one slot per connection; the time spent there is the pool wait
+    def __init__(self, pool_size, health_check, **connect_args):
+        self.pool = mysql.connector.pooling.MySQLConnectionPool(
+            pool_name=f"bench_{connect_args['database']}_{len(POOLS)}", pool_size=pool_size,
+            pool_reset_session=True, **connect_args)
+        self.slots = threading.BoundedSemaphore(pool_size)
+        self.health_check = health_check
+
+    def get(self):
+        # Returns a connection, the time waited for a free slot and the time the checkout itself took
+        start = time.perf_counter()
+        self.slots.acquire()
+        waited = time.perf_counter() - start
+        try:
+            connection = self.pool.get_connection()
+            if self.health_check:
+                # Connections the server dropped (restarts, wait_timeout) are reconnected instead of failing a query
+                connection.ping(reconnect=True, attempts=3, delay=1)
+        except Exception:
+            self.slots.release()
+            raise
+        return connection, waited, time.perf_counter() - start - waited
+
+    def put(self, connection):
+        # Closing a pooled connection hands it back to the pool, which resets its session
+        connection.close()
+        self.slots.release()
+
+
+def positional(query):
+    # Prepared statements take positional parameters only: every %(name)s becomes %s, names in order of appearance
+    return re.sub(r'%\((\w+)\)s', '%s', query), re.findall(r'%\((\w+)\)s', query)
+
+
+def created_at_bounds(data_dir):
+    # Oldest and newest created_at of the orders in a dataset directory, None when it has none
+    with open(os.path.join(data_dir, 'orders.csv'), 'r', newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        values = [row['created_at'] for row in reader]
+    return (min(values), max(values)) if values else None
+
+
+def month_ranges(oldest, newest):
+    # (first day, first day of the next month) of every month from oldest to newest, as DATETIME literals.
+    # The first partition also takes anything older, the catch-all partition after them anything newer.
+    year, month = int(oldest[:4]), int(oldest[5:7])
+    ranges = []
+    while (year, month) <= (int(newest[:4]), int(newest[5:7])):
+        next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+        ranges.append((f"{year:04d}-{month:02d}-01 00:00:00", f"{next_year:04d}-{next_month:02d}-01 00:00:00"))
+        year, month = next_year, next_month
+    return ranges
 
 
 class MySQLConnection:
-    def __init__(self, host, user, password, database):
+    def __init__(self, host, user, password, database, schema='varchar', partitioning=None,
+                 hash_partitions=HASH_PARTITIONS, use_pure=None):
         self.host = host
         self.user = user
         self.password = password
         self.database = database
+        # Each schema variant keeps its loaded tables and its indexed copy in databases of its own
+        self.schema = schema
+        self.trade_db = 'trade' if schema == 'varchar' else f'trade_{schema}'
+        self.indexed_db = 'new_' + self.trade_db
+        # Table -> key of PARTITION_SCHEMES[table], e.g. {'orders': 'list', 'order_items': 'hash'}
+        self.partitioning = dict(partitioning or {})
+        self.hash_partitions = hash_partitions
+        for table, scheme in self.partitioning.items():
+            if scheme not in PARTITION_SCHEMES.get(table, {}):
+                raise ValueError(f"Unknown partitioning {scheme!r} for {table}")
+        # MySQL only partitions on integer expressions or on the columns themselves, and not on ENUMs
+        if self.partitioning.get('orders') == 'list' and schema == 'compact':
+            raise ValueError("LIST partitioning on orders.status needs the VARCHAR status of the 'varchar' schema")
+        if self.partitioning.get('orders') == 'range' and schema == 'varchar':
+            raise ValueError("RANGE partitioning on orders.created_at needs the DATETIME of the 'compact' schema")
+        # Stored next to the fingerprint, so changing the partitioning reloads the tables
+        self.layout = {'schema': schema, 'partitioning': self.partitioning,
+                       'hash_partitions': hash_partitions if 'hash' in self.partitioning.values() else None}
         self.connection = None
+        # None keeps the connector's choice, the C extension when it is installed
+        self.use_pure = use_pure
+        # How complex_query_runner talks to the server: server-side prepared statements, buffered result sets
+        # (read completely by execute) and one cursor per query instead of one per iteration
+        self.prepared = False
+        self.buffered = False
+        self.reuse_cursor = False
+        # With a pool_size, every query iteration checks a connection out of the shared pool of its database and
+        # runs the session_variables (e.g. {"optimizer_search_depth": 0}) on it first. Waiting for and checking out
+        # the connection are timed separately from the query, into pool_stats.
+        self.pool_size = None
+        self.pool_health_check = True
+        self.session_variables = {}
+        self.pool_stats = {}
+        self.home_connection = None
+        self.pooled_connection = None
+        self.samples = {}
+        self.sampler = Sampler()
+        self.wire = WireStats()
+        self.wire_stats = {}
+        # Rows of the last iteration of every query, for checking them against reference_engine
+        self.last_results = {}
+        # Read each statement's TIMER_WAIT from performance_schema after every iteration
+        self.server_timing = False
+        self.server_times = []
+        self.breakdowns = {}
+        self.cache_state = 'warm'
+        # e.g. ['sudo', 'systemctl', 'restart', 'mysql']; needed for a truly cold buffer pool
+        self.restart_command = None
+        self.current_db = database
+        # Snapshots copy InnoDB tablespaces out of @@datadir, so they need file access to the server's datadir
+        self.snapshot_dir = os.path.join('snapshots', 'mysql' if schema == 'varchar' else f'mysql_{schema}')
 
     def connect(self):
+        options = {} if self.use_pure is None else {'use_pure': self.use_pure}
         try:
-            self.connection = mysql.connector.connect(
+            self.connection = CountingConnection(mysql.connector.connect(
                 host=self.host,
                 user=self.user,
                 password=self.password,
-                database=self.database
-            )
+                database=self.database,
+                **options
+            ), self.wire)
             print("Connected to MySQL successfully!")
             return self.connection
         except mysql.connector.Error as err:
@@ -43,74 +515,158 @@ class MySQLConnection:
             self.connection.close()
             print("Connection to MySQL closed.")
 
-    def createtables(self):
+    def server_version(self):
+        return self.connection.get_server_info()
+
+    def reset_cache(self, state):
+        check_state(state)
+        if state == 'warm':
+            return
+        if state == 'cold':
+            if self.restart_command:
+                cursor = self.connection.cursor()
+                # No new dump at this shutdown, and the dump of an earlier clean shutdown is moved aside, so that
+                # innodb_buffer_pool_load_at_startup has nothing to warm the restarted buffer pool from
+                cursor.execute("SET GLOBAL innodb_buffer_pool_dump_at_shutdown = OFF")
+                cursor.execute("SELECT @@datadir, @@innodb_buffer_pool_filename")
+                datadir, filename = cursor.fetchone()
+                cursor.close()
+                dump = os.path.join(datadir, filename)
+                if os.path.exists(dump):
+                    os.replace(dump, dump + '.cold')
+                if restart_server(self.restart_command, lambda: self.connection.reconnect(attempts=1)):
+                    self.stop_buffer_pool_load()
+            else:
+                warn_once("MySQL cold runs need restart_command to empty the buffer pool; "
+                          "only table caches and the OS page cache are dropped")
+            drop_os_page_cache()
+
+        cursor = self.connection.cursor()
+        if self.current_db:
+            cursor.execute("USE `" + self.current_db + "`")
+        cursor.execute("FLUSH TABLES")
+        cursor.close()
+
+    def stop_buffer_pool_load(self, timeout=60):
+        # Without file access to the datadir the dump cannot be moved aside, so a startup load is aborted instead.
+        # The load thread clears the abort flag when it starts, so it is set again until the load has stopped.
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT @@innodb_buffer_pool_load_at_startup")
+        if not cursor.fetchone()[0]:
+            cursor.close()
+            return
+        deadline = time.time() + timeout
+        status = ''
+        while time.time() < deadline:
+            cursor.execute("SET GLOBAL innodb_buffer_pool_load_abort = ON")
+            cursor.execute("SHOW GLOBAL STATUS LIKE 'Innodb_buffer_pool_load_status'")
+            status = cursor.fetchone()[1]
+            # Finished: completed, aborted, or no dump to load ("Cannot open ...")
+            if any(word in status for word in ('completed', 'aborted', 'Cannot', 'Error')):
+                break
+            time.sleep(0.1)
+        cursor.close()
+        if 'aborted' not in status and 'Cannot' not in status:
+            warn_once(f"MySQL buffer pool load at startup was not stopped ({status}); cold runs may start partly warm")
+
+    def prepare_cache(self):
+        with self.wire.pause():
+            self.reset_cache(self.cache_state)
+
+    def record_server_time(self):
+        if not self.server_timing:
+            return
+        with self.wire.pause():
+            cursor = self.connection.cursor()
+            # The benchmarked statement is the newest finished one on this connection's thread. Protocol commands
+            # (COM_STMT_CLOSE of a closed prepared cursor, COM_PING, ...) are skipped, they can come after it.
+            cursor.execute("SELECT TIMER_WAIT FROM performance_schema.events_statements_history "
+                           "WHERE THREAD_ID = PS_CURRENT_THREAD_ID() AND EVENT_NAME NOT LIKE 'statement/com/%' "
+                           "ORDER BY EVENT_ID DESC LIMIT 1")
+            row = cursor.fetchone()
+            cursor.close()
+        if row and row[0] is not None:
+            self.server_times.append(row[0] / 1e12)
+
+    def get_pool(self, db):
+        key = (self.host, self.user, db, self.pool_size, self.use_pure)
+        with POOLS_LOCK:
+            if key not in POOLS:
+                options = {} if self.use_pure is None else {'use_pure': self.use_pure}
+                # The database is part of the pooled connections' configuration, so they need no USE
+                POOLS[key] = ConnectionPool(self.pool_size, self.pool_health_check, host=self.host, user=self.user,
+                                            password=self.password, database=db, **options)
+            return POOLS[key]
+
+    def checkout(self, waits, checkouts):
+        # Swaps a pooled connection in for the rest of the iteration; checkin swaps the own one back
+        connection, waited, checkout = self.get_pool(self.current_db).get()
+        with self.wire.pause():
+            if self.session_variables:
+                start = time.perf_counter()
+                cursor = connection.cursor()
+                for variable, value in self.session_variables.items():
+                    cursor.execute(f"SET SESSION {variable} = %s", (value,))
+                cursor.close()
+                checkout += time.perf_counter() - start
+        waits.append(waited)
+        checkouts.append(checkout)
+        self.pooled_connection = connection
+        self.home_connection = self.connection
+        self.connection = CountingConnection(connection, self.wire)
+
+    def checkin(self):
+        if self.pooled_connection is None:
+            return
+        self.connection = self.home_connection
+        connection, self.pooled_connection = self.pooled_connection, None
+        self.get_pool(self.current_db).put(connection)
+
+    def run_pooled(self, db, statements, setup=()):
+        # Runs independent statements in parallel on pool_size pooled connections of db, each after the setup
+        # statements; the pool resets the session when the connection is handed back
+        pool = self.get_pool(db)
+
+        def run(statement):
+            connection = pool.get()[0]
+            try:
+                cursor = connection.cursor()
+                for setup_statement in setup:
+                    cursor.execute(setup_statement)
+                cursor.execute(statement)
+                connection.commit()
+                cursor.close()
+                print(f"Query executed successfully: {statement}")
+            finally:
+                pool.put(connection)
+
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            for future in [executor.submit(run, statement) for statement in statements]:
+                future.result()
+
+    def set_protocol(self, use_pure=None, statement='text', buffered=False):
+        # Switches the runner to one of PROTOCOL_MODES, reconnecting when the connector implementation changes.
+        # Returns the mode with the connection class actually used, which is the pure one without the C extension.
+        if use_pure != self.use_pure:
+            self.use_pure = use_pure
+            self.close()
+            self.connect()
+        self.prepared = statement == 'prepared'
+        self.reuse_cursor = statement != 'text'
+        self.buffered = buffered
+        return {'use_pure': use_pure, 'statement': statement, 'buffered': buffered,
+                'connection_class': type(self.connection._connection).__name__}
+
+    def createtables(self, data_dir=None):
         # https://www3.ntu.edu.sg/home/ehchua/programming/sql/SampleDatabases.html
+        # data_dir is the dataset about to be loaded; RANGE partitioning takes its months from it
+        bounds = created_at_bounds(data_dir) if data_dir else None
         try:
             sql_statements = [
-                "DROP DATABASE IF EXISTS `trade`",
-                "CREATE DATABASE IF NOT EXISTS `trade`",
-                "USE `trade`",
-                """
-                CREATE TABLE countries (
-                  country_code INT NOT NULL,
-                  name VARCHAR(255) NOT NULL,
-                  continent_name VARCHAR(255) NOT NULL,
-                  PRIMARY KEY (country_code)
-                );""",
-
-                """
-                CREATE TABLE users (
-                  user_id INT NOT NULL AUTO_INCREMENT,
-                  full_name VARCHAR(255) NOT NULL,
-                  email VARCHAR(255) NOT NULL,
-                  gender VARCHAR(255) NOT NULL,
-                  date_of_birth VARCHAR(255) NOT NULL,
-                  country_code INT NOT NULL,
-                  PRIMARY KEY (user_id),
-                  FOREIGN KEY (country_code) REFERENCES countries(country_code)
-                );""",
-
-                """
-                CREATE TABLE merchants (
-                  merchant_id INT NOT NULL AUTO_INCREMENT,
-                  merchant_name VARCHAR(255) NOT NULL,
-                  user_id INT NOT NULL,
-                  country_code INT NOT NULL,
-                  PRIMARY KEY (merchant_id),
-                  FOREIGN KEY (user_id) REFERENCES users(user_id),
-                  FOREIGN KEY (country_code) REFERENCES countries(country_code)
-                );""",
-
-                """CREATE TABLE orders (
-                    order_id INT NOT NULL AUTO_INCREMENT,
-                    user_id INT NOT NULL,
-                    status VARCHAR(255) NOT NULL,
-                    created_at VARCHAR(255) NOT NULL,
-                    PRIMARY KEY (order_id),
-                    FOREIGN KEY (user_id) REFERENCES users(user_id)
-                );""",
-
-                """
-                CREATE TABLE products (
-                  product_id INT NOT NULL AUTO_INCREMENT,
-                  merchant_id INT NOT NULL,
-                  name VARCHAR(255) NOT NULL,
-                  price INT NOT NULL,
-                  status VARCHAR(255) NOT NULL,
-                  created_at VARCHAR(255) NOT NULL,
-                  PRIMARY KEY (product_id),
-                  FOREIGN KEY (merchant_id) REFERENCES merchants(merchant_id)
-                );""",
-
-                """CREATE TABLE order_items (
-                  order_id INT NOT NULL,
-                  product_id INT NOT NULL,
-                  quantity INT NOT NULL,
-                  PRIMARY KEY (order_id,product_id),
-                  FOREIGN KEY (order_id) REFERENCES orders(order_id),
-                  FOREIGN KEY (product_id) REFERENCES products(product_id)
-                );""",
-            ]
+                f"DROP DATABASE IF EXISTS `{self.trade_db}`",
+                f"CREATE DATABASE IF NOT EXISTS `{self.trade_db}`",
+                f"USE `{self.trade_db}`",
+            ] + [self.partitioned_ddl(statement, bounds) for statement in SCHEMAS[self.schema]]
 
             for statement in sql_statements:
                 self.execute_query(statement)
@@ -118,85 +674,194 @@ class MySQLConnection:
         except Exception as e:
             print(f"Error: {e}")
 
-    def insert_data(self):
-        fake_data_inserter.insert_fake(self.connection)
+    def partitioned_ddl(self, statement, bounds=None):
+        # Adapts one CREATE TABLE of SCHEMAS to self.partitioning
+        if not self.partitioning:
+            return statement
+        table = re.search(r'CREATE TABLE (\w+)', statement).group(1)
+        if table in self.partitioning or any(f'REFERENCES {other}(' in statement for other in self.partitioning):
+            statement = '\n'.join(line for line in statement.split('\n') if 'FOREIGN KEY' not in line)
+            statement = re.sub(r',(\s*\);)\s*$', r'\1', statement)
+        if table in self.partitioning:
+            column = PARTITION_SCHEMES[table][self.partitioning[table]]
+            statement = re.sub(r'PRIMARY KEY \(([^)]*)\)', lambda match: match.group(0) if column in match.group(1)
+                               else f"PRIMARY KEY ({match.group(1)}, {column})", statement)
+            statement = statement.rstrip().rstrip(';') + '\n' + self.partition_clause(table, bounds) + ';'
+        return statement
 
-    def complex_query_runner(self, query):
-        exe_time = []
-        for x in range(10):
-            cursor = self.connection.cursor()
-            start_time = time.time()
-            cursor.execute(query)
+    def partition_clause(self, table, bounds=None):
+        # bounds is the (oldest, newest) created_at of the orders; without them RANGE has just the catch-all partition
+        scheme = self.partitioning.get(table)
+        if scheme == 'list':
+            return ("PARTITION BY LIST COLUMNS(status) (" + ', '.join(
+                f"PARTITION p_{status.lower()} VALUES IN ('{status}')"
+                for status in fake_data_inserter.ORDER_STATUSES) + ")")
+        if scheme == 'range':
+            months = [f"PARTITION p{start[:7].replace('-', '')} VALUES LESS THAN ('{end}')"
+                      for start, end in month_ranges(*bounds)] if bounds else []
+            return ("PARTITION BY RANGE COLUMNS(created_at) ("
+                    + ', '.join(months + ["PARTITION p_max VALUES LESS THAN (MAXVALUE)"]) + ")")
+        if scheme == 'hash':
+            return f"PARTITION BY HASH(order_id) PARTITIONS {self.hash_partitions}"
+        return ''
+
+    def insert_data(self, scale=1, seed=None):
+        fake_data_inserter.insert_fake(self.connection, scale, seed)
+
+    def insert_from_csv(self, data_dir='.'):
+        self.execute_query(f"USE `{self.trade_db}`")
+        fake_data_inserter.insert_tables(self.connection, fake_data_inserter.read_csv(data_dir))
+
+    def get_fingerprint(self):
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(f"SELECT name, value FROM `{self.trade_db}`.`_dataset_meta`")
+            meta = dict(cursor.fetchall())
+            # Tables loaded with another partitioning do not count as holding the dataset;
+            # databases loaded before the layout was recorded are unpartitioned
+            stored = json.loads(meta['layout']) if 'layout' in meta else {
+                'schema': self.schema, 'partitioning': {}, 'hash_partitions': None}
+            if stored != self.layout:
+                return None
+            return meta.get('fingerprint')
+        except mysql.connector.Error:
+            return None
+        finally:
+            cursor.close()
+
+    def set_fingerprint(self, fingerprint):
+        cursor = self.connection.cursor()
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS `{self.trade_db}`.`_dataset_meta` "
+                       "(name VARCHAR(64) NOT NULL PRIMARY KEY, value VARCHAR(255) NOT NULL)")
+        cursor.execute(f"REPLACE INTO `{self.trade_db}`.`_dataset_meta` VALUES ('fingerprint', %s), ('layout', %s)",
+                       (fingerprint, json.dumps(self.layout, sort_keys=True)))
+        self.connection.commit()
+        cursor.close()
+
+    def complex_query_runner(self, query, name, params=None, label=None):
+        # name selects the parameters, label (default name) is what the samples are stored under
+        label = label or name
+        statement, names = positional(query) if self.prepared else (query, None)
+        options = {key: True for key in ('prepared', 'buffered') if getattr(self, key)}
+        # A prepared cursor is only prepared once when the same cursor executes the same statement again.
+        # Pooled iterations each get another connection, so their cursors cannot be kept.
+        reuse = (self.reuse_cursor or self.prepared) and not self.pool_size
+        reused = []
+        before, after = self.prepare_cache, self.record_server_time
+        waits, checkouts = [], []
+        if self.pool_size:
+            # The checkout happens in the untimed part of the iteration, before the cache reset
+            def before():
+                self.checkout(waits, checkouts)
+                self.prepare_cache()
+
+            def after():
+                self.record_server_time()
+                self.checkin()
+
+        def run(value):
+            cursor = reused[0] if reused else self.connection.cursor(**options)
+            parameters = named_params(name, value)
+            cursor.execute(statement, [parameters[key] for key in names] if names is not None else parameters)
             results = cursor.fetchall()
-            end_time = time.time()
-            execution_time = end_time - start_time
-            exe_time.append(execution_time)
             # print("Query Results:", results)
-            # print(f"Execution Time: {execution_time:.8f} seconds")
-            cursor.close()
-        return sum(exe_time) / 10
-
-    def complex_query_test(self, db):
-        q1 = """SELECT full_name, email
-                FROM users
-                WHERE country_code IN (SELECT country_code FROM countries WHERE continent_name = 'North America');
-                """
-
-        q2 = """SELECT
-                orders.order_id,
-                users.full_name AS user_name,
-                users.email AS user_email,
-                products.name AS product_name,
-                order_items.quantity,
-                products.price,
-                orders.status,
-                orders.created_at
-                FROM orders
-                JOIN users ON orders.user_id = users.user_id
-                JOIN order_items ON orders.order_id = order_items.order_id
-                JOIN products ON order_items.product_id = products.product_id
-                WHERE orders.status = 'Shipped';"""
-
-        q3 = """SELECT
-                merchants.merchant_id,
-                merchants.merchant_name,
-                SUM(products.price * order_items.quantity) AS total_revenue
-                FROM merchants
-                JOIN products ON merchants.merchant_id = products.merchant_id
-                JOIN order_items ON products.product_id = order_items.product_id
-                GROUP BY merchants.merchant_id, merchants.merchant_name;
-            """
-
-        q4 = """SELECT
-                users.user_id,
-                users.full_name,
-                AVG(products.price * order_items.quantity) AS avg_order_value
-                FROM users
-                JOIN orders ON users.user_id = orders.user_id
-                JOIN order_items ON orders.order_id = order_items.order_id
-                JOIN products ON order_items.product_id = products.product_id
-                WHERE orders.status != 'Pending'
-                GROUP BY users.user_id, users.full_name;
-            """
+            if reuse:
+                reused[:] = [cursor]
+            else:
+                cursor.close()
+            self.last_results[label] = results
+
+        self.wire.reset()
+        self.server_times = []
+        try:
+            exe_time = self.sampler.collect(bind(run, name, params), before, after)
+        finally:
+            for cursor in reused:
+                cursor.close()
+            self.checkin()
+        self.samples[label] = exe_time
+        self.wire_stats[label] = self.wire.per_iteration(len(exe_time))
+        self.breakdowns[label] = time_breakdown(exe_time, self.sampler.cpu_samples, self.server_times)
+        if self.pool_size:
+            self.pool_stats[label] = pool_stats(waits, checkouts)
+        return sum(exe_time) / len(exe_time)
+
+    def explain(self, query, name, value):
+        # Optimizer plan of one query as EXPLAIN FORMAT=JSON, parsed
+        cursor = self.connection.cursor()
+        with self.wire.pause():
+            cursor.execute("EXPLAIN FORMAT=JSON " + query.strip().rstrip(';'), named_params(name, value))
+            plan = cursor.fetchone()[0]
+        cursor.close()
+        return json.loads(plan)
 
+    def query_variant_test(self, db, name, variant, params=None):
+        # Runs one formulation of QUERY_VARIANTS[name] under label name/variant and returns its plan for the
+        # default parameter. The caller resets samples, wire_stats and breakdowns once for all variants.
+        query = QUERY_VARIANTS[name][variant]
+        self.current_db = db
+        self.execute_query("USE `" + db + "`")
+        plan = self.explain(query, name, DEFAULT_PARAMS[name])
+        self.complex_query_runner(query, name, params, f"{name}/{variant}")
+        return plan
+
+    def complex_query_test(self, db, params=None):
         exe_time_queries = []
+        self.samples = {}
+        self.wire_stats = {}
+        self.breakdowns = {}
+        self.last_results = {}
+        self.pool_stats = {}
+        self.current_db = db
         self.execute_query("USE `" + db + "`")
-        exe_time_queries.append(self.complex_query_runner(q1))
-        exe_time_queries.append(self.complex_query_runner(q2))
-        exe_time_queries.append(self.complex_query_runner(q3))
-        exe_time_queries.append(self.complex_query_runner(q4))
+        for name, query in QUERIES.items():
+            exe_time_queries.append(self.complex_query_runner(query, name, params))
         return exe_time_queries
 
+    def execute_write(self, statement, params):
+        # One write per transaction, as an OLTP client would issue it
+        cursor = self.connection.cursor()
+        cursor.execute(statement, params)
+        self.connection.commit()
+        cursor.close()
+
+    def insert_order(self, order):
+        self.execute_write("INSERT INTO orders VALUES (%s, %s, %s, %s)", order)
+
+    def update_order_status(self, order_id, status):
+        self.execute_write("UPDATE orders SET status = %s WHERE order_id = %s", (status, order_id))
+
+    def delete_order(self, order_id):
+        self.execute_write("DELETE FROM orders WHERE order_id = %s", (order_id,))
+
     def copy_database(self):
-        statements = ["CREATE DATABASE IF NOT EXISTS `new_trade`",
-                      "CREATE TABLE IF NOT EXISTS `new_trade`.`countries` AS SELECT * FROM `trade`.`countries`",
-                      "CREATE TABLE IF NOT EXISTS `new_trade`.`users` AS SELECT * FROM `trade`.`users`",
-                      "CREATE TABLE IF NOT EXISTS `new_trade`.`merchants` AS SELECT * FROM `trade`.`merchants`",
-                      "CREATE TABLE IF NOT EXISTS `new_trade`.`orders` AS SELECT * FROM `trade`.`orders`",
-                      "CREATE TABLE IF NOT EXISTS `new_trade`.`products` AS SELECT * FROM `trade`.`products`",
-                      "CREATE TABLE IF NOT EXISTS `new_trade`.`order_items` AS SELECT * FROM `trade`.`order_items`"]
+        # The copy is created from SHOW CREATE TABLE of the loaded tables, so it has their primary and foreign keys,
+        # the indexes InnoDB added for the foreign keys, the schema variant's column types and the partitioning.
+        # The indexed configuration then differs from the loaded one by create_index alone, for reads and writes.
+        # Tables that are already copied are left as they are.
+        self.execute_query(f"CREATE DATABASE IF NOT EXISTS `{self.indexed_db}`")
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = %s",
+                       (self.indexed_db,))
+        existing = {table for (table,) in cursor.fetchall()}
+        tables = [table for table in ['countries', 'users', 'merchants', 'orders', 'products', 'order_items']
+                  if table not in existing]
+        # Foreign keys name the referenced table without its database, so they resolve inside the copy
+        cursor.execute(f"USE `{self.indexed_db}`")
+        for table in tables:
+            cursor.execute(f"SHOW CREATE TABLE `{self.trade_db}`.`{table}`")
+            cursor.execute(cursor.fetchone()[1])
+        cursor.close()
+        statements = [f"INSERT INTO `{self.indexed_db}`.`{table}` SELECT * FROM `{self.trade_db}`.`{table}`"
+                      for table in tables]
+        if self.pool_size:
+            # Copied side by side, so a row can arrive before the row its foreign key references
+            self.run_pooled(self.trade_db, statements, ["SET SESSION foreign_key_checks = 0"])
+            return
+        # In foreign key order
         for statement in statements:
             self.execute_query(statement)
+        self.connection.commit()
 
     def create_index(self):
         # index1 = "CREATE INDEX idx_users_country_code ON users (country_code)"
@@ -227,7 +892,15 @@ class MySQLConnection:
         #         CREATE INDEX idx_order_items_product_id ON order_items(product_id);
         #         CREATE INDEX idx_orders_status_ ON orders(status);
 
-        self.execute_query("USE `new_trade`")
+        # -- Index for Query 5 (q5): price range, covering name (the primary key is in every secondary index)
+        index8 = "CREATE INDEX idx_products_price_name ON products(price, name)"
+
+        # -- Index for Query 6 and 8 (q6, q8): time window and keyset pagination on (created_at, order_id)
+        index9 = "CREATE INDEX idx_orders_created_at_order_id ON orders(created_at, order_id)"
+
+        # -- Query 7 (q7) uses the q3 indexes
+
+        self.execute_query(f"USE `{self.indexed_db}`")
         self.execute_query(index1)
         self.execute_query(index2)
         self.execute_query(index3)
@@ -235,10 +908,147 @@ class MySQLConnection:
         self.execute_query(index5)
         self.execute_query(index6)
         self.execute_query(index7)
-        # self.execute_query(index8)
+        self.execute_query(index8)
+        self.execute_query(index9)
+
+    def create_text_indexes(self, db, columns):
+        # InnoDB FULLTEXT skips words shorter than innodb_ft_min_token_size and the default stopword list
+        for table, column in columns:
+            self.execute_query(f"ALTER TABLE `{db}`.`{table}` ADD FULLTEXT INDEX ft_{table}_{column} ({column})")
+
+    def drop_text_indexes(self, db, columns):
+        for table, column in columns:
+            self.execute_query(f"DROP INDEX ft_{table}_{column} ON `{db}`.`{table}`")
+
+    def text_search(self, db, table, column, kind, value, use_index=True):
+        # The scan is a REGEXP over every row; it is case-insensitive under the tables' _ci collation
+        if use_index:
+            condition, param = f"MATCH({column}) AGAINST (%s IN BOOLEAN MODE)", index_query(kind, value)
+        else:
+            condition, param = f"{column} REGEXP %s", scan_pattern(kind, value)
+        cursor = self.connection.cursor()
+        cursor.execute(f"SELECT * FROM `{db}`.`{table}` WHERE {condition}", (param,))
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    def index_sizes(self, db):
+        # Per-index size from the persistent InnoDB statistics (pages * page size), refreshed by ANALYZE first.
+        # PRIMARY/GEN_CLUST_INDEX are the clustered rows themselves and are left out.
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = %s", (db,))
+        for (table,) in cursor.fetchall():
+            cursor.execute(f"ANALYZE TABLE `{db}`.`{table}`")
+            cursor.fetchall()
+        cursor.execute("SELECT s.table_name, s.index_name, s.stat_value * @@innodb_page_size "
+                       "FROM mysql.innodb_index_stats s "
+                       "WHERE s.database_name = %s AND s.stat_name = 'size' "
+                       "AND s.index_name NOT IN ('PRIMARY', 'GEN_CLUST_INDEX')", (db,))
+        sizes = {}
+        for table, index, size in cursor.fetchall():
+            # Partitions are listed as table#p#partition, each with its own part of every index
+            key = f"{table.split('#')[0]}.{index}"
+            sizes[key] = sizes.get(key, 0) + int(size)
+        cursor.close()
+        return sizes
+
+    def storage_stats(self, db):
+        # Per table: data and index bytes on disk and bytes currently in the buffer pool. INNODB_BUFFER_PAGE walks
+        # every page of the pool, so this runs once after the measurements, never between iterations.
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = %s", (db,))
+        for (table,) in cursor.fetchall():
+            cursor.execute(f"ANALYZE TABLE `{db}`.`{table}`")
+            cursor.fetchall()
+        cursor.execute("SELECT table_name, data_length, index_length FROM information_schema.tables "
+                       "WHERE table_schema = %s", (db,))
+        stats = {table: {'data_bytes': int(data), 'index_bytes': int(index), 'buffer_pool_bytes': 0}
+                 for table, data, index in cursor.fetchall()}
+        # TABLE_NAME is `db`.`table` here, followed by /* Partition `p` */ for partitioned tables
+        cursor.execute("SELECT table_name, COUNT(*) * @@innodb_page_size FROM information_schema.innodb_buffer_page "
+                       "WHERE table_name LIKE %s GROUP BY table_name", (f"`{db}`.%",))
+        for name, size in cursor.fetchall():
+            table = name.split('.', 1)[1].split('`')[1]
+            if table in stats:
+                stats[table]['buffer_pool_bytes'] += int(size)
+        cursor.close()
+        return stats
+
+    def snapshot_path(self, name):
+        return os.path.join(self.snapshot_dir, name)
+
+    @staticmethod
+    def tablespace_files(directory, table):
+        # .ibd and .cfg files of a table; a partitioned table has one of each per partition, named <table>#p#<p>
+        # (#P# on case-insensitive file systems)
+        return sorted(os.path.basename(path) for pattern in [f"{table}.ibd", f"{table}.cfg", f"{table}#[pP]#*"]
+                      for path in glob.glob(os.path.join(directory, pattern)))
+
+    def has_snapshot(self, name):
+        return os.path.exists(os.path.join(self.snapshot_path(name), 'tables.json'))
+
+    def snapshot(self, name, db=None):
+        db = db or self.trade_db
+        path = self.snapshot_path(name)
+        os.makedirs(path, exist_ok=True)
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT @@datadir")
+        datadir = cursor.fetchone()[0]
+        cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = %s", (db,))
+        tables = [row[0] for row in cursor.fetchall()]
+        ddl = {}
+        for table in tables:
+            cursor.execute(f"SHOW CREATE TABLE `{db}`.`{table}`")
+            ddl[table] = cursor.fetchone()[1]
+
+        # FOR EXPORT quiesces the tables and writes the .cfg metadata needed by IMPORT TABLESPACE
+        cursor.execute("FLUSH TABLES " + ", ".join(f"`{db}`.`{table}`" for table in tables) + " FOR EXPORT")
+        files = {}
+        try:
+            for table in tables:
+                files[table] = self.tablespace_files(os.path.join(datadir, db), table)
+                if not files[table]:
+                    raise FileNotFoundError(f"no tablespace files of {db}.{table} in {os.path.join(datadir, db)}")
+                for file in files[table]:
+                    shutil.copy2(os.path.join(datadir, db, file), path)
+        finally:
+            cursor.execute("UNLOCK TABLES")
+            cursor.close()
+
+        # Written last, so a failed copy never looks like a usable snapshot
+        with open(os.path.join(path, 'tables.json'), 'w', encoding='utf-8') as f:
+            json.dump({'database': db, 'tables': tables, 'ddl': ddl, 'files': files}, f, indent=2)
+        print(f"MySQL snapshot {name} of {db} written to {path}")
+
+    def restore(self, name):
+        path = self.snapshot_path(name)
+        with open(os.path.join(path, 'tables.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        db = meta['database']
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT @@datadir")
+        datadir = cursor.fetchone()[0]
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+        try:
+            cursor.execute(f"DROP DATABASE IF EXISTS `{db}`")
+            cursor.execute(f"CREATE DATABASE `{db}`")
+            cursor.execute(f"USE `{db}`")
+            for table in meta['tables']:
+                cursor.execute(meta['ddl'][table])
+                cursor.execute(f"ALTER TABLE `{table}` DISCARD TABLESPACE")
+            for table in meta['tables']:
+                # Snapshots written before the file list was recorded hold unpartitioned tables
+                for file in meta.get('files', {}).get(table, [f"{table}.ibd", f"{table}.cfg"]):
+                    shutil.copy2(os.path.join(path, file), os.path.join(datadir, db))
+            for table in meta['tables']:
+                cursor.execute(f"ALTER TABLE `{table}` IMPORT TABLESPACE")
+        finally:
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+            cursor.close()
+        print(f"MySQL snapshot {name} restored into {db}")
 
     def export_data(self):
-        self.execute_query("USE `trade`")
+        self.execute_query(f"USE `{self.trade_db}`")
         sql_queries = [
             "SELECT * FROM countries",
             "SELECT * FROM users",
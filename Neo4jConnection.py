@@ -1,7 +1,17 @@
-import time
+import os
+import subprocess
 
 from neo4j import GraphDatabase
 
+from cache_control import check_state, drop_os_page_cache, restart_server, warn_once
+from instrumentation import CountingDriver, WireStats, disk_usage, time_breakdown
+from sampling import Sampler
+from text_search import index_query, scan_pattern
+from workload import PAGE_SIZE, PRICE_BAND, bind, named_params
+
+# Node label of each table the text workload searches
+TEXT_LABELS = {'products': 'Product', 'merchants': 'Merchant', 'users': 'User'}
+
 
 class Neo4jConnection:
     def __init__(self, uri, user, password):
@@ -9,10 +19,30 @@ class Neo4jConnection:
         self.user = user
         self.password = password
         self.driver = None
+        self.samples = {}
+        self.sampler = Sampler()
+        self.wire = WireStats()
+        self.wire_stats = {}
+        # Take result_available_after + result_consumed_after from each result summary
+        self.server_timing = False
+        self.server_times = []
+        self.breakdowns = {}
+        self._last_result = None
+        # neo4j-admin dump/load only work on a stopped database, so snapshots need stop/start commands
+        self.snapshot_dir = os.path.join('snapshots', 'neo4j')
+        self.neo4j_admin = ['neo4j-admin']
+        self.stop_command = None
+        self.start_command = None
+        self.database_name = 'neo4j'
+        # Index sizes are read from <data_directory>/databases/<database>/schema/index/<provider>/<id>
+        self.data_directory = '/var/lib/neo4j/data'
+        self.cache_state = 'warm'
+        # e.g. ['sudo', 'neo4j', 'restart']; needed for a truly cold page cache
+        self.restart_command = None
 
     def connect(self):
         try:
-            self.driver = GraphDatabase.driver(self.uri, auth=(self.user, self.password))
+            self.driver = CountingDriver(GraphDatabase.driver(self.uri, auth=(self.user, self.password)), self.wire)
             print("Connected to Neo4j successfully!")
             return self.driver
         except Exception as e:
@@ -24,6 +54,34 @@ class Neo4jConnection:
             self.driver.close()
             print("Connection to Neo4j closed.")
 
+    def server_version(self):
+        return self.driver.get_server_info().agent
+
+    def reset_cache(self, state):
+        check_state(state)
+        if state == 'warm':
+            return
+        if state == 'cold':
+            if self.restart_command:
+                restart_server(self.restart_command, self.driver.verify_connectivity)
+            else:
+                warn_once("Neo4j cold runs need restart_command to empty the page cache; "
+                          "only query caches and the OS page cache are dropped")
+            drop_os_page_cache()
+
+        with self.driver.session() as session:
+            session.run("CALL db.clearQueryCaches()").consume()
+
+    def prepare_cache(self):
+        with self.wire.pause():
+            self.reset_cache(self.cache_state)
+
+    def record_server_time(self):
+        if not self.server_timing or self._last_result is None:
+            return
+        summary = self._last_result.consume()
+        self.server_times.append((summary.result_available_after + summary.result_consumed_after) / 1000)
+
     def insert_data(self):
         cypher_script = [
             """LOAD CSV WITH HEADERS FROM "file:///countries.csv" AS row
@@ -77,11 +135,123 @@ class Neo4jConnection:
                 session.run(cyp_scr)
             print("Data imported into Neo4j successfully.")
 
-    def complex_queries_test(self):
-        q1 = """MATCH (user:User)-[:LIVES_IN]->(country:Country {continent_name: 'North America'})
+    def clear_db(self):
+        with self.driver.session() as session:
+            session.run("MATCH (n) DETACH DELETE n").consume()
+
+    def get_fingerprint(self):
+        with self.driver.session() as session:
+            record = session.run("MATCH (m:DatasetMeta) RETURN m.fingerprint AS fingerprint LIMIT 1").single()
+            return record['fingerprint'] if record else None
+
+    def set_fingerprint(self, fingerprint):
+        with self.driver.session() as session:
+            session.run("MERGE (m:DatasetMeta) SET m.fingerprint = $fingerprint", fingerprint=fingerprint).consume()
+
+    def drop_indexes(self):
+        with self.driver.session() as session:
+            # Constraints own their backing indexes, so they go first
+            constraints = [record['name'] for record in session.run("SHOW CONSTRAINTS YIELD name")]
+            for name in constraints:
+                session.run(f"DROP CONSTRAINT `{name}`").consume()
+            indexes = [record['name'] for record in
+                       session.run("SHOW INDEXES YIELD name, type WHERE type <> 'LOOKUP' RETURN name")]
+            for name in indexes:
+                session.run(f"DROP INDEX `{name}`").consume()
+
+    def wait_for_indexes(self, timeout=600):
+        # Index population runs in the background after CREATE INDEX returns
+        with self.driver.session() as session:
+            session.run("CALL db.awaitIndexes($timeout)", {'timeout': timeout}).consume()
+
+    def index_sizes(self):
+        index_root = os.path.join(self.data_directory, 'databases', self.database_name, 'schema', 'index')
+        if not os.path.isdir(index_root):
+            warn_once(f"{index_root} not found, Neo4j index sizes need access to the server's data directory")
+            return {}
+        with self.driver.session() as session:
+            indexes = [(record['id'], record['name']) for record in
+                       session.run("SHOW INDEXES YIELD id, name, type WHERE type <> 'LOOKUP' RETURN id, name")]
+        sizes = {}
+        for index_id, name in indexes:
+            sizes[name] = sum(disk_usage(os.path.join(index_root, provider, str(index_id)))
+                              for provider in os.listdir(index_root))
+        return sizes
+
+    def create_text_indexes(self, columns):
+        # Lucene fulltext indexes; the stop-word-free analyzer keeps every word searchable, as the scan does
+        with self.driver.session() as session:
+            for table, column in columns:
+                session.run(f"CREATE FULLTEXT INDEX {table}_{column}_text IF NOT EXISTS "
+                            f"FOR (n:{TEXT_LABELS[table]}) ON EACH [n.{column}] "
+                            "OPTIONS {indexConfig: {`fulltext.analyzer`: 'standard-no-stop-words'}}").consume()
+
+    def drop_text_indexes(self, columns):
+        with self.driver.session() as session:
+            for table, column in columns:
+                session.run(f"DROP INDEX {table}_{column}_text IF EXISTS").consume()
+
+    def text_search(self, table, column, kind, value, use_index=True):
+        with self.driver.session() as session:
+            if use_index:
+                result = session.run("CALL db.index.fulltext.queryNodes($index, $query) YIELD node RETURN node",
+                                     {'index': f"{table}_{column}_text", 'query': index_query(kind, value)})
+            else:
+                result = session.run(f"MATCH (n:{TEXT_LABELS[table]}) WHERE n.{column} =~ $pattern RETURN n",
+                                     {'pattern': '(?i).*' + scan_pattern(kind, value) + '.*'})
+            return list(result)
+
+    def insert_order(self, order):
+        order_id, user_id, status, created_at = order
+        with self.driver.session() as session:
+            session.run("MATCH (user:User {user_id: $user_id}) "
+                        "CREATE (:Order {order_id: $order_id, status: $status, created_at: $created_at})"
+                        "-[:PLACED_BY]->(user)",
+                        {'order_id': order_id, 'user_id': user_id, 'status': status, 'created_at': created_at}).consume()
+
+    def update_order_status(self, order_id, status):
+        with self.driver.session() as session:
+            session.run("MATCH (order:Order {order_id: $order_id}) SET order.status = $status",
+                        {'order_id': order_id, 'status': status}).consume()
+
+    def delete_order(self, order_id):
+        with self.driver.session() as session:
+            session.run("MATCH (order:Order {order_id: $order_id}) DETACH DELETE order",
+                        {'order_id': order_id}).consume()
+
+    def snapshot_path(self, name):
+        return os.path.join(self.snapshot_dir, name)
+
+    def has_snapshot(self, name):
+        return os.path.exists(os.path.join(self.snapshot_path(name), f"{self.database_name}.dump"))
+
+    def run_offline(self, admin_args):
+        if not self.stop_command or not self.start_command:
+            raise RuntimeError("Neo4j snapshots need stop_command and start_command")
+        subprocess.run(self.stop_command, check=True)
+        try:
+            subprocess.run(self.neo4j_admin + admin_args, check=True)
+        finally:
+            restart_server(self.start_command, self.driver.verify_connectivity)
+
+    def snapshot(self, name):
+        path = self.snapshot_path(name)
+        os.makedirs(path, exist_ok=True)
+        self.run_offline(['database', 'dump', self.database_name, f'--to-path={path}',
+                          '--overwrite-destination=true'])
+        print(f"Neo4j snapshot {name} written to {path}")
+
+    def restore(self, name):
+        self.run_offline(['database', 'load', self.database_name, f'--from-path={self.snapshot_path(name)}',
+                          '--overwrite-destination=true'])
+        print(f"Neo4j snapshot {name} restored")
+
+    def complex_queries_test(self, params=None):
+        # params maps query names to workload.ParameterStreams; without them the default literals are used
+        q1 = """MATCH (user:User)-[:LIVES_IN]->(country:Country {continent_name: $continent})
 RETURN user.full_name, user.email;
 """
-        q2 = """MATCH (order:Order {status: 'Shipped'})
+        q2 = """MATCH (order:Order {status: $status})
 MATCH (user:User)-[:PLACED_BY]->(order)
 MATCH (order)-[:CONTAINS]->(product:Product)
 RETURN
@@ -104,21 +274,55 @@ WHERE order.status <> 'Pending'
 WITH user, AVG(product.price * order.quantity) AS avg_order_value
 RETURN user.user_id, user.full_name, avg_order_value;
 """
-        queries = [q1, q2, q3, q4]
+        q5 = f"""MATCH (product:Product)
+WHERE product.price >= $min_price AND product.price < $min_price + {PRICE_BAND}
+RETURN product.product_id, product.name, product.price;
+"""
+        q6 = """MATCH (order:Order)-[:PLACED_BY]->(user:User)
+RETURN order.order_id, user.user_id, order.status, order.created_at;
+"""
+        q7 = """MATCH (merchant:Merchant)<-[:SOLD_BY]-(product:Product)<-[item:CONTAINS]-(:Order)
+WITH merchant, SUM(product.price * item.quantity) AS total_revenue
+ORDER BY total_revenue DESC
+LIMIT $limit
+RETURN merchant.merchant_id, merchant.merchant_name, total_revenue;
+"""
+        # The page is cut on Order alone, so the user lookup only runs for the PAGE_SIZE rows returned
+        q8 = f"""MATCH (order:Order)
+WITH order ORDER BY order.created_at, order.order_id LIMIT {PAGE_SIZE}
+MATCH (order)-[:PLACED_BY]->(user:User)
+RETURN order.order_id, user.user_id, order.status, order.created_at;
+"""
+        # With a merchant/user parameter q3/q4 start from that one node instead of all of them
+        q3_one = q3.replace("(merchant:Merchant)", "(merchant:Merchant {merchant_id: $merchant_id})", 1)
+        q4_one = q4.replace("(user:User)", "(user:User {user_id: $user_id})", 1)
+        q6_one = q6.replace("RETURN", "WHERE order.created_at >= $since\nRETURN", 1)
+        # Keyset cursor: the first condition is a range seek on (created_at, order_id), the second skips the
+        # rows of the cursor's own second that were already on the previous page
+        q8_one = q8.replace("WITH order", "WHERE order.created_at >= $after_created_at\n"
+                                          "AND (order.created_at > $after_created_at "
+                                          "OR order.order_id > $after_order_id)\n"
+                                          "WITH order", 1)
+        queries = [('q1', q1, q1), ('q2', q2, q2), ('q3', q3, q3_one), ('q4', q4, q4_one),
+                   ('q5', q5, q5), ('q6', q6, q6_one), ('q7', q7, q7), ('q8', q8, q8_one)]
 
         avg_exe_time_4_querirs = []
+        self.samples = {}
+        self.wire_stats = {}
+        self.breakdowns = {}
         with self.driver.session() as session:
-            for q in queries:
-                exe_time = []
-                for x in range(10):
-                    start_time = time.time()
-                    results = session.run(q)
-                    end_time = time.time()
-                    execution_time = end_time - start_time
-                    exe_time.append(execution_time)
-                    # print("Query Results:", results)
-                    # print(f"Execution Time: {execution_time:.8f} seconds")
-                avg_exe_time_4_querirs.append(sum(exe_time) / 10)
+            def run(value):
+                self._last_result = session.run(q_all if value is None else q_one, named_params(name, value))
+                list(self._last_result)
+
+            for name, q_all, q_one in queries:
+                self.wire.reset()
+                self.server_times = []
+                exe_time = self.sampler.collect(bind(run, name, params), self.prepare_cache, self.record_server_time)
+                avg_exe_time_4_querirs.append(sum(exe_time) / len(exe_time))
+                self.samples[name] = exe_time
+                self.wire_stats[name] = self.wire.per_iteration(len(exe_time))
+                self.breakdowns[name] = time_breakdown(exe_time, self.sampler.cpu_samples, self.server_times)
 
         return avg_exe_time_4_querirs
 
@@ -137,6 +341,8 @@ RETURN user.user_id, user.full_name, avg_order_value;
 
             """CREATE INDEX FOR (o:Order) ON (o.status);""",
             """CREATE INDEX FOR (o:Order) ON (o.created_at);""",
+            # Composite range index for the keyset pagination of q8
+            """CREATE INDEX FOR (o:Order) ON (o.created_at, o.order_id);""",
 
             """CREATE INDEX FOR (p:Product) ON (p.price);""",
             """CREATE INDEX FOR (p:Product) ON (p.status);""",
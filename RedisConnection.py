@@ -1,8 +1,30 @@
 import csv
+import os
+import shutil
 import time
 
 import redis
 
+from cache_control import check_state, restart_server, warn_once
+from instrumentation import WireStats, instrument_redis, time_breakdown
+from sampling import Sampler
+from text_search import matches, tokens
+from workload import PAGE_SIZE, PRICE_BAND, bind
+
+
+# Indexes kept as one sorted set (data_type_index:field) instead of a set per value
+SORTED_INDEXES = {('products', 'price'), ('orders', 'created_at'), ('merchants', 'revenue')}
+
+
+def order_time_member(created_at, order_id):
+    # Members of orders_index:created_at all have score 0, so ZRANGEBYLEX orders them by (created_at, order_id);
+    # the zero padding makes the ids sort numerically
+    return f"{created_at}|{int(order_id):010d}"
+
+
+def order_key_of(member):
+    return f"orders:{int(member.split('|')[1])}"
+
 
 class RedisConnection:
     def __init__(self, host, port, password):
@@ -10,15 +32,31 @@ class RedisConnection:
         self.port = port
         self.password = password
         self.connection = None
+        self.samples = {}
+        self.sampler = Sampler()
+        self.wire = WireStats()
+        self.wire_stats = {}
+        # Diff the per-command usec totals of INFO commandstats around every iteration
+        self.server_timing = False
+        self.server_times = []
+        self.breakdowns = {}
+        self._usec_mark = 0
+        # RDB snapshots are copied from/to the server's dir, so they need file access to it
+        self.snapshot_dir = os.path.join('snapshots', 'redis')
+        # (data_type, field) pairs with an index set that writes have to keep up to date
+        self.indexed_fields = set()
+        self.cache_state = 'warm'
+        # e.g. ['sudo', 'systemctl', 'restart', 'redis']; the dataset is reloaded from the RDB file on start
+        self.restart_command = None
 
     def connect(self):
         try:
-            self.connection = redis.StrictRedis(
+            self.connection = instrument_redis(redis.StrictRedis(
                 host=self.host,
                 port=self.port,
                 password=self.password,
                 decode_responses=True
-            )
+            ), self.wire)
             print("Connected to Redis successfully!")
             return self.connection
         except Exception as e:
@@ -30,6 +68,39 @@ class RedisConnection:
             self.connection.close()
             print("Connection to Redis closed.")
 
+    def server_version(self):
+        return self.connection.info('server')['redis_version']
+
+    def reset_cache(self, state):
+        # Redis keeps everything in memory and has no plan cache, so only a restart changes anything
+        check_state(state)
+        if state != 'cold':
+            return
+        if self.restart_command:
+            self.connection.save()
+            restart_server(self.restart_command, self.connection.ping)
+        else:
+            warn_once("Redis cold runs need restart_command; running warm instead")
+
+    def prepare_cache(self):
+        with self.wire.pause():
+            self.reset_cache(self.cache_state)
+
+    def commandstats_usec(self):
+        with self.wire.pause():
+            stats = self.connection.info('commandstats')
+        # INFO itself shows up in commandstats, leave it out
+        return sum(entry['usec'] for command, entry in stats.items() if command != 'cmdstat_info')
+
+    def before_iteration(self):
+        self.prepare_cache()
+        if self.server_timing:
+            self._usec_mark = self.commandstats_usec()
+
+    def record_server_time(self):
+        if self.server_timing:
+            self.server_times.append((self.commandstats_usec() - self._usec_mark) / 1e6)
+
     def load_data_to_redis(self, file_path, redis_key):
         with open(file_path, 'r', newline='', encoding='utf-8') as csvfile:
             csv_reader = csv.reader(csvfile)
@@ -41,17 +112,123 @@ class RedisConnection:
                 redis_key_value = record[keys[0]]
                 self.connection.hmset(f"{redis_key}:{redis_key_value}", record)
 
-    def insert_data(self):
-        self.load_data_to_redis('countries.csv', 'countries')
-        self.load_data_to_redis('users.csv', 'users')
-        self.load_data_to_redis('merchants.csv', 'merchants')
-        self.load_data_to_redis('orders.csv', 'orders')
-        self.load_data_to_redis('products.csv', 'products')
-        self.load_data_to_redis('order_items.csv', 'order_items')
+    def insert_data(self, data_dir='.'):
+        self.load_data_to_redis(os.path.join(data_dir, 'countries.csv'), 'countries')
+        self.load_data_to_redis(os.path.join(data_dir, 'users.csv'), 'users')
+        self.load_data_to_redis(os.path.join(data_dir, 'merchants.csv'), 'merchants')
+        self.load_data_to_redis(os.path.join(data_dir, 'orders.csv'), 'orders')
+        self.load_data_to_redis(os.path.join(data_dir, 'products.csv'), 'products')
+        self.load_data_to_redis(os.path.join(data_dir, 'order_items.csv'), 'order_items')
 
     def clear_db(self):
         self.connection.flushdb()
 
+    def get_fingerprint(self):
+        return self.connection.get('_dataset_meta:fingerprint')
+
+    def set_fingerprint(self, fingerprint):
+        self.connection.set('_dataset_meta:fingerprint', fingerprint)
+
+    def drop_indexes(self):
+        keys = list(self.connection.scan_iter('*_index:*', count=1000))
+        for i in range(0, len(keys), 1000):
+            self.connection.delete(*keys[i:i + 1000])
+        self.indexed_fields = set()
+
+    def find_indexed_fields(self):
+        # The hand-built indexes are plain sets, so writers have to maintain them; find which ones exist
+        self.indexed_fields = set()
+        for key in self.connection.scan_iter('*_index:*', count=1000):
+            data_type, field = key.split(':')[0][:-len('_index')], key.split(':')[1]
+            self.indexed_fields.add((data_type, field))
+        return self.indexed_fields
+
+    def index_sizes(self):
+        # MEMORY USAGE of every index set, summed per index (data_type_index:field)
+        keys = list(self.connection.scan_iter('*_index:*', count=1000))
+        pipe = self.connection.pipeline(transaction=False)
+        for key in keys:
+            pipe.memory_usage(key)
+        sizes = {}
+        for key, size in zip(keys, pipe.execute()):
+            index = ':'.join(key.split(':')[:2])
+            sizes[index] = sizes.get(index, 0) + (size or 0)
+        return sizes
+
+    def order_index_fields(self):
+        return [field for data_type, field in self.indexed_fields if data_type == 'orders']
+
+    def insert_order(self, order):
+        record = dict(zip(['order_id', 'user_id', 'status', 'created_at'], [str(value) for value in order]))
+        key = f"orders:{record['order_id']}"
+        pipe = self.connection.pipeline()
+        pipe.hset(key, mapping=record)
+        for field in self.order_index_fields():
+            if ('orders', field) in SORTED_INDEXES:
+                pipe.zadd(f"orders_index:{field}", {order_time_member(record['created_at'], record['order_id']): 0})
+            else:
+                pipe.sadd(f"orders_index:{field}:{record[field]}", key)
+        pipe.execute()
+
+    def update_order_status(self, order_id, status):
+        key = f"orders:{order_id}"
+        if 'status' not in self.order_index_fields():
+            self.connection.hset(key, 'status', status)
+            return
+        old_status = self.connection.hget(key, 'status')
+        pipe = self.connection.pipeline()
+        pipe.hset(key, 'status', status)
+        pipe.srem(f"orders_index:status:{old_status}", key)
+        pipe.sadd(f"orders_index:status:{status}", key)
+        pipe.execute()
+
+    def delete_order(self, order_id):
+        key = f"orders:{order_id}"
+        fields = self.order_index_fields()
+        if not fields:
+            self.connection.delete(key)
+            return
+        values = self.connection.hmget(key, fields)
+        pipe = self.connection.pipeline()
+        pipe.delete(key)
+        for field, value in zip(fields, values):
+            if ('orders', field) in SORTED_INDEXES:
+                pipe.zrem(f"orders_index:{field}", order_time_member(value, order_id))
+            else:
+                pipe.srem(f"orders_index:{field}:{value}", key)
+        pipe.execute()
+
+    def rdb_path(self):
+        config = self.connection.config_get('dir')
+        config.update(self.connection.config_get('dbfilename'))
+        return os.path.join(config['dir'], config['dbfilename'])
+
+    def snapshot_path(self, name):
+        return os.path.join(self.snapshot_dir, f"{name}.rdb")
+
+    def has_snapshot(self, name):
+        return os.path.exists(self.snapshot_path(name))
+
+    def snapshot(self, name):
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        self.connection.save()
+        shutil.copy2(self.rdb_path(), self.snapshot_path(name))
+        print(f"Redis snapshot {name} written to {self.snapshot_path(name)}")
+
+    def restore(self, name):
+        shutil.copy2(self.snapshot_path(name), self.rdb_path())
+        try:
+            # Replaces the dataset with the RDB file on disk without saving the current one first
+            self.connection.execute_command('DEBUG', 'RELOAD', 'NOSAVE')
+        except redis.ResponseError as e:
+            if not self.restart_command:
+                raise
+            print(f"DEBUG RELOAD unavailable ({e}), restarting Redis instead")
+            # Otherwise the shutdown would save the current dataset over the copied file
+            self.connection.config_set('save', '')
+            restart_server(self.restart_command, self.connection.ping)
+        print(f"Redis snapshot {name} restored")
+
     def create_index(self, data_type, field):
         index_key = f'{data_type}_index:{field}'
 
@@ -59,14 +236,83 @@ class RedisConnection:
             data = self.connection.hgetall(key)
             field_value = data.get(field, '')
             self.connection.sadd(f'{index_key}:{field_value}', key)
+        self.indexed_fields.add((data_type, field))
+
+    def create_sorted_index(self, data_type, field, entry):
+        # entry(data) gives the (member, score) of one hash in the sorted set data_type_index:field
+        index_key = f'{data_type}_index:{field}'
+
+        for key in self.connection.keys(f'{data_type}:*'):
+            member, score = entry(key, self.connection.hgetall(key))
+            self.connection.zadd(index_key, {member: score})
+        self.indexed_fields.add((data_type, field))
+
+    def create_text_index(self, data_type, field):
+        # Inverted index: a set of hash keys per word (fulltext:data_type:field:word) and every word in a
+        # score-0 sorted set for prefix lookups. Kept outside the *_index:* keys the query indexes use.
+        index_key = f'fulltext:{data_type}:{field}'
+
+        for key in self.connection.keys(f'{data_type}:*'):
+            for word in set(tokens(self.connection.hget(key, field))):
+                self.connection.sadd(f'{index_key}:{word}', key)
+                self.connection.zadd(f'fulltext_terms:{data_type}:{field}', {word: 0})
+
+    def drop_text_indexes(self):
+        keys = list(self.connection.scan_iter('fulltext*', count=1000))
+        for i in range(0, len(keys), 1000):
+            self.connection.delete(*keys[i:i + 1000])
+
+    def text_search(self, data_type, field, kind, value, use_index=True):
+        if not use_index:
+            rows = [self.connection.hgetall(key) for key in self.connection.keys(f'{data_type}:*')]
+            return [row for row in rows if matches(kind, value, row.get(field, ''))]
+        index_key = f'fulltext:{data_type}:{field}'
+        if kind == 'prefix':
+            # U+FFFF sorts after every word that starts with the prefix once encoded as UTF-8
+            words = self.connection.zrangebylex(f'fulltext_terms:{data_type}:{field}', f'[{value}',
+                                                f'[{value}\uffff')
+            keys = self.connection.sunion([f'{index_key}:{word}' for word in words]) if words else set()
+        else:
+            words = tokens(value)
+            # SINTER needs at least one key; a value without words matches nothing in the index
+            keys = self.connection.sinter([f'{index_key}:{word}' for word in words]) if words else set()
+        rows = [self.connection.hgetall(key) for key in keys]
+        if kind == 'phrase':
+            # The intersection only has every word somewhere in the text; adjacency is checked on the client
+            return [row for row in rows if matches(kind, value, row.get(field, ''))]
+        return rows
+
+    def merchant_revenue(self):
+        # Revenue per merchant id from the hashes, as q7 computes it without an index
+        prices = {}
+        merchant_of = {}
+        for key in self.connection.keys('products:*'):
+            product = self.connection.hgetall(key)
+            prices[product['product_id']] = float(product['price'])
+            merchant_of[product['product_id']] = product['merchant_id']
+        revenue = {}
+        for key in self.connection.keys('order_items:*'):
+            item = self.connection.hgetall(key)
+            merchant_id = merchant_of.get(item['product_id'])
+            if merchant_id is not None:
+                revenue[merchant_id] = revenue.get(merchant_id, 0) + prices[item['product_id']] * int(item['quantity'])
+        return revenue
 
     def create_indexes(self):
         self.create_index('countries', 'continent_name')
         self.create_index('users', 'country_code')
         self.create_index('products', 'merchant_id', )
         self.create_index('orders', 'status')
-
-    def q1(self):
+        # Sorted sets for the range, pagination and top-N queries
+        self.create_sorted_index('products', 'price', lambda key, data: (key, int(data['price'])))
+        self.create_sorted_index('orders', 'created_at',
+                                 lambda key, data: (order_time_member(data['created_at'], data['order_id']), 0))
+        # A leaderboard: revenue only changes with order_items, which the write workload does not touch
+        for merchant_id, revenue in self.merchant_revenue().items():
+            self.connection.zadd('merchants_index:revenue', {f'merchants:{merchant_id}': revenue})
+        self.indexed_fields.add(('merchants', 'revenue'))
+
+    def q1(self, continent='North America'):
         start_time = time.time()
         user_keys = self.connection.keys('users:*')
         country_keys = self.connection.keys('countries:*')
@@ -74,7 +320,7 @@ class RedisConnection:
         users_data = [self.connection.hgetall(key) for key in user_keys]
         countries_data = [self.connection.hgetall(key) for key in country_keys]
 
-        filtered_countries = [country for country in countries_data if country['continent_name'] == 'North America']
+        filtered_countries = [country for country in countries_data if country['continent_name'] == continent]
 
         filtered_country_codes = [country['country_code'] for country in filtered_countries]
 
@@ -85,7 +331,7 @@ class RedisConnection:
         execution_time = end_time - start_time
         return result, execution_time
 
-    def q2(self):
+    def q2(self, status='Shipped'):
         start_time = time.time()
         # Get all keys for orders, users, order_items, and products
         order_keys = self.connection.keys('orders:*')
@@ -100,7 +346,7 @@ class RedisConnection:
         products_data = [self.connection.hgetall(key) for key in product_keys]
 
         # Filter orders by status
-        filtered_orders = [order for order in orders_data if order['status'] == 'Shipped']
+        filtered_orders = [order for order in orders_data if order['status'] == status]
 
         # Initialize result list
         result = []
@@ -131,7 +377,7 @@ class RedisConnection:
         execution_time = end_time - start_time
         return result, execution_time
 
-    def q3(self):
+    def q3(self, merchant_id=None):
         start_time = time.time()
         merchant_keys = self.connection.keys('merchants:*')
         product_keys = self.connection.keys('products:*')
@@ -139,6 +385,8 @@ class RedisConnection:
 
         # Fetch all merchants, products, and order_items data
         merchants_data = [self.connection.hgetall(key) for key in merchant_keys]
+        if merchant_id is not None:
+            merchants_data = [merchant for merchant in merchants_data if merchant['merchant_id'] == str(merchant_id)]
         products_data = [self.connection.hgetall(key) for key in product_keys]
         order_items_data = [self.connection.hgetall(key) for key in order_item_keys]
 
@@ -167,7 +415,7 @@ class RedisConnection:
         execution_time = end_time - start_time
         return result, execution_time
 
-    def q4(self):
+    def q4(self, user_id=None):
         start_time = time.time()
         user_keys = self.connection.keys('users:*')
         order_keys = self.connection.keys('orders:*')
@@ -175,6 +423,8 @@ class RedisConnection:
         product_keys = self.connection.keys('products:*')
 
         users_data = [self.connection.hgetall(key) for key in user_keys]
+        if user_id is not None:
+            users_data = [user for user in users_data if user['user_id'] == str(user_id)]
         orders_data = [self.connection.hgetall(key) for key in order_keys]
         order_items_data = [self.connection.hgetall(key) for key in order_item_keys]
         products_data = [self.connection.hgetall(key) for key in product_keys]
@@ -210,6 +460,47 @@ class RedisConnection:
         execution_time = end_time - start_time
         return result, execution_time
 
+    def q5(self, min_price=50):
+        start_time = time.time()
+        products_data = [self.connection.hgetall(key) for key in self.connection.keys('products:*')]
+        result = [(product['product_id'], product['name'], product['price']) for product in products_data
+                  if min_price <= int(product['price']) < min_price + PRICE_BAND]
+        end_time = time.time()
+        execution_time = end_time - start_time
+        return result, execution_time
+
+    def q6(self, since=None):
+        start_time = time.time()
+        orders_data = [self.connection.hgetall(key) for key in self.connection.keys('orders:*')]
+        result = [(order['order_id'], order['user_id'], order['status'], order['created_at'])
+                  for order in orders_data if since is None or order['created_at'] >= since]
+        end_time = time.time()
+        execution_time = end_time - start_time
+        return result, execution_time
+
+    def q7(self, limit=10):
+        start_time = time.time()
+        revenue = self.merchant_revenue()
+        top = sorted(revenue.items(), key=lambda item: item[1], reverse=True)[:limit]
+        result = [(merchant_id, self.connection.hget(f'merchants:{merchant_id}', 'merchant_name'), total_revenue)
+                  for merchant_id, total_revenue in top]
+        end_time = time.time()
+        execution_time = end_time - start_time
+        return result, execution_time
+
+    def q8(self, after=None):
+        start_time = time.time()
+        orders_data = [self.connection.hgetall(key) for key in self.connection.keys('orders:*')]
+        orders_data.sort(key=lambda order: (order['created_at'], int(order['order_id'])))
+        if after is not None:
+            orders_data = [order for order in orders_data
+                           if (order['created_at'], int(order['order_id'])) > tuple(after)]
+        result = [(order['order_id'], order['user_id'], order['status'], order['created_at'])
+                  for order in orders_data[:PAGE_SIZE]]
+        end_time = time.time()
+        execution_time = end_time - start_time
+        return result, execution_time
+
     def q1_indexed(self, continent_filter):
         start_time = time.time()
         country_keys = self.connection.smembers(f'countries_index:continent_name:{continent_filter}')
@@ -262,10 +553,10 @@ class RedisConnection:
         execution_time = end_time - start_time
         return result, execution_time
 
-    def q3_indexed(self):
+    def q3_indexed(self, merchant_id=None):
         start_time = time.time()
 
-        merchant_keys = self.connection.keys('merchants:*')
+        merchant_keys = self.connection.keys('merchants:*') if merchant_id is None else [f'merchants:{merchant_id}']
         merchants_data = [self.connection.hgetall(key) for key in merchant_keys]
 
         order_item_keys = self.connection.keys('order_items:*')
@@ -292,9 +583,9 @@ class RedisConnection:
         execution_time = end_time - start_time
         return result, execution_time
 
-    def q4_indexed(self):
+    def q4_indexed(self, user_id=None):
         start_time = time.time()
-        user_keys = self.connection.keys('users:*')
+        user_keys = self.connection.keys('users:*') if user_id is None else [f'users:{user_id}']
         order_keys = self.connection.keys('orders:status:*')
         order_item_keys = self.connection.keys('order_items:*')
         product_keys = self.connection.keys('products:*')
@@ -325,33 +616,76 @@ class RedisConnection:
         execution_time = end_time - start_time
         return result, execution_time
 
-    def complex_query_tester(self):
+    def q5_indexed(self, min_price=50):
+        start_time = time.time()
+        product_keys = self.connection.zrangebyscore('products_index:price', min_price,
+                                                     f'({min_price + PRICE_BAND}')
+        products_data = [self.connection.hgetall(key) for key in product_keys]
+        result = [(product['product_id'], product['name'], product['price']) for product in products_data]
+        end_time = time.time()
+        execution_time = end_time - start_time
+        return result, execution_time
 
-        que_exe_avg = []
+    def q6_indexed(self, since=None):
+        start_time = time.time()
+        members = self.connection.zrangebylex('orders_index:created_at', '-' if since is None else f'[{since}', '+')
+        orders_data = [self.connection.hgetall(order_key_of(member)) for member in members]
+        result = [(order['order_id'], order['user_id'], order['status'], order['created_at'])
+                  for order in orders_data]
+        end_time = time.time()
+        execution_time = end_time - start_time
+        return result, execution_time
 
-        q1 = []
-        for x in range(10):
-            q1.append(self.q1()[1])
-        que_exe_avg.append(sum(q1) / 10)
+    def q7_indexed(self, limit=10):
+        start_time = time.time()
+        top = self.connection.zrevrange('merchants_index:revenue', 0, limit - 1, withscores=True)
+        result = [(key.split(':')[1], self.connection.hget(key, 'merchant_name'), total_revenue)
+                  for key, total_revenue in top]
+        end_time = time.time()
+        execution_time = end_time - start_time
+        return result, execution_time
 
-        q2 = []
-        for x in range(10):
-            q2.append(self.q2()[1])
-        que_exe_avg.append(sum(q2) / 10)
+    def q8_indexed(self, after=None):
+        start_time = time.time()
+        # Exclusive lower bound just past the cursor's own member
+        start = '-' if after is None else f'({order_time_member(*after)}'
+        members = self.connection.zrangebylex('orders_index:created_at', start, '+', start=0, num=PAGE_SIZE)
+        orders_data = [self.connection.hgetall(order_key_of(member)) for member in members]
+        result = [(order['order_id'], order['user_id'], order['status'], order['created_at'])
+                  for order in orders_data]
+        end_time = time.time()
+        execution_time = end_time - start_time
+        return result, execution_time
 
-        q3 = []
-        for x in range(10):
-            q3.append(self.q3()[1])
-        que_exe_avg.append(sum(q3) / 10)
+    def measure(self, name, func):
+        self.wire.reset()
+        self.server_times = []
+        exe_time = self.sampler.collect(func, self.before_iteration, self.record_server_time)
+        self.samples[name] = exe_time
+        self.wire_stats[name] = self.wire.per_iteration(len(exe_time))
+        self.breakdowns[name] = time_breakdown(exe_time, self.sampler.cpu_samples, self.server_times)
+        return sum(exe_time) / len(exe_time)
 
-        q4 = []
-        for x in range(10):
-            q4.append(self.q4()[1])
-        que_exe_avg.append(sum(q4) / 10)
+    def complex_query_tester(self, params=None):
+        # params maps query names to workload.ParameterStreams; without them the default literals are used
+
+        que_exe_avg = []
+        self.samples = {}
+        self.wire_stats = {}
+        self.breakdowns = {}
+
+        que_exe_avg.append(self.measure('q1', bind(self.q1, 'q1', params)))
+        que_exe_avg.append(self.measure('q2', bind(self.q2, 'q2', params)))
+        que_exe_avg.append(self.measure('q3', bind(self.q3, 'q3', params)))
+        que_exe_avg.append(self.measure('q4', bind(self.q4, 'q4', params)))
+        que_exe_avg.append(self.measure('q5', bind(self.q5, 'q5', params)))
+        que_exe_avg.append(self.measure('q6', bind(self.q6, 'q6', params)))
+        que_exe_avg.append(self.measure('q7', bind(self.q7, 'q7', params)))
+        que_exe_avg.append(self.measure('q8', bind(self.q8, 'q8', params)))
 
         return que_exe_avg
 
-    def execute_all_queries(self):
+    def execute_all_queries(self, params=None):
         # results = {}
         #
         # result_q1, time_q1 = self.q1_indexed('North America')
@@ -370,25 +704,17 @@ class RedisConnection:
         # results['q4'] = {'result': result_q4, 'execution_time': time_q4}
         # print(time_q4)
         que_exe_avg = []
-
-        q1 = []
-        for x in range(10):
-            q1.append(self.q1_indexed('North America')[1])
-        que_exe_avg.append(sum(q1) / 10)
-
-        q2 = []
-        for x in range(10):
-            q2.append(self.q2_indexed('Shipped')[1])
-        que_exe_avg.append(sum(q2) / 10)
-
-        q3 = []
-        for x in range(10):
-            q3.append(self.q3_indexed()[1])
-        que_exe_avg.append(sum(q3) / 10)
-
-        q4 = []
-        for x in range(10):
-            q4.append(self.q4_indexed()[1])
-        que_exe_avg.append(sum(q4) / 10)
+        self.samples = {}
+        self.wire_stats = {}
+        self.breakdowns = {}
+
+        que_exe_avg.append(self.measure('q1', bind(self.q1_indexed, 'q1', params)))
+        que_exe_avg.append(self.measure('q2', bind(self.q2_indexed, 'q2', params)))
+        que_exe_avg.append(self.measure('q3', bind(self.q3_indexed, 'q3', params)))
+        que_exe_avg.append(self.measure('q4', bind(self.q4_indexed, 'q4', params)))
+        que_exe_avg.append(self.measure('q5', bind(self.q5_indexed, 'q5', params)))
+        que_exe_avg.append(self.measure('q6', bind(self.q6_indexed, 'q6', params)))
+        que_exe_avg.append(self.measure('q7', bind(self.q7_indexed, 'q7', params)))
+        que_exe_avg.append(self.measure('q8', bind(self.q8_indexed, 'q8', params)))
 
         return que_exe_avg
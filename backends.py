@@ -0,0 +1,575 @@
+import os
+import shutil
+import time
+
+from Cassandra import TABLE_OPTION_MATRIX, CassandraConnector, option_matrix
+from fake_data_inserter import TABLE_COLUMNS
+from MongoDBConnection import MongoDBConnection
+from MySQLConnection import HASH_PARTITIONS, PROTOCOL_MODES, QUERY_VARIANTS, MySQLConnection
+from Neo4jConnection import Neo4jConnection
+from RedisConnection import RedisConnection
+from reference_engine import ReferenceEngine
+from text_search import KINDS, TEXT_COLUMNS
+
+INDEX_CONFIGS = ['none', 'indexed']
+
+
+class Backend:
+    # Uniform driver-facing wrapper around one connector, used by DB_performace_checker
+    name = None
+    # In-process engines keep their data in the benchmarking process, so the load phase cannot fill them
+    in_process = False
+    writable = True
+    # Whether the engine has a text index for text_search.py, and which kinds of search it can answer
+    full_text = True
+    text_kinds = KINDS
+    # Query name -> alternative formulations, for engines whose queries can be rewritten (the variants phase)
+    query_variants = {}
+    # Client protocol settings the protocol phase cycles through, see set_protocol
+    protocol_modes = []
+    # Whether scan_table can split a full table read into parallel ones (the scan phase)
+    parallel_scan = False
+    # Index configurations apply_index_config knows; the others in the config are skipped for this backend
+    index_configs = INDEX_CONFIGS
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.connection = None
+        # Build time and per-index sizes of the last applied index configuration
+        self.index_build = None
+
+    def connect(self):
+        raise NotImplementedError
+
+    def close(self):
+        self.connection.close()
+
+    def get_fingerprint(self):
+        raise NotImplementedError
+
+    def set_fingerprint(self, fingerprint):
+        raise NotImplementedError
+
+    def load(self, data_dir):
+        raise NotImplementedError
+
+    def append(self, data_dir):
+        # Adds the rows in data_dir to what is loaded, without clearing it first
+        raise NotImplementedError
+
+    def load_dataset(self, data_dir, fingerprint, force=False):
+        # Skips the reload when the database already holds this exact dataset
+        if not force and self.get_fingerprint() == fingerprint:
+            return False
+        self.load(data_dir)
+        # Written last, so an interrupted load is never mistaken for a complete one
+        self.set_fingerprint(fingerprint)
+        return True
+
+    def apply_index_config(self, index_config):
+        raise NotImplementedError
+
+    def create_indexes(self):
+        raise NotImplementedError
+
+    def wait_for_indexes(self):
+        # Engines whose index DDL returns before the build is done override this
+        pass
+
+    def index_sizes(self, index_config):
+        raise NotImplementedError
+
+    def build_indexes(self, index_config):
+        # Times the index DDL until every build has finished, then measures the size of each index
+        seconds = 0.0
+        if index_config != 'none':
+            start = time.perf_counter()
+            self.create_indexes()
+            self.wait_for_indexes()
+            seconds = time.perf_counter() - start
+        self.index_build = {'seconds': seconds, 'sizes': self.index_sizes(index_config)}
+        return self.index_build
+
+    def run_queries(self, index_config, params=None):
+        raise NotImplementedError
+
+    def run_query_variant(self, index_config, query, variant, params=None):
+        # Samples one formulation of query and returns its plan
+        raise NotImplementedError
+
+    def set_protocol(self, mode):
+        # Applies one of protocol_modes ({} restores the configured one) and returns a description for the results
+        raise NotImplementedError
+
+    def scan_table(self, table, parallel=False):
+        # Iterator over every row of a base table
+        raise NotImplementedError
+
+    def scan_settings(self):
+        # How parallel scans are split and paged, stored with the scan phase's results
+        return {}
+
+    def table_option_sets(self):
+        # Physical table option combinations the table_options phase cycles through, see set_table_options
+        return []
+
+    def set_table_options(self, options):
+        # Applies one of table_option_sets ({} restores the configured options) and brings the tables to a
+        # comparable on-disk state; returns a description with the table sizes for the results
+        raise NotImplementedError
+
+    def has_snapshot(self, name):
+        return self.connection.has_snapshot(name)
+
+    def storage_stats(self, index_config):
+        # Per-table on-disk and in-memory footprint after the queries ran; None where the engine has no such view
+        return None
+
+    def create_text_indexes(self):
+        raise NotImplementedError
+
+    def drop_text_indexes(self):
+        raise NotImplementedError
+
+    def text_search(self, table, column, kind, value, use_index=True):
+        # Rows of table whose column matches; use_index=False is the LIKE/regex scan the index is compared with
+        raise NotImplementedError
+
+    def prepare_writes(self, index_config):
+        pass
+
+    def insert_order(self, order):
+        self.connection.insert_order(order)
+
+    def update_order_status(self, order_id, status):
+        self.connection.update_order_status(order_id, status)
+
+    def delete_order(self, order_id):
+        self.connection.delete_order(order_id)
+
+    def snapshot(self, name):
+        self.connection.snapshot(name)
+
+    def restore(self, name):
+        self.connection.restore(name)
+
+
+class MySQLBackend(Backend):
+    name = 'mysql'
+    query_variants = QUERY_VARIANTS
+    protocol_modes = PROTOCOL_MODES
+    # Key of MySQLConnection.SCHEMAS the tables are created with
+    schema = 'varchar'
+
+    def connect(self):
+        self.connection = MySQLConnection(self.settings.get('host', 'localhost'), self.settings.get('user', 'root'),
+                                          self.settings.get('password', 'admin'), "", self.schema,
+                                          self.settings.get('partitioning'),
+                                          self.settings.get('hash_partitions', HASH_PARTITIONS),
+                                          self.settings.get('use_pure'))
+        return self.connection.connect() is not None
+
+    def database_for(self, index_config):
+        # The unindexed tables stay in the loaded database, the indexed copy lives in its new_ twin
+        return self.connection.indexed_db if index_config == 'indexed' else self.connection.trade_db
+
+    def get_fingerprint(self):
+        return self.connection.get_fingerprint()
+
+    def set_fingerprint(self, fingerprint):
+        self.connection.set_fingerprint(fingerprint)
+
+    def load(self, data_dir):
+        self.connection.createtables(data_dir)
+        # The indexed copy would be stale after a reload
+        self.connection.execute_query(f"DROP DATABASE IF EXISTS `{self.connection.indexed_db}`")
+        self.connection.insert_from_csv(data_dir)
+
+    def append(self, data_dir):
+        self.connection.execute_query(f"DROP DATABASE IF EXISTS `{self.connection.indexed_db}`")
+        self.connection.insert_from_csv(data_dir)
+
+    def apply_index_config(self, index_config):
+        if index_config == 'indexed':
+            self.connection.copy_database()
+        self.build_indexes(index_config)
+
+    def create_indexes(self):
+        self.connection.create_index()
+
+    def index_sizes(self, index_config):
+        return self.connection.index_sizes(self.database_for(index_config))
+
+    def storage_stats(self, index_config):
+        return self.connection.storage_stats(self.database_for(index_config))
+
+    def run_queries(self, index_config, params=None):
+        return self.connection.complex_query_test(self.database_for(index_config), params)
+
+    def run_query_variant(self, index_config, query, variant, params=None):
+        return self.connection.query_variant_test(self.database_for(index_config), query, variant, params)
+
+    def set_protocol(self, mode):
+        # Settings missing from mode come from the config, so {} goes back to what the other phases use
+        statement = ('prepared' if self.settings.get('prepared') else
+                     'text_reused' if self.settings.get('reuse_cursor') else 'text')
+        configured = {'use_pure': self.settings.get('use_pure'), 'statement': statement,
+                      'buffered': bool(self.settings.get('buffered'))}
+        return self.connection.set_protocol(**dict(configured, **mode))
+
+    def restore(self, name):
+        self.connection.restore(name)
+        self.connection.execute_query(f"DROP DATABASE IF EXISTS `{self.connection.indexed_db}`")
+
+    def prepare_writes(self, index_config):
+        # Writes go to the same database the queries of this index config read
+        self.connection.execute_query(f"USE `{self.database_for(index_config)}`")
+
+    def create_text_indexes(self):
+        self.connection.create_text_indexes(self.connection.trade_db, TEXT_COLUMNS)
+
+    def drop_text_indexes(self):
+        self.connection.drop_text_indexes(self.connection.trade_db, TEXT_COLUMNS)
+
+    def text_search(self, table, column, kind, value, use_index=True):
+        return self.connection.text_search(self.connection.trade_db, table, column, kind, value, use_index)
+
+
+class MySQLCompactBackend(MySQLBackend):
+    # Same data and queries on the compact schema (DATETIME/DATE, ENUMs, right-sized integers), in its own
+    # databases, so both schemas can be loaded and benchmarked side by side
+    name = 'mysql_compact'
+    schema = 'compact'
+
+
+class MongoBackend(Backend):
+    name = 'mongodb'
+    text_kinds = ['term', 'phrase']
+
+    @property
+    def database(self):
+        return self.settings.get('database', 'trade')
+
+    def connect(self):
+        self.connection = MongoDBConnection(self.settings.get('uri', 'mongodb://localhost:27017'))
+        return self.connection.connect() is not None
+
+    def get_fingerprint(self):
+        return self.connection.get_fingerprint(self.database)
+
+    def set_fingerprint(self, fingerprint):
+        self.connection.set_fingerprint(self.database, fingerprint)
+
+    def load(self, data_dir):
+        self.connection.insert_from_file(self.database, data_dir)
+
+    def append(self, data_dir):
+        self.connection.insert_from_file(self.database, data_dir, append=True)
+
+    def apply_index_config(self, index_config):
+        self.connection.drop_indexes(self.database)
+        self.build_indexes(index_config)
+
+    def create_indexes(self):
+        self.connection.create_index(self.database)
+
+    def wait_for_indexes(self):
+        self.connection.wait_for_index_builds(self.database)
+
+    def index_sizes(self, index_config):
+        return self.connection.index_sizes(self.database)
+
+    def run_queries(self, index_config, params=None):
+        return self.connection.complex_queries(self.database, params)
+
+    def snapshot(self, name):
+        self.connection.snapshot(name, self.database)
+
+    def restore(self, name):
+        self.connection.restore(name, self.database)
+
+    def insert_order(self, order):
+        self.connection.insert_order(self.database, order)
+
+    def update_order_status(self, order_id, status):
+        self.connection.update_order_status(self.database, order_id, status)
+
+    def delete_order(self, order_id):
+        self.connection.delete_order(self.database, order_id)
+
+    def create_text_indexes(self):
+        self.connection.create_text_indexes(self.database, TEXT_COLUMNS)
+
+    def drop_text_indexes(self):
+        self.connection.drop_text_indexes(self.database, TEXT_COLUMNS)
+
+    def text_search(self, table, column, kind, value, use_index=True):
+        return self.connection.text_search(self.database, table, column, kind, value, use_index)
+
+
+class RedisBackend(Backend):
+    name = 'redis'
+
+    def connect(self):
+        self.connection = RedisConnection(self.settings.get('host', 'localhost'), self.settings.get('port', 6379),
+                                          self.settings.get('password', ''))
+        return self.connection.connect() is not None
+
+    def get_fingerprint(self):
+        return self.connection.get_fingerprint()
+
+    def set_fingerprint(self, fingerprint):
+        self.connection.set_fingerprint(fingerprint)
+
+    def load(self, data_dir):
+        self.connection.clear_db()
+        self.connection.insert_data(data_dir)
+
+    def append(self, data_dir):
+        self.connection.insert_data(data_dir)
+
+    def apply_index_config(self, index_config):
+        self.connection.drop_indexes()
+        self.build_indexes(index_config)
+
+    def create_indexes(self):
+        self.connection.create_indexes()
+
+    def index_sizes(self, index_config):
+        return self.connection.index_sizes()
+
+    def run_queries(self, index_config, params=None):
+        if index_config == 'indexed':
+            return self.connection.execute_all_queries(params)
+        return self.connection.complex_query_tester(params)
+
+    def prepare_writes(self, index_config):
+        self.connection.find_indexed_fields()
+
+    def create_text_indexes(self):
+        for table, column in TEXT_COLUMNS:
+            self.connection.create_text_index(table, column)
+
+    def drop_text_indexes(self):
+        self.connection.drop_text_indexes()
+
+    def text_search(self, table, column, kind, value, use_index=True):
+        return self.connection.text_search(table, column, kind, value, use_index)
+
+
+class Neo4jBackend(Backend):
+    name = 'neo4j'
+
+    def connect(self):
+        self.connection = Neo4jConnection(self.settings.get('uri', 'bolt://localhost:7687'),
+                                          self.settings.get('user', 'neo4j'),
+                                          self.settings.get('password', 'adminadmin'))
+        return self.connection.connect() is not None
+
+    def get_fingerprint(self):
+        return self.connection.get_fingerprint()
+
+    def set_fingerprint(self, fingerprint):
+        self.connection.set_fingerprint(fingerprint)
+
+    def copy_to_import_dir(self, data_dir):
+        # LOAD CSV reads file:/// URLs from the server's import directory. Without it the load would read whatever
+        # CSV files are already there and stamp them with the new fingerprint.
+        import_dir = self.settings.get('import_dir')
+        if not import_dir:
+            raise RuntimeError("Neo4j loads need import_dir, the server's import directory")
+        for table in TABLE_COLUMNS:
+            shutil.copy(os.path.join(data_dir, f"{table}.csv"), import_dir)
+
+    def load(self, data_dir):
+        self.copy_to_import_dir(data_dir)
+        self.connection.clear_db()
+        self.connection.insert_data()
+
+    def append(self, data_dir):
+        # Relationships of the new rows are MERGEd against nodes that are already there
+        self.copy_to_import_dir(data_dir)
+        self.connection.insert_data()
+
+    def apply_index_config(self, index_config):
+        self.connection.drop_indexes()
+        self.build_indexes(index_config)
+
+    def create_indexes(self):
+        self.connection.create_indexes()
+
+    def wait_for_indexes(self):
+        self.connection.wait_for_indexes()
+
+    def index_sizes(self, index_config):
+        return self.connection.index_sizes()
+
+    def run_queries(self, index_config, params=None):
+        return self.connection.complex_queries_test(params)
+
+    def create_text_indexes(self):
+        self.connection.create_text_indexes(TEXT_COLUMNS)
+
+    def drop_text_indexes(self):
+        self.connection.drop_text_indexes(TEXT_COLUMNS)
+
+    def text_search(self, table, column, kind, value, use_index=True):
+        return self.connection.text_search(table, column, kind, value, use_index)
+
+
+class CassandraBackend(Backend):
+    name = 'cassandra'
+    text_kinds = ['term', 'phrase']
+    parallel_scan = True
+    # Index configuration -> CassandraConnector index flavor; 'indexed' keeps the original secondary indexes
+    flavors = {'indexed': 'legacy', 'indexed_sai': 'sai', 'indexed_mv': 'mv'}
+    index_configs = ['none'] + list(flavors)
+
+    @property
+    def keyspace(self):
+        return self.settings.get('keyspace', 'trade')
+
+    def connect(self):
+        self.connection = CassandraConnector(self.settings.get('contact_points', ['localhost']),
+                                             self.settings.get('port', 9042))
+        try:
+            self.connection.connect()
+        except Exception as e:
+            print(f"Error: {e}")
+            return False
+        if self.keyspace in self.connection.list_keyspaces():
+            self.connection.execute(f"USE {self.keyspace};")
+        return True
+
+    def close(self):
+        self.connection.disconnect()
+
+    def get_fingerprint(self):
+        return self.connection.get_fingerprint(self.keyspace)
+
+    def set_fingerprint(self, fingerprint):
+        self.connection.set_fingerprint(self.keyspace, fingerprint)
+
+    def load(self, data_dir):
+        self.connection.drop_keyspace(self.keyspace)
+        self.connection.create_keyspace(self.keyspace)
+        self.connection.execute(f"USE {self.keyspace};")
+        self.connection.create_tables()
+        self.connection.insert_data(data_dir)
+        # Row by row inserts leave a memtable and however many SSTables were flushed on the way
+        self.connection.compact(self.keyspace)
+
+    def append(self, data_dir):
+        self.connection.execute(f"USE {self.keyspace};")
+        self.connection.insert_data(data_dir)
+        self.connection.compact(self.keyspace)
+
+    def apply_index_config(self, index_config):
+        self.connection.drop_indexes(self.keyspace)
+        self.connection.index_flavor = self.flavors.get(index_config)
+        self.build_indexes(index_config)
+
+    def create_indexes(self):
+        self.connection.create_indexes(self.connection.index_flavor)
+
+    def wait_for_indexes(self):
+        self.connection.wait_for_indexes(self.keyspace)
+
+    def index_sizes(self, index_config):
+        return self.connection.index_sizes(self.keyspace)
+
+    def prepare_writes(self, index_config):
+        self.connection.find_query_tables(self.keyspace)
+
+    def run_queries(self, index_config, params=None):
+        if index_config in self.flavors:
+            self.connection.index_flavor = self.flavors[index_config]
+            return self.connection.indexed_query(params)
+        return self.connection.query(params)
+
+    def snapshot(self, name):
+        self.connection.snapshot(name, self.keyspace)
+
+    def restore(self, name):
+        self.connection.restore(name, self.keyspace)
+
+    def create_text_indexes(self):
+        self.connection.create_text_indexes(TEXT_COLUMNS)
+
+    def drop_text_indexes(self):
+        self.connection.drop_text_indexes(TEXT_COLUMNS)
+
+    def text_search(self, table, column, kind, value, use_index=True):
+        return self.connection.text_search(table, column, kind, value, use_index)
+
+    def scan_table(self, table, parallel=False):
+        return self.connection.scan(table, parallel=parallel)
+
+    def scan_settings(self):
+        return {'splits': self.connection.scan_splits, 'fetch_size': self.connection.scan_fetch_size}
+
+    def table_option_sets(self):
+        return option_matrix(self.settings.get('table_option_matrix') or TABLE_OPTION_MATRIX)
+
+    def set_table_options(self, options):
+        self.connection.set_table_options(self.keyspace, options)
+        seconds = self.connection.compact(self.keyspace)
+        return {'options': options, 'compaction_seconds': seconds, 'sizes': self.connection.table_sizes(self.keyspace)}
+
+
+class ReferenceBackend(Backend):
+    # NumPy column store: the lower bound for every query and the oracle other backends' results are checked against.
+    # Its 'indexed' configuration prebuilds the key lookup tables that the 'none' configuration builds per query.
+    name = 'reference'
+    in_process = True
+    writable = False
+    full_text = False
+
+    def connect(self):
+        self.connection = ReferenceEngine()
+        self.connection.store.chunk_rows = self.settings.get('chunk_rows', self.connection.store.chunk_rows)
+        return True
+
+    def get_fingerprint(self):
+        return self.connection.store.fingerprint
+
+    def set_fingerprint(self, fingerprint):
+        self.connection.store.fingerprint = fingerprint
+
+    def load(self, data_dir):
+        self.connection.store.load(data_dir)
+
+    def append(self, data_dir):
+        self.connection.store.append(data_dir)
+
+    def apply_index_config(self, index_config):
+        self.connection.store.drop_indexes()
+        self.build_indexes(index_config)
+
+    def create_indexes(self):
+        self.connection.store.create_indexes()
+
+    def index_sizes(self, index_config):
+        return self.connection.store.index_sizes()
+
+    def run_queries(self, index_config, params=None):
+        return self.connection.complex_queries(params)
+
+    def has_snapshot(self, name):
+        # Queries never change the arrays, so every configuration already starts from the loaded state
+        return True
+
+    def snapshot(self, name):
+        pass
+
+    def restore(self, name):
+        pass
+
+
+BACKENDS = {backend.name: backend for backend in
+            [MySQLBackend, MySQLCompactBackend, MongoBackend, RedisBackend, Neo4jBackend, CassandraBackend,
+             ReferenceBackend]}
+
+
+def make_backend(name, settings):
+    return BACKENDS[name](settings)
@@ -0,0 +1,59 @@
+import os
+import subprocess
+import time
+
+# Cache states a benchmark iteration can start from:
+#   cold       - data and plan caches evicted (server restart or engine-specific eviction)
+#   plan_cold  - plan/query caches cleared, data pages still cached
+#   warm       - nothing is touched between iterations
+CACHE_STATES = ['cold', 'plan_cold', 'warm']
+
+_warned = set()
+
+
+def warn_once(message):
+    if message not in _warned:
+        _warned.add(message)
+        print(f"Warning: {message}")
+
+
+def check_state(state):
+    if state not in CACHE_STATES:
+        raise ValueError(f"Unknown cache state {state!r}, expected one of {CACHE_STATES}")
+
+
+def drop_os_page_cache():
+    # Only has an effect when the database runs on this machine and we are allowed to write drop_caches
+    try:
+        os.sync()
+        with open('/proc/sys/vm/drop_caches', 'w') as f:
+            f.write('3\n')
+        return True
+    except OSError as e:
+        warn_once(f"could not drop the OS page cache ({e}); cold runs still hit cached files")
+        return False
+
+
+def run_command(command):
+    try:
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        return True
+    except (OSError, subprocess.CalledProcessError) as e:
+        warn_once(f"command {' '.join(command)} failed: {e}")
+        return False
+
+
+def restart_server(command, is_ready, timeout=120):
+    # command restarts the server (e.g. ['sudo', 'systemctl', 'restart', 'mysql']),
+    # is_ready is polled until it returns without raising
+    if not run_command(command):
+        return False
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            is_ready()
+            return True
+        except Exception:
+            time.sleep(1)
+    warn_once(f"server did not come back within {timeout}s after {' '.join(command)}")
+    return False
@@ -1,14 +1,131 @@
+import csv
+import hashlib
+import itertools
+import json
+import os
 import random
+import statistics
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
 
 from faker import Faker
 
 # Create a Faker instance
 fake = Faker()
 
+# Column order of every table, as used by the CSV files and the MySQL INSERTs
+TABLE_COLUMNS = {
+    'countries': ['country_code', 'name', 'continent_name'],
+    'users': ['user_id', 'full_name', 'email', 'gender', 'date_of_birth', 'country_code'],
+    'merchants': ['merchant_id', 'merchant_name', 'user_id', 'country_code'],
+    'orders': ['order_id', 'user_id', 'status', 'created_at'],
+    'products': ['product_id', 'merchant_id', 'name', 'price', 'status', 'created_at'],
+    'order_items': ['order_id', 'product_id', 'quantity'],
+}
+
+# Bump whenever a change to the generators alters the data produced for a given scale and seed,
+# so that cached datasets and already loaded databases are regenerated/reloaded
+GENERATOR_VERSION = 2
+
+# Written next to the CSV files of every cached dataset
+DATASET_FILE = 'dataset.json'
+
+# Foreign keys whose distribution can be configured, mapped to the table they reference.
+# Every entry in a distributions config is one of:
+#   {"kind": "uniform"}                             - the default, random.randint over all keys
+#   {"kind": "zipf", "s": 1.1}                      - key k drawn with weight 1 / k^s, so key 1 is the hottest
+#   {"kind": "hot", "fraction": 0.01, "share": 0.5} - share of the draws go to the first fraction of the keys
+# plus two non-key entries:
+#   "order_items.basket": {"kind": "full"} (every order holds every product, the default)
+#                         or {"kind": "power_law", "alpha": 1.5, "max": 50} (Pareto distributed basket sizes)
+#   "orders.status":      {"kind": "uniform"} or {"kind": "by_created_at"} (older orders are further along)
+SKEWABLE_KEYS = {
+    'users.country_code': 'countries',
+    'merchants.user_id': 'users',
+    'merchants.country_code': 'countries',
+    'orders.user_id': 'users',
+    'products.merchant_id': 'merchants',
+}
+
+ORDER_STATUSES = ('Pending', 'Shipped', 'Delivered')
+
+# Generated dates are placed relative to this fixed moment instead of the clock, so that a seed alone
+# determines the data: created_at values fall in its year up to it, users are 18 to 65 years old on it
+DATA_NOW = datetime(2024, 12, 31, 23, 59, 59)
+DATA_YEAR_START = datetime(DATA_NOW.year, 1, 1)
+
+# Row counts at scale 1
+DEFAULT_SIZES = {
+    'countries': 100,
+    'users': 200,
+    'merchants': 50,
+    'orders': 25,
+    'products': 60,
+}
+
+
+def seed_generators(seed):
+    if seed is not None:
+        random.seed(seed)
+        Faker.seed(seed)
+
+
+def table_sizes(scale=1):
+    return {table: max(1, int(size * scale)) for table, size in DEFAULT_SIZES.items()}
+
+
+def dataset_fingerprint(scale=1, seed=None, distributions=None):
+    if seed is None:
+        return None
+    key = {'generator_version': GENERATOR_VERSION, 'scale': scale, 'seed': seed}
+    # Only part of the key when set, so the default uniform datasets keep their fingerprints
+    if distributions:
+        key['distributions'] = distributions
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def dataset_info(scale=1, seed=None, distributions=None):
+    sizes = table_sizes(scale)
+    sizes['order_items'] = sizes['orders'] * sizes['products']
+    return {'scale': scale, 'seed': seed, 'generator_version': GENERATOR_VERSION,
+            'distributions': distributions or {}, 'fingerprint': dataset_fingerprint(scale, seed, distributions),
+            'rows': sizes}
+
+
+def make_key_picker(spec, num_keys):
+    # Returns a function drawing a key in 1..num_keys according to spec (see SKEWABLE_KEYS)
+    kind = (spec or {}).get('kind', 'uniform')
+    if kind == 'uniform':
+        return lambda: random.randint(1, num_keys)
+    if kind == 'zipf':
+        keys = range(1, num_keys + 1)
+        cum_weights = list(itertools.accumulate(1 / key ** spec.get('s', 1.1) for key in keys))
+        return lambda: random.choices(keys, cum_weights=cum_weights)[0]
+    if kind == 'hot':
+        hot_keys = max(1, int(num_keys * spec.get('fraction', 0.01)))
+        share = spec.get('share', 0.5)
+        return lambda: random.randint(1, hot_keys) if random.random() < share else random.randint(1, num_keys)
+    raise ValueError(f"Unknown key distribution {kind!r}")
+
+
+def status_by_created_at(created_at, year_start, now):
+    # position runs from 0 for the oldest possible order to 1 for one placed just now;
+    # old orders are mostly Delivered, recent ones mostly Pending
+    position = (created_at - year_start) / (now - year_start) if now > year_start else 1.0
+    weights = [position ** 2, 2 * position * (1 - position), (1 - position) ** 2]
+    return random.choices(ORDER_STATUSES, weights=weights)[0]
+
 
 # Function to generate random date of birth
-def generate_date_of_birth():
-    return fake.date_of_birth(minimum_age=18, maximum_age=65)
+def generate_date_of_birth(minimum_age=18, maximum_age=65):
+    today = DATA_NOW.date()
+    oldest = today.replace(year=today.year - maximum_age - 1) + timedelta(days=1)
+    return fake.date_between(start_date=oldest, end_date=today.replace(year=today.year - minimum_age))
+
+
+def generate_created_at():
+    return fake.date_time_between(start_date=DATA_YEAR_START, end_date=DATA_NOW)
 
 
 # Function to generate data for the countries table
@@ -22,7 +139,8 @@ def generate_countries_data(num_country):
 
 
 # Function to generate data for the users table
-def generate_users_data(num_users, num_countries):
+def generate_users_data(num_users, num_countries, pick_country=None):
+    pick_country = pick_country or make_key_picker(None, num_countries)
     users_data = []
     for i in range(1, num_users + 1):
         user_data = (
@@ -31,102 +149,295 @@ def generate_users_data(num_users, num_countries):
             fake.email(),
             fake.random_element(elements=('Male', 'Female')),
             generate_date_of_birth(),
-            random.randint(1, num_countries),
+            pick_country(),
         )
         users_data.append(user_data)
     return users_data
 
 
 # Function to generate data for the merchants table
-def generate_merchants_data(num_merchants, num_users, num_countries):
+def generate_merchants_data(num_merchants, num_users, num_countries, pick_user=None, pick_country=None):
+    pick_user = pick_user or make_key_picker(None, num_users)
+    pick_country = pick_country or make_key_picker(None, num_countries)
     merchants_data = []
     for i in range(1, num_merchants + 1):
         merchant_data = (
             i,
             fake.company(),
-            random.randint(1, num_users),
-            random.randint(1, num_countries),
+            pick_user(),
+            pick_country(),
         )
         merchants_data.append(merchant_data)
     return merchants_data
 
 
 # Function to generate data for the orders table
-def generate_orders_data(num_orders, num_users):
+def generate_orders_data(num_orders, num_users, pick_user=None, status_by_age=False):
+    pick_user = pick_user or make_key_picker(None, num_users)
     orders_data = []
     for i in range(1, num_orders + 1):
+        user_id = pick_user()
+        if status_by_age:
+            created_at = generate_created_at()
+            status = status_by_created_at(created_at, DATA_YEAR_START, DATA_NOW)
+        else:
+            status = fake.random_element(elements=ORDER_STATUSES)
+            created_at = generate_created_at()
         order_data = (
             i,
-            random.randint(1, num_users),
-            fake.random_element(elements=('Pending', 'Shipped', 'Delivered')),
-            fake.date_time_this_year().strftime("%Y-%m-%d %H:%M:%S"),
+            user_id,
+            status,
+            created_at.strftime("%Y-%m-%d %H:%M:%S"),
         )
         orders_data.append(order_data)
     return orders_data
 
 
 # Function to generate data for the products table
-def generate_products_data(num_products, num_merchants):
+def generate_products_data(num_products, num_merchants, pick_merchant=None):
+    pick_merchant = pick_merchant or make_key_picker(None, num_merchants)
     products_data = []
     for i in range(1, num_products + 1):
         product_data = (
             i,
-            random.randint(1, num_merchants),
+            pick_merchant(),
             fake.word(),
             random.randint(10, 100),
             fake.random_element(elements=('Available', 'Out of Stock')),
-            fake.date_time_this_year().strftime("%Y-%m-%d %H:%M:%S"),
+            generate_created_at().strftime("%Y-%m-%d %H:%M:%S"),
         )
         products_data.append(product_data)
     return products_data
 
 
 # Function to generate data for the order_items table
-def generate_order_items_data(num_orders, num_products):
+def generate_order_items_data(num_orders, num_products, basket=None):
+    basket = basket or {'kind': 'full'}
+    if basket['kind'] not in ('full', 'power_law'):
+        raise ValueError(f"Unknown basket distribution {basket['kind']!r}")
+    max_size = min(basket.get('max', num_products), num_products)
     order_items_data = []
     for i in range(1, num_orders + 1):
-        for j in range(1, num_products + 1):
+        if basket['kind'] == 'full':
+            product_ids = range(1, num_products + 1)
+        else:
+            size = min(max_size, int(random.paretovariate(basket.get('alpha', 1.5))))
+            product_ids = sorted(random.sample(range(1, num_products + 1), size))
+        for j in product_ids:
             order_item_data = (i, j, random.randint(1, 5))
             order_items_data.append(order_item_data)
     return order_items_data
 
 
-def insert_fake(cnx):
+def generate_tables(scale=1, seed=None, distributions=None):
+    seed_generators(seed)
+    distributions = distributions or {}
+    for name in distributions:
+        if name not in SKEWABLE_KEYS and name not in ('order_items.basket', 'orders.status'):
+            raise ValueError(f"Unknown distribution {name!r}")
+
+    sizes = table_sizes(scale)
+    num_countries = sizes['countries']
+    num_users = sizes['users']
+    num_merchants = sizes['merchants']
+    num_orders = sizes['orders']
+    num_products = sizes['products']
+
+    def picker(name):
+        return make_key_picker(distributions.get(name), sizes[SKEWABLE_KEYS[name]])
+
+    status_by_age = distributions.get('orders.status', {}).get('kind', 'uniform') == 'by_created_at'
+    return {
+        'countries': generate_countries_data(num_countries),
+        'users': generate_users_data(num_users=num_users, num_countries=num_countries,
+                                     pick_country=picker('users.country_code')),
+        'merchants': generate_merchants_data(num_merchants=num_merchants, num_users=num_users,
+                                             num_countries=num_countries, pick_user=picker('merchants.user_id'),
+                                             pick_country=picker('merchants.country_code')),
+        'orders': generate_orders_data(num_orders=num_orders, num_users=num_users,
+                                       pick_user=picker('orders.user_id'), status_by_age=status_by_age),
+        'products': generate_products_data(num_products=num_products, num_merchants=num_merchants,
+                                           pick_merchant=picker('products.merchant_id')),
+        'order_items': generate_order_items_data(num_orders=num_orders, num_products=num_products,
+                                                 basket=distributions.get('order_items.basket')),
+    }
+
+
+def shift_ids(rows, offset):
+    # Moves the generated primary keys (first column) past the rows that already exist
+    return [(row[0] + offset,) + tuple(row[1:]) for row in rows]
+
+
+def generate_delta(from_scale, to_scale, seed=None, distributions=None):
+    # Rows that grow a from_scale dataset into a to_scale one: only new ids, with foreign keys drawn over all
+    # keys at to_scale. Applied on top of generate_tables(from_scale) this is reproducible, but it is not the
+    # same data as generate_tables(to_scale).
+    seed_generators(None if seed is None else hash((seed, from_scale, to_scale)))
+    distributions = distributions or {}
+    before = table_sizes(from_scale)
+    after = table_sizes(to_scale)
+    new = {table: after[table] - before[table] for table in after}
+
+    def picker(name):
+        return make_key_picker(distributions.get(name), after[SKEWABLE_KEYS[name]])
+
+    status_by_age = distributions.get('orders.status', {}).get('kind', 'uniform') == 'by_created_at'
+    order_items = generate_order_items_data(num_orders=new['orders'], num_products=after['products'],
+                                            basket=distributions.get('order_items.basket'))
+    return {
+        'countries': shift_ids(generate_countries_data(new['countries']), before['countries']),
+        'users': shift_ids(generate_users_data(num_users=new['users'], num_countries=after['countries'],
+                                               pick_country=picker('users.country_code')), before['users']),
+        'merchants': shift_ids(generate_merchants_data(num_merchants=new['merchants'], num_users=after['users'],
+                                                       num_countries=after['countries'],
+                                                       pick_user=picker('merchants.user_id'),
+                                                       pick_country=picker('merchants.country_code')),
+                               before['merchants']),
+        'orders': shift_ids(generate_orders_data(num_orders=new['orders'], num_users=after['users'],
+                                                 pick_user=picker('orders.user_id'), status_by_age=status_by_age),
+                            before['orders']),
+        'products': shift_ids(generate_products_data(num_products=new['products'], num_merchants=after['merchants'],
+                                                     pick_merchant=picker('products.merchant_id')),
+                              before['products']),
+        'order_items': shift_ids(order_items, before['orders']),
+    }
+
+
+def gini(counts):
+    # 0 when every key is referenced equally often, close to 1 when one key takes everything
+    ordered = sorted(counts)
+    total = sum(ordered)
+    if not ordered or total == 0:
+        return 0.0
+    weighted = sum(rank * count for rank, count in enumerate(ordered, 1))
+    return (2 * weighted) / (len(ordered) * total) - (len(ordered) + 1) / len(ordered)
+
+
+def skew_stats(tables):
+    # Realized distribution of every configurable relationship, so index results can be read against it
+    stats = {}
+    for name, parent in SKEWABLE_KEYS.items():
+        table, column = name.split('.')
+        position = TABLE_COLUMNS[table].index(column)
+        counter = Counter(int(row[position]) for row in tables[table])
+        # Keys that are never referenced count as zeros
+        counts = [counter.get(int(row[0]), 0) for row in tables[parent]]
+        total = max(sum(counts), 1)
+        top = sorted(counts, reverse=True)
+        top_keys = max(1, len(top) // 10)
+        stats[name] = {
+            'referenced_keys': sum(1 for count in counts if count),
+            'keys': len(counts),
+            'max_share': top[0] / total if top else 0.0,
+            'top_10pct_share': sum(top[:top_keys]) / total,
+            'gini': gini(counts),
+        }
+
+    basket_sizes = list(Counter(int(row[0]) for row in tables['order_items']).values())
+    stats['order_items.basket'] = {
+        'mean': statistics.mean(basket_sizes) if basket_sizes else 0.0,
+        'median': statistics.median(basket_sizes) if basket_sizes else 0.0,
+        'max': max(basket_sizes, default=0),
+    }
+
+    # Status mix of the older and the newer half of the orders
+    orders = sorted(tables['orders'], key=lambda row: row[3])
+    halves = {'older_half': orders[:len(orders) // 2], 'newer_half': orders[len(orders) // 2:]}
+    stats['orders.status'] = {
+        half: {status: sum(1 for row in rows if row[2] == status) / max(len(rows), 1) for status in ORDER_STATUSES}
+        for half, rows in halves.items()}
+    return stats
+
+
+def print_skew_stats(stats):
+    print(f"{'relationship':<26}{'used/keys':>12}{'max share':>11}{'top 10%':>9}{'gini':>7}")
+    for name in SKEWABLE_KEYS:
+        row = stats[name]
+        print(f"{name:<26}{row['referenced_keys']:>6}/{row['keys']:<5}{row['max_share']:>11.3f}"
+              f"{row['top_10pct_share']:>9.3f}{row['gini']:>7.3f}")
+    basket = stats['order_items.basket']
+    print(f"basket size: mean {basket['mean']:.1f}, median {basket['median']}, max {basket['max']}")
+    for half, mix in stats['orders.status'].items():
+        print(f"status mix, {half.replace('_', ' ')}: " + ', '.join(f"{s} {share:.0%}" for s, share in mix.items()))
+
+
+def insert_tables(cnx, tables):
     cursor = cnx.cursor()
+    for table, rows in tables.items():
+        placeholders = ', '.join(['%s'] * len(TABLE_COLUMNS[table]))
+        cursor.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+        cnx.commit()
+        print(f"{table} succ")
+    cursor.close()
+
+
+def insert_fake(cnx, scale=1, seed=None, distributions=None):
+    insert_tables(cnx, generate_tables(scale, seed, distributions))
+
+
+def write_csv(data_dir, tables):
+    os.makedirs(data_dir, exist_ok=True)
+    for table, rows in tables.items():
+        with open(os.path.join(data_dir, f"{table}.csv"), 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(TABLE_COLUMNS[table])
+            writer.writerows(rows)
+
+
+def read_csv(data_dir):
+    tables = {}
+    for table in TABLE_COLUMNS:
+        with open(os.path.join(data_dir, f"{table}.csv"), 'r', newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            next(reader)
+            tables[table] = [tuple(row) for row in reader]
+    return tables
+
+
+def find_dataset(data_root, scale=1, seed=None, distributions=None):
+    # Returns the cached dataset directory for this scale, seed and distributions, or None if it has to be generated
+    fingerprint = dataset_fingerprint(scale, seed, distributions)
+    if fingerprint is None:
+        return None
+    path = os.path.join(data_root, fingerprint)
+    files = [DATASET_FILE] + [f"{table}.csv" for table in TABLE_COLUMNS]
+    if all(os.path.exists(os.path.join(path, name)) for name in files):
+        return path
+    return None
+
+
+def read_dataset_info(path):
+    with open(os.path.join(path, DATASET_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_delta(base_path, from_scale, to_scale, seed=None, distributions=None):
+    # Deltas are cached inside the base dataset's directory, since they only apply on top of it
+    path = os.path.join(base_path, f"delta-{from_scale}-{to_scale}")
+    if os.path.exists(os.path.join(path, DATASET_FILE)):
+        return path
+    tables = generate_delta(from_scale, to_scale, seed, distributions)
+    write_csv(path, tables)
+    info = {'from_scale': from_scale, 'to_scale': to_scale, 'rows': {table: len(rows) for table, rows in tables.items()}}
+    with open(os.path.join(path, DATASET_FILE), 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=2)
+    print(f"Delta {from_scale} -> {to_scale} written to {path}")
+    return path
+
 
-    num_countries = 100
-    num_users = 200
-    num_merchants = 50
-    num_orders = 25
-    num_products = 60
-
-    # Insert data into the countries table
-    countries_data = generate_countries_data(num_countries)
-    cursor.executemany("INSERT INTO countries VALUES (%s, %s, %s)", countries_data)
-    cnx.commit()
-    print("country succ")
-    # Insert data into the users table
-    users_data = generate_users_data(num_users=num_users, num_countries=num_countries)
-    cursor.executemany("INSERT INTO users VALUES (%s, %s, %s, %s, %s, %s)", users_data)
-    cnx.commit()
-    print("users succ")
-    # Insert data into the merchants table
-    merchants_data = generate_merchants_data(num_merchants=num_merchants, num_users=num_users,
-                                             num_countries=num_countries)
-    cursor.executemany("INSERT INTO merchants VALUES (%s, %s, %s, %s)", merchants_data)
-    cnx.commit()
-    print("merchants succ")
-    # Insert data into the orders table
-    orders_data = generate_orders_data(num_orders=num_orders, num_users=num_users)
-    cursor.executemany("INSERT INTO orders VALUES (%s, %s, %s, %s)", orders_data)
-    cnx.commit()
-    print("orders succ")
-    # Insert data into the products table
-    products_data = generate_products_data(num_products=num_products, num_merchants=num_merchants)
-    cursor.executemany("INSERT INTO products VALUES (%s, %s, %s, %s, %s, %s)", products_data)
-    cnx.commit()
-    print("product succ")
-    # Insert data into the order_items table
-    order_items_data = generate_order_items_data(num_orders=num_orders, num_products=num_products)
-    cursor.executemany("INSERT INTO order_items VALUES (%s, %s, %s)", order_items_data)
-    cnx.commit()
+def write_dataset(data_root, scale=1, seed=None, distributions=None):
+    info = dataset_info(scale, seed, distributions)
+    if info['fingerprint'] is None:
+        # Unseeded data cannot be reproduced, so every generation gets its own fingerprint
+        info['fingerprint'] = 'unseeded-' + uuid.uuid4().hex[:12]
+    path = os.path.join(data_root, info['fingerprint'])
+    tables = generate_tables(scale, seed, distributions)
+    write_csv(path, tables)
+    info['rows'] = {table: len(rows) for table, rows in tables.items()}
+    info['skew'] = skew_stats(tables)
+    print_skew_stats(info['skew'])
+    # dataset.json goes last: its presence marks the directory as complete
+    with open(os.path.join(path, DATASET_FILE), 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=2)
+    print(f"Dataset {info['fingerprint']} written to {path}")
+    return path
@@ -0,0 +1,357 @@
+import os
+import statistics
+import threading
+from contextlib import contextmanager
+
+# Byte counts are payload estimates (statement text, parameters and returned values) unless a driver
+# exposes the encoded message, as pymongo's command monitoring does.
+
+
+def payload_size(value):
+    if value is None:
+        return 1
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, (bool, int, float)):
+        return 8
+    if isinstance(value, dict):
+        return sum(payload_size(k) + payload_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sum(payload_size(item) for item in value)
+    if hasattr(value, 'values') and callable(value.values):
+        # neo4j Record
+        return payload_size(list(value.values()))
+    return len(str(value).encode('utf-8'))
+
+
+def disk_usage(path):
+    # Bytes used by the files under path (or the file itself), 0 when it does not exist
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for file_name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file_name))
+            except OSError:
+                pass
+    return total
+
+
+class WireStats:
+    def __init__(self):
+        self.paused = False
+        # Pooled MySQL runs and the Cassandra scans and joins record from worker threads
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.round_trips = 0
+            self.statements = 0
+            self.bytes_sent = 0
+            self.bytes_received = 0
+
+    def record(self, statements=0, round_trips=0, sent=0, received=0):
+        if self.paused:
+            return
+        with self.lock:
+            self.statements += statements
+            self.round_trips += round_trips
+            self.bytes_sent += sent
+            self.bytes_received += received
+
+    @contextmanager
+    def pause(self):
+        # Used around cache resets and other housekeeping that should not be charged to a query
+        previous = self.paused
+        self.paused = True
+        try:
+            yield
+        finally:
+            self.paused = previous
+
+    def per_iteration(self, iterations):
+        iterations = max(iterations, 1)
+        with self.lock:
+            return {
+                'round_trips': self.round_trips / iterations,
+                'statements': self.statements / iterations,
+                'bytes_sent': self.bytes_sent / iterations,
+                'bytes_received': self.bytes_received / iterations,
+            }
+
+
+class CountingCursor:
+    # DB-API cursor wrapper (mysql.connector)
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._stats.record(received=payload_size(row))
+            yield row
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        self._stats.record(statements=1, round_trips=1, sent=payload_size(operation) + payload_size(params))
+        return self._cursor.execute(operation, params, *args, **kwargs)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        seq_params = list(seq_params)
+        self._stats.record(statements=len(seq_params), round_trips=1,
+                           sent=payload_size(operation) + payload_size(seq_params))
+        return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        self._stats.record(received=payload_size(row))
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._stats.record(received=payload_size(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._stats.record(received=payload_size(rows))
+        return rows
+
+
+class CountingConnection:
+    # DB-API connection wrapper that hands out CountingCursors
+    def __init__(self, connection, stats):
+        self._connection = connection
+        self._stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._connection.cursor(*args, **kwargs), self._stats)
+
+    def commit(self):
+        self._stats.record(statements=1, round_trips=1, sent=payload_size('COMMIT'))
+        return self._connection.commit()
+
+
+def instrument_redis(client, stats):
+    # Every redis-py command goes through execute_command, so shadow it on the instance
+    execute_command = client.execute_command
+    pipeline = client.pipeline
+
+    def command_size(args):
+        # RESP array header plus a bulk string header per argument
+        return 4 + sum(payload_size(arg) + 6 for arg in args)
+
+    def counting_execute_command(*args, **options):
+        sent = command_size(args)
+        response = execute_command(*args, **options)
+        stats.record(statements=1, round_trips=1, sent=sent, received=payload_size(response))
+        return response
+
+    def counting_pipeline(transaction=True, shard_hint=None):
+        # Pipelines queue their commands in command_stack and send them all in one round trip on execute(),
+        # wrapped in MULTI/EXEC when transactional
+        pipe = pipeline(transaction=transaction, shard_hint=shard_hint)
+        execute = pipe.execute
+
+        def counting_execute(*args, **options):
+            commands = [command_args for command_args, _ in pipe.command_stack]
+            sent = sum(command_size(command_args) for command_args in commands)
+            if transaction and commands:
+                sent += command_size(('MULTI',)) + command_size(('EXEC',))
+            response = execute(*args, **options)
+            if commands:
+                stats.record(statements=len(commands), round_trips=1, sent=sent, received=payload_size(response))
+            return response
+
+        pipe.execute = counting_execute
+        return pipe
+
+    client.execute_command = counting_execute_command
+    client.pipeline = counting_pipeline
+    return client
+
+
+class CountingResultSet:
+    # cassandra-driver ResultSet wrapper; rows are counted as they are consumed, including later pages
+    def __init__(self, result_set, stats, fetch_size):
+        self._result_set = result_set
+        self._stats = stats
+        self._fetch_size = fetch_size
+
+    def __getattr__(self, name):
+        return getattr(self._result_set, name)
+
+    def __iter__(self):
+        rows = 0
+        for row in self._result_set:
+            rows += 1
+            if self._fetch_size and rows > 1 and (rows - 1) % self._fetch_size == 0:
+                self._stats.record(round_trips=1)
+            self._stats.record(received=payload_size(tuple(row)))
+            yield row
+
+    def one(self):
+        row = self._result_set.one()
+        self._stats.record(received=payload_size(tuple(row) if row is not None else None))
+        return row
+
+    def all(self):
+        return list(self)
+
+
+class CountingSession:
+    # cassandra-driver Session wrapper; with trace_requests set, every statement is traced and its
+    # ResultSet kept in traced so the caller can read the server-side durations afterwards
+    def __init__(self, session, stats):
+        self._session = session
+        self._stats = stats
+        self.trace_requests = False
+        self.traced = []
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def execute(self, query, parameters=None, *args, **kwargs):
+        text = getattr(query, 'query_string', query)
+        self._stats.record(statements=1, round_trips=1, sent=payload_size(text) + payload_size(parameters))
+        if self.trace_requests:
+            kwargs['trace'] = True
+        result = self._session.execute(query, parameters, *args, **kwargs)
+        if self.trace_requests:
+            self.traced.append(result)
+        fetch_size = getattr(query, 'fetch_size', None) or self._session.default_fetch_size
+        return CountingResultSet(result, self._stats, fetch_size)
+
+
+class CountingResult:
+    # neo4j Result wrapper
+    def __init__(self, result, stats):
+        self._result = result
+        self._stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self._result, name)
+
+    def __iter__(self):
+        for record in self._result:
+            self._stats.record(received=payload_size(record))
+            yield record
+
+    def single(self, *args, **kwargs):
+        record = self._result.single(*args, **kwargs)
+        self._stats.record(received=payload_size(record))
+        return record
+
+    def data(self, *args, **kwargs):
+        data = self._result.data(*args, **kwargs)
+        self._stats.record(received=payload_size(data))
+        return data
+
+
+class CountingNeo4jSession:
+    def __init__(self, session, stats):
+        self._session = session
+        self._stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def __enter__(self):
+        self._session.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._session.__exit__(*exc_info)
+
+    def run(self, query, parameters=None, **kwargs):
+        # RUN and PULL are pipelined into a single round trip
+        self._stats.record(statements=1, round_trips=1, sent=payload_size(query) + payload_size(parameters))
+        return CountingResult(self._session.run(query, parameters, **kwargs), self._stats)
+
+
+class CountingDriver:
+    def __init__(self, driver, stats):
+        self._driver = driver
+        self._stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+    def session(self, *args, **kwargs):
+        return CountingNeo4jSession(self._driver.session(*args, **kwargs), self._stats)
+
+
+def mongo_listener(stats):
+    # Imported lazily so that this module does not require pymongo
+    import bson
+    from pymongo import monitoring
+
+    class CountingCommandListener(monitoring.CommandListener):
+        def started(self, event):
+            stats.record(statements=1, round_trips=1, sent=len(bson.encode(event.command)))
+
+        def succeeded(self, event):
+            stats.record(received=len(bson.encode(event.reply)))
+
+        def failed(self, event):
+            pass
+
+    return CountingCommandListener()
+
+
+def time_breakdown(wall_samples, cpu_samples, server_samples):
+    # Splits the mean iteration time into engine-reported server time, client CPU time and the
+    # remainder, which is network transfer and waiting. server is None when the engine gave no timing.
+    wall = statistics.mean(wall_samples)
+    client = statistics.mean(cpu_samples) if cpu_samples else 0.0
+    server = statistics.mean(server_samples) if server_samples else None
+    network = max(wall - client - (server or 0.0), 0.0)
+    return {'wall': wall, 'server': server, 'client': client, 'network': network}
+
+
+def pool_stats(waits, checkouts):
+    # Time a pooled query spent waiting for a free connection and checking it out (health check and session
+    # settings included), per iteration; both are kept out of the query's own samples
+    ordered = sorted(waits)
+    return {'checkouts': len(waits), 'wait_mean': statistics.mean(waits) if waits else 0.0,
+            'wait_p95': ordered[max(0, int(round(0.95 * len(ordered))) - 1)] if ordered else 0.0,
+            'wait_max': ordered[-1] if ordered else 0.0,
+            'checkout_mean': statistics.mean(checkouts) if checkouts else 0.0}
+
+
+def print_pool_stats(samples, pool_stats):
+    print(f"{'query':<12}{'median s':>12}{'checkouts':>11}{'wait ms':>10}{'wait p95':>10}{'wait max':>10}"
+          f"{'checkout ms':>13}")
+    for query, times in samples.items():
+        stats = pool_stats.get(query)
+        if not times or not stats:
+            continue
+        print(f"{query:<12}{statistics.median(times):>12.6f}{stats['checkouts']:>11}"
+              f"{stats['wait_mean'] * 1000:>10.3f}{stats['wait_p95'] * 1000:>10.3f}{stats['wait_max'] * 1000:>10.3f}"
+              f"{stats['checkout_mean'] * 1000:>13.3f}")
+
+
+def print_time_breakdown(breakdowns):
+    print(f"{'query':<12}{'wall s':>12}{'server s':>12}{'client s':>12}{'network s':>12}")
+    for query, row in breakdowns.items():
+        server = f"{row['server']:>12.6f}" if row['server'] is not None else f"{'n/a':>12}"
+        print(f"{query:<12}{row['wall']:>12.6f}{server}{row['client']:>12.6f}{row['network']:>12.6f}")
+
+
+def print_wire_stats(samples, wire_stats):
+    print(f"{'query':<12}{'median s':>12}{'round trips':>13}{'statements':>12}{'bytes sent':>12}{'bytes recv':>12}")
+    for query, times in samples.items():
+        stats = wire_stats.get(query)
+        if not times or not stats:
+            continue
+        print(f"{query:<12}{statistics.median(times):>12.6f}{stats['round_trips']:>13.1f}{stats['statements']:>12.1f}"
+              f"{stats['bytes_sent']:>12.0f}{stats['bytes_received']:>12.0f}")
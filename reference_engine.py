@@ -0,0 +1,398 @@
+import os
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from cache_control import check_state, warn_once
+from instrumentation import WireStats, time_breakdown
+from sampling import Sampler
+from workload import DEFAULT_PARAMS, PAGE_SIZE, PRICE_BAND, QUERY_PARAMS, TIME_FORMAT, bind
+
+# Columns the queries read; everything else in the CSV files is skipped. String columns are dictionary-encoded:
+# an int32 code per row plus one sorted array holding every distinct value once, so codes compare like the values.
+COLUMNS = {
+    'countries': {'country_code': 'int', 'continent_name': 'str'},
+    'users': {'user_id': 'int', 'full_name': 'str', 'email': 'str', 'country_code': 'int'},
+    'merchants': {'merchant_id': 'int', 'merchant_name': 'str'},
+    'orders': {'order_id': 'int', 'user_id': 'int', 'status': 'str', 'created_at': 'str'},
+    'products': {'product_id': 'int', 'merchant_id': 'int', 'name': 'str', 'price': 'int'},
+    'order_items': {'order_id': 'int', 'product_id': 'int', 'quantity': 'int'},
+}
+
+# Key columns the joins look rows up by
+KEYS = {'countries': 'country_code', 'users': 'user_id', 'merchants': 'merchant_id', 'orders': 'order_id',
+        'products': 'product_id'}
+
+# order_items is read and scanned this many rows at a time, so temporaries stay the same size at any scale
+CHUNK_ROWS = 1_000_000
+
+# Aggregates are compared after rounding, since MySQL returns AVG as a DECIMAL with 4 digits
+FLOAT_DIGITS = 2
+
+
+class Column:
+    def __init__(self, values, dictionary=None):
+        self.values = values
+        # None for int columns; for string columns values are codes into dictionary
+        self.dictionary = dictionary
+
+    def code_of(self, value):
+        # Code of a string value, -1 when it never occurs, so comparisons against it match nothing
+        position = self.lower_bound(value)
+        return position if position < len(self.dictionary) and self.dictionary[position] == value else -1
+
+    def lower_bound(self, value):
+        # Smallest code whose value is >= value
+        return int(np.searchsorted(self.dictionary, value))
+
+    def decode(self, rows):
+        values = self.values[rows]
+        return self.dictionary[values] if self.dictionary is not None else values
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + (self.dictionary.nbytes if self.dictionary is not None else 0)
+
+
+def encode(values, kind):
+    if kind == 'int':
+        return Column(np.asarray(values, dtype=np.int32))
+    codes, dictionary = pd.factorize(np.asarray(values, dtype=object), sort=True)
+    return Column(codes.astype(np.int32), np.asarray(dictionary, dtype=object))
+
+
+def concat(old, new):
+    # Appending re-encodes the strings, since the new rows may add values to the dictionary
+    if old.dictionary is None:
+        return Column(np.concatenate([old.values, new.values]))
+    return encode(np.concatenate([old.dictionary[old.values], new.dictionary[new.values]]), 'str')
+
+
+def read_table(data_dir, table, chunk_rows=CHUNK_ROWS):
+    columns = COLUMNS[table]
+    dtype = {name: (np.int32 if kind == 'int' else str) for name, kind in columns.items()}
+    parts = {name: [] for name in columns}
+    for chunk in pd.read_csv(os.path.join(data_dir, f"{table}.csv"), usecols=list(columns), dtype=dtype,
+                             keep_default_na=False, chunksize=chunk_rows):
+        for name in columns:
+            parts[name].append(chunk[name].to_numpy())
+    return {name: encode(np.concatenate(parts[name]) if parts[name] else [], kind)
+            for name, kind in columns.items()}
+
+
+def key_index(keys):
+    # Direct-address hash table from key to row number, -1 for keys without a row.
+    # Generated keys are dense positive ints, so a table of max(key) + 1 slots is as small as a hash map.
+    index = np.full(int(keys.max()) + 1 if len(keys) else 0, -1, dtype=np.int32)
+    index[keys] = np.arange(len(keys), dtype=np.int32)
+    return index
+
+
+def time_order_keys(created_at, order_ids):
+    # (created_at code, order_id) packed into one int64 that sorts like the pair
+    return (created_at.astype(np.int64) << 32) | order_ids.astype(np.int64)
+
+
+def normalize(rows):
+    # Multiset of rows with driver types (Decimal, numpy scalars) mapped to plain Python values
+    def value(item):
+        if isinstance(item, (float, Decimal, np.floating)):
+            return round(float(item), FLOAT_DIGITS)
+        if isinstance(item, (int, np.integer)):
+            return int(item)
+        if isinstance(item, datetime):
+            # DATETIME columns of the compact MySQL schema; the dataset stores these as text
+            return item.strftime(TIME_FORMAT)
+        return item
+    return Counter(tuple(value(item) for item in row) for row in rows)
+
+
+def compare_results(expected, actual):
+    expected = normalize(expected)
+    actual = normalize(actual)
+    return {'match': expected == actual, 'expected_rows': sum(expected.values()), 'rows': sum(actual.values()),
+            'missing': sum((expected - actual).values()), 'unexpected': sum((actual - expected).values())}
+
+
+class Result:
+    # Columnar query result, one array per output column; rows() turns it into tuples for comparisons
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def rows(self):
+        return list(zip(*(column.tolist() for column in self.columns.values())))
+
+
+class ColumnStore:
+    # The loaded tables, shared by every ReferenceEngine in the process
+    def __init__(self, chunk_rows=CHUNK_ROWS):
+        self.chunk_rows = chunk_rows
+        self.tables = {}
+        self.fingerprint = None
+        # Prebuilt indexes of the 'indexed' configuration, by table.column; without them every query builds its own
+        self.indexes = {}
+
+    def load(self, data_dir):
+        self.tables = {table: read_table(data_dir, table, self.chunk_rows) for table in COLUMNS}
+        self.indexes = {}
+        self.fingerprint = None
+
+    def append(self, data_dir):
+        for table in COLUMNS:
+            new = read_table(data_dir, table, self.chunk_rows)
+            self.tables[table] = {name: concat(column, new[name]) for name, column in self.tables[table].items()}
+        if self.indexes:
+            self.create_indexes()
+
+    def create_indexes(self):
+        self.indexes = {f"{table}.{key}": key_index(self.tables[table][key].values) for table, key in KEYS.items()}
+        self.indexes['orders.created_at_order_id'] = self.time_order()
+
+    def drop_indexes(self):
+        self.indexes = {}
+
+    def index(self, table):
+        index = self.indexes.get(f"{table}.{KEYS[table]}")
+        return index if index is not None else key_index(self.tables[table][KEYS[table]].values)
+
+    def time_order(self):
+        # Sorted index on orders (created_at, order_id): the sorted packed keys and the row of each
+        orders = self.tables['orders']
+        keys = time_order_keys(orders['created_at'].values, orders['order_id'].values)
+        rows = np.argsort(keys, kind='stable').astype(np.int32)
+        return keys[rows], rows
+
+    def index_sizes(self):
+        return {name: sum(part.nbytes for part in index) if isinstance(index, tuple) else index.nbytes
+                for name, index in self.indexes.items()}
+
+    def table_sizes(self):
+        return {table: sum(column.nbytes for column in columns.values()) for table, columns in self.tables.items()}
+
+    def item_chunks(self):
+        items = self.tables['order_items']
+        for start in range(0, len(items['order_id'].values), self.chunk_rows):
+            end = start + self.chunk_rows
+            yield (items['order_id'].values[start:end], items['product_id'].values[start:end],
+                   items['quantity'].values[start:end])
+
+    def q1(self, continent):
+        countries = self.tables['countries']
+        users = self.tables['users']
+        wanted = countries['country_code'].values[
+            countries['continent_name'].values == countries['continent_name'].code_of(continent)]
+        # Semi join: a boolean table over country codes, probed with every user's country
+        in_continent = np.zeros(int(users['country_code'].values.max(initial=0)) + 1, dtype=bool)
+        in_continent[wanted[wanted < len(in_continent)]] = True
+        rows = np.flatnonzero(in_continent[users['country_code'].values])
+        return Result({'full_name': users['full_name'].decode(rows), 'email': users['email'].decode(rows)})
+
+    def q2(self, status):
+        orders = self.tables['orders']
+        users = self.tables['users']
+        products = self.tables['products']
+        order_index = self.index('orders')
+        user_index = self.index('users')
+        product_index = self.index('products')
+        matching = np.zeros(len(order_index), dtype=bool)
+        matching[orders['order_id'].values[orders['status'].values == orders['status'].code_of(status)]] = True
+
+        order_parts, product_parts, quantity_parts = [], [], []
+        for order_ids, product_ids, quantities in self.item_chunks():
+            keep = matching[order_ids]
+            order_parts.append(order_index[order_ids[keep]])
+            product_parts.append(product_index[product_ids[keep]])
+            quantity_parts.append(quantities[keep])
+        order_rows = np.concatenate(order_parts) if order_parts else np.zeros(0, dtype=np.int32)
+        product_rows = np.concatenate(product_parts) if product_parts else np.zeros(0, dtype=np.int32)
+        user_rows = user_index[orders['user_id'].values[order_rows]]
+        return Result({
+            'order_id': orders['order_id'].decode(order_rows),
+            'user_name': users['full_name'].decode(user_rows),
+            'user_email': users['email'].decode(user_rows),
+            'product_name': products['name'].decode(product_rows),
+            'quantity': np.concatenate(quantity_parts) if quantity_parts else np.zeros(0, dtype=np.int32),
+            'price': products['price'].decode(product_rows),
+            'status': orders['status'].decode(order_rows),
+            'created_at': orders['created_at'].decode(order_rows),
+        })
+
+    def q3(self, merchant_id):
+        merchants = self.tables['merchants']
+        products = self.tables['products']
+        merchant_index = self.index('merchants')
+        product_index = self.index('products')
+        # Per product, the row of its merchant and whether the merchant is selected
+        product_merchant = merchant_index[products['merchant_id'].values]
+        selected = np.ones(len(product_merchant), dtype=bool) if merchant_id is None \
+            else products['merchant_id'].values == merchant_id
+        prices = products['price'].values.astype(np.int64)
+        num_merchants = len(merchants['merchant_id'].values)
+
+        # Hash group-by on the merchant row: bincount sums every chunk straight into the per-merchant totals
+        revenue = np.zeros(num_merchants, dtype=np.float64)
+        counts = np.zeros(num_merchants, dtype=np.int64)
+        for order_ids, product_ids, quantities in self.item_chunks():
+            product_rows = product_index[product_ids]
+            keep = selected[product_rows]
+            product_rows = product_rows[keep]
+            merchant_rows = product_merchant[product_rows]
+            revenue += np.bincount(merchant_rows, weights=prices[product_rows] * quantities[keep],
+                                   minlength=num_merchants)
+            counts += np.bincount(merchant_rows, minlength=num_merchants)
+        rows = np.flatnonzero(counts)
+        return Result({'merchant_id': merchants['merchant_id'].decode(rows),
+                       'merchant_name': merchants['merchant_name'].decode(rows),
+                       'total_revenue': revenue[rows]})
+
+    def q4(self, user_id):
+        users = self.tables['users']
+        orders = self.tables['orders']
+        products = self.tables['products']
+        user_index = self.index('users')
+        order_index = self.index('orders')
+        product_index = self.index('products')
+        num_users = len(users['user_id'].values)
+        # Per order, the row of its user, or -1 when the order is Pending or belongs to another user
+        order_user = user_index[orders['user_id'].values]
+        order_user[orders['status'].values == orders['status'].code_of('Pending')] = -1
+        if user_id is not None:
+            order_user[orders['user_id'].values != user_id] = -1
+        prices = products['price'].values.astype(np.int64)
+
+        sums = np.zeros(num_users, dtype=np.float64)
+        counts = np.zeros(num_users, dtype=np.int64)
+        for order_ids, product_ids, quantities in self.item_chunks():
+            user_rows = order_user[order_index[order_ids]]
+            keep = user_rows >= 0
+            user_rows = user_rows[keep]
+            values = prices[product_index[product_ids[keep]]] * quantities[keep]
+            sums += np.bincount(user_rows, weights=values, minlength=num_users)
+            counts += np.bincount(user_rows, minlength=num_users)
+        rows = np.flatnonzero(counts)
+        return Result({'user_id': users['user_id'].decode(rows), 'full_name': users['full_name'].decode(rows),
+                       'avg_order_value': sums[rows] / counts[rows]})
+
+    def q5(self, min_price):
+        products = self.tables['products']
+        prices = products['price'].values
+        rows = np.flatnonzero((prices >= min_price) & (prices < min_price + PRICE_BAND))
+        return Result({'product_id': products['product_id'].decode(rows), 'name': products['name'].decode(rows),
+                       'price': products['price'].decode(rows)})
+
+    def order_rows(self, rows):
+        orders = self.tables['orders']
+        return Result({'order_id': orders['order_id'].decode(rows), 'user_id': orders['user_id'].decode(rows),
+                       'status': orders['status'].decode(rows), 'created_at': orders['created_at'].decode(rows)})
+
+    def q6(self, since):
+        created_at = self.tables['orders']['created_at']
+        if since is None:
+            return self.order_rows(np.arange(len(created_at.values)))
+        return self.order_rows(np.flatnonzero(created_at.values >= created_at.lower_bound(since)))
+
+    def q7(self, limit):
+        revenue = self.q3(None)
+        top = np.argsort(-revenue.columns['total_revenue'], kind='stable')[:limit]
+        return Result({name: column[top] for name, column in revenue.columns.items()})
+
+    def q8(self, after):
+        keys, rows = self.indexes.get('orders.created_at_order_id') or self.time_order()
+        start = 0
+        if after is not None:
+            after_created_at, after_order_id = after
+            created_at = self.tables['orders']['created_at']
+            code = created_at.code_of(after_created_at)
+            # A cursor time that is not in the data sorts just before the first code after it
+            cursor = (code << 32) | after_order_id if code >= 0 else (created_at.lower_bound(after_created_at) << 32) - 1
+            start = int(np.searchsorted(keys, cursor, side='right'))
+        return self.order_rows(rows[start:start + PAGE_SIZE])
+
+    def run(self, query, value):
+        return getattr(self, query)(value)
+
+
+# Process-wide store; the backend loads into it and extra benchmark clients share it
+STORE = ColumnStore()
+_oracles = {}
+
+
+def oracle(data_dir, chunk_rows=CHUNK_ROWS):
+    # Separately loaded store used to check other backends' results, cached per dataset directory
+    if data_dir not in _oracles:
+        store = ColumnStore(chunk_rows)
+        store.load(data_dir)
+        store.create_indexes()
+        _oracles[data_dir] = store
+    return _oracles[data_dir]
+
+
+def verify_results(store, last_results, params=None):
+    # last_results maps query names to the rows a backend returned for the last drawn parameter.
+    # Labels of query variants (q1/exists) are checked against their query.
+    report = {}
+    for label, rows in last_results.items():
+        query = label.split('/')[0]
+        stream = params.get(query) if params else None
+        value = stream.drawn[-1] if stream is not None and stream.drawn else DEFAULT_PARAMS[query]
+        report[label] = dict(compare_results(store.run(query, value).rows(), rows), value=value)
+    return report
+
+
+def print_verification(report):
+    print(f"{'query':<20}{'parameter':<22}{'match':>7}{'expected':>10}{'rows':>10}{'missing':>9}{'unexpected':>12}")
+    for query, row in report.items():
+        print(f"{query:<20}{str(row['value'])[:20]:<22}{str(row['match']):>7}{row['expected_rows']:>10}"
+              f"{row['rows']:>10}{row['missing']:>9}{row['unexpected']:>12}")
+
+
+class ReferenceEngine:
+    # Harness-facing side of the column store, shaped like the database connectors. Everything runs in this
+    # process, so the whole iteration is client time and there are no round trips.
+    def __init__(self, store=None):
+        self.store = store if store is not None else STORE
+        self.samples = {}
+        self.sampler = Sampler()
+        self.wire = WireStats()
+        self.wire_stats = {}
+        self.server_timing = False
+        self.breakdowns = {}
+        self.cache_state = 'warm'
+        self.restart_command = None
+
+    def connect(self):
+        return self
+
+    def close(self):
+        pass
+
+    def server_version(self):
+        return f"numpy {np.__version__}"
+
+    def reset_cache(self, state):
+        check_state(state)
+        if state != 'warm':
+            warn_once("the reference engine has no caches to drop; cold and plan_cold runs are measured warm")
+
+    def prepare_cache(self):
+        self.reset_cache(self.cache_state)
+
+    def query_runner(self, name, params=None):
+        exe_time = self.sampler.collect(bind(lambda value: self.store.run(name, value), name, params),
+                                        self.prepare_cache)
+        self.samples[name] = exe_time
+        self.wire_stats[name] = self.wire.per_iteration(len(exe_time))
+        self.breakdowns[name] = time_breakdown(exe_time, self.sampler.cpu_samples, [])
+        return sum(exe_time) / len(exe_time)
+
+    def complex_queries(self, params=None):
+        self.samples = {}
+        self.wire_stats = {}
+        self.breakdowns = {}
+        return [self.query_runner(name, params) for name in QUERY_PARAMS]
@@ -0,0 +1,133 @@
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import time
+import uuid
+
+from sampling import cliffs_delta, mann_whitney_u
+
+STORE_PATH = 'benchmark_results.jsonl'
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+
+def save_run(backend, server_version, dataset, index_config, samples, extra=None, path=STORE_PATH):
+    run = {
+        'run_id': uuid.uuid4().hex[:12],
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'backend': backend,
+        'server_version': server_version,
+        'dataset': dataset,
+        'index_config': index_config,
+        'client_host': socket.gethostname(),
+        'git_commit': git_commit(),
+        'samples': samples,
+    }
+    if extra:
+        run.update(extra)
+
+    # Append only: earlier runs are never rewritten
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(run, default=str) + '\n')
+    print(f"Saved {backend} run {run['run_id']} ({index_config}) to {path}")
+    return run['run_id']
+
+
+def load_runs(path=STORE_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_run(run_id, path=STORE_PATH):
+    matches = [run for run in load_runs(path) if run['run_id'].startswith(run_id)]
+    if len(matches) != 1:
+        raise ValueError(f"Run id {run_id!r} matched {len(matches)} runs")
+    return matches[0]
+
+
+def compare_runs(baseline, candidate, alpha=0.05):
+    rows = []
+    for query, base_samples in baseline['samples'].items():
+        cand_samples = candidate['samples'].get(query)
+        if not base_samples or not cand_samples:
+            continue
+        base_median = statistics.median(base_samples)
+        cand_median = statistics.median(cand_samples)
+        _, p_value = mann_whitney_u(base_samples, cand_samples)
+        change = (cand_median - base_median) / base_median if base_median else 0.0
+
+        if p_value >= alpha:
+            verdict = 'no change'
+        elif cand_median > base_median:
+            verdict = 'REGRESSION'
+        else:
+            verdict = 'improvement'
+
+        rows.append({
+            'query': query,
+            'baseline_median': base_median,
+            'candidate_median': cand_median,
+            'change': change,
+            'cliffs_delta': cliffs_delta(base_samples, cand_samples),
+            'p_value': p_value,
+            'verdict': verdict,
+        })
+    return rows
+
+
+def print_runs(runs):
+    for run in runs:
+        print(f"{run['run_id']}  {run['timestamp']}  {run['backend']:<10} {run['index_config']:<12} "
+              f"{run.get('cache_state', 'warm'):<10} {run.get('workload', 'read'):<6} {str(run.get('git_commit'))[:8]}  {run['dataset']}")
+
+
+def print_comparison(rows):
+    print(f"{'query':<12}{'baseline':>14}{'candidate':>14}{'change':>10}{'cliff d':>9}{'p':>10}  verdict")
+    for row in rows:
+        print(f"{row['query']:<12}{row['baseline_median']:>14.6f}{row['candidate_median']:>14.6f}"
+              f"{row['change']:>+10.1%}{row['cliffs_delta']:>9.2f}{row['p_value']:>10.4f}  {row['verdict']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and compare stored benchmark runs")
+    parser.add_argument('--store', default=STORE_PATH)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    list_parser = subparsers.add_parser('list')
+    list_parser.add_argument('--backend')
+
+    compare_parser = subparsers.add_parser('compare')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--alpha', type=float, default=0.05)
+
+    args = parser.parse_args()
+    if args.command == 'list':
+        runs = load_runs(args.store)
+        if args.backend:
+            runs = [run for run in runs if run['backend'] == args.backend]
+        print_runs(runs)
+    elif args.command == 'compare':
+        baseline = find_run(args.baseline, args.store)
+        candidate = find_run(args.candidate, args.store)
+        if baseline['backend'] != candidate['backend']:
+            print(f"Warning: comparing {baseline['backend']} against {candidate['backend']}")
+        if baseline.get('cache_state', 'warm') != candidate.get('cache_state', 'warm'):
+            print(f"Warning: comparing a {baseline.get('cache_state', 'warm')} run against a "
+                  f"{candidate.get('cache_state', 'warm')} run")
+        print_comparison(compare_runs(baseline, candidate, args.alpha))
+
+
+if __name__ == "__main__":
+    main()
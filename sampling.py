@@ -0,0 +1,166 @@
+import math
+import random
+import statistics
+import time
+
+FIXED_RUNS = 10
+
+
+def mann_whitney_u(a, b):
+    # Two-sided Mann-Whitney U test, normal approximation with tie correction
+    n1, n2 = len(a), len(b)
+    if n1 == 0 or n2 == 0:
+        return None, 1.0
+
+    combined = sorted([(value, 0) for value in a] + [(value, 1) for value in b])
+    ranks = [0.0] * len(combined)
+    tie_term = 0
+    i = 0
+    while i < len(combined):
+        j = i
+        while j + 1 < len(combined) and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        ties = j - i + 1
+        tie_term += ties ** 3 - ties
+        i = j + 1
+
+    rank_sum_a = sum(rank for rank, (_, group) in zip(ranks, combined) if group == 0)
+    u = rank_sum_a - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1)))
+    if variance <= 0:
+        return u, 1.0
+    z = (abs(u - n1 * n2 / 2) - 0.5) / math.sqrt(variance)
+    p_value = math.erfc(max(z, 0) / math.sqrt(2))
+    return u, p_value
+
+
+def cliffs_delta(a, b):
+    # P(a > b) - P(a < b) over all pairs; positive when a is slower than b
+    if not a or not b:
+        return 0.0
+    greater = less = 0
+    sorted_b = sorted(b)
+    for value in a:
+        greater += _count_below(sorted_b, value)
+        less += len(sorted_b) - _count_below(sorted_b, value, inclusive=True)
+    return (greater - less) / (len(a) * len(b))
+
+
+def _count_below(sorted_values, value, inclusive=False):
+    lo, hi = 0, len(sorted_values)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if sorted_values[mid] < value or (inclusive and sorted_values[mid] == value):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def cohens_d(a, b):
+    if len(a) < 2 or len(b) < 2:
+        return 0.0
+    pooled = math.sqrt(((len(a) - 1) * statistics.variance(a) + (len(b) - 1) * statistics.variance(b))
+                       / (len(a) + len(b) - 2))
+    if pooled == 0:
+        return 0.0
+    return (statistics.mean(a) - statistics.mean(b)) / pooled
+
+
+def bootstrap_median_ci(samples, confidence=0.95, resamples=1000, seed=0):
+    rng = random.Random(seed)
+    n = len(samples)
+    medians = sorted(statistics.median(rng.choices(samples, k=n)) for _ in range(resamples))
+    tail = (1 - confidence) / 2
+    lo = medians[int(tail * (resamples - 1))]
+    hi = medians[int(math.ceil((1 - tail) * (resamples - 1)))]
+    return lo, hi
+
+
+def compare_samples(baseline, candidate):
+    _, p_value = mann_whitney_u(baseline, candidate)
+    base_median = statistics.median(baseline)
+    cand_median = statistics.median(candidate)
+    return {
+        'baseline_median': base_median,
+        'candidate_median': cand_median,
+        'speedup': base_median / cand_median if cand_median else float('inf'),
+        'cliffs_delta': cliffs_delta(baseline, candidate),
+        'cohens_d': cohens_d(baseline, candidate),
+        'p_value': p_value,
+    }
+
+
+def print_comparison(baseline_samples, candidate_samples, alpha=0.05):
+    print(f"{'query':<12}{'baseline':>12}{'candidate':>12}{'speedup':>9}{'cliff d':>9}{'cohen d':>9}{'p':>9}")
+    for query, baseline in baseline_samples.items():
+        candidate = candidate_samples.get(query)
+        if not baseline or not candidate:
+            continue
+        row = compare_samples(baseline, candidate)
+        marker = '*' if row['p_value'] < alpha else ''
+        print(f"{query:<12}{row['baseline_median']:>12.6f}{row['candidate_median']:>12.6f}{row['speedup']:>8.2f}x"
+              f"{row['cliffs_delta']:>9.2f}{row['cohens_d']:>9.2f}{row['p_value']:>9.4f}{marker}")
+
+
+class Sampler:
+    # Fixed mode runs each query FIXED_RUNS times. Adaptive mode keeps going until the bootstrap
+    # confidence interval of the median is narrower than target_width (relative to the median)
+    # or the time budget for the query is spent.
+    def __init__(self, runs=FIXED_RUNS, adaptive=False, target_width=0.05, time_budget=30.0,
+                 min_runs=5, max_runs=1000, confidence=0.95):
+        self.runs = runs
+        self.adaptive = adaptive
+        self.target_width = target_width
+        self.time_budget = time_budget
+        self.min_runs = min_runs
+        self.max_runs = max_runs
+        self.confidence = confidence
+        self.last_ci = None
+        # Client CPU time (process_time) of each iteration of the last collect()
+        self.cpu_samples = []
+
+    def settings(self):
+        if not self.adaptive:
+            return {'mode': 'fixed', 'runs': self.runs}
+        return {'mode': 'adaptive', 'target_width': self.target_width, 'time_budget': self.time_budget,
+                'confidence': self.confidence}
+
+    def time_once(self, func, before=None, after=None):
+        # before and after run untimed, e.g. to reset server caches or read engine-reported timings
+        if before is not None:
+            before()
+        start_cpu = time.process_time()
+        start_time = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start_time
+        self.cpu_samples.append(time.process_time() - start_cpu)
+        if after is not None:
+            after()
+        return elapsed
+
+    def collect(self, func, before=None, after=None):
+        self.cpu_samples = []
+        if not self.adaptive:
+            self.last_ci = None
+            return [self.time_once(func, before, after) for x in range(self.runs)]
+
+        samples = []
+        deadline = time.perf_counter() + self.time_budget
+        next_check = self.min_runs
+        while len(samples) < self.max_runs:
+            samples.append(self.time_once(func, before, after))
+            if len(samples) >= next_check:
+                lo, hi = bootstrap_median_ci(samples, self.confidence)
+                self.last_ci = (lo, hi)
+                median = statistics.median(samples)
+                if median > 0 and (hi - lo) / median <= self.target_width:
+                    break
+                # Bootstrap cost grows with the sample count, so check less often as it grows
+                next_check = len(samples) + max(self.min_runs, len(samples) // 10)
+            if time.perf_counter() >= deadline:
+                break
+        return samples
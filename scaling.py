@@ -0,0 +1,58 @@
+import math
+import statistics
+
+# A step is a cliff when its local growth exponent exceeds the exponent fitted on the smaller sizes by this much
+CLIFF_MARGIN = 1.0
+
+
+def fit_exponent(sizes, latencies):
+    # Least-squares fit of latency = a * size^b in log-log space; returns b, or None with fewer than two points
+    points = [(math.log(size), math.log(latency)) for size, latency in zip(sizes, latencies)
+              if size > 0 and latency > 0]
+    if len(points) < 2:
+        return None
+    mean_x = statistics.mean(x for x, y in points)
+    mean_y = statistics.mean(y for x, y in points)
+    spread = sum((x - mean_x) ** 2 for x, y in points)
+    if spread == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+
+def local_exponents(sizes, latencies):
+    # Growth exponent between every pair of consecutive sizes
+    return [fit_exponent(sizes[i - 1:i + 1], latencies[i - 1:i + 1]) for i in range(1, len(sizes))]
+
+
+def detect_cliff(sizes, latencies, margin=CLIFF_MARGIN):
+    # First size whose step grows faster than the trend fitted on all smaller sizes, by more than margin
+    for i in range(2, len(sizes)):
+        trend = fit_exponent(sizes[:i], latencies[:i])
+        step = fit_exponent(sizes[i - 1:i + 1], latencies[i - 1:i + 1])
+        if trend is not None and step is not None and step - trend > margin:
+            return sizes[i]
+    return None
+
+
+def analyse(points, margin=CLIFF_MARGIN):
+    # points: {(index_config, query): [(size, median latency), ...]} in increasing size order
+    analysis = {}
+    for (index_config, query), series in points.items():
+        sizes = [size for size, latency in series]
+        latencies = [latency for size, latency in series]
+        analysis[(index_config, query)] = {
+            'exponent': fit_exponent(sizes, latencies),
+            'local_exponents': local_exponents(sizes, latencies),
+            'cliff_at': detect_cliff(sizes, latencies, margin),
+        }
+    return analysis
+
+
+def print_analysis(name, analysis):
+    print(f"{name}: latency ~ rows^exponent")
+    print(f"{'index config':<14}{'query':<8}{'exponent':>10}{'cliff at rows':>15}  local exponents")
+    for (index_config, query), row in sorted(analysis.items()):
+        exponent = f"{row['exponent']:>10.2f}" if row['exponent'] is not None else f"{'n/a':>10}"
+        cliff = str(row['cliff_at']) if row['cliff_at'] is not None else '-'
+        steps = ' '.join(f"{value:.2f}" if value is not None else 'n/a' for value in row['local_exponents'])
+        print(f"{index_config:<14}{query:<8}{exponent}{cliff:>15}  {steps}")
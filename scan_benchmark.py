@@ -0,0 +1,46 @@
+import statistics
+
+from fake_data_inserter import TABLE_COLUMNS
+
+# Each base table is read in full once through a single query and once split into token ranges read side by side
+MODES = [('single', False), ('parallel', True)]
+
+
+def measure_scan(connection, label, scan):
+    # Like the read queries; the rows are counted, not kept
+    counted = []
+
+    def call():
+        counted[:] = [sum(1 for row in scan())]
+
+    connection.wire.reset()
+    samples = connection.sampler.collect(call, connection.prepare_cache)
+    connection.samples[label] = samples
+    connection.wire_stats[label] = connection.wire.per_iteration(len(samples))
+    return statistics.median(samples), counted[0]
+
+
+def run_scan_workload(backend):
+    connection = backend.connection
+    connection.samples = {}
+    connection.wire_stats = {}
+    connection.breakdowns = {}
+    results = []
+    for table in TABLE_COLUMNS:
+        row = {'table': table}
+        for mode, parallel in MODES:
+            median, rows = measure_scan(connection, f"{table}/{mode}",
+                                        lambda: backend.scan_table(table, parallel))
+            row[mode] = {'median': median, 'rows': rows, 'rows_per_second': rows / median if median else 0.0}
+        results.append(row)
+    return {'settings': backend.scan_settings(), 'tables': results}
+
+
+def print_scan_results(stats):
+    print(f"full scans: {', '.join(f'{key} {value}' for key, value in stats['settings'].items())}")
+    print(f"{'table':<14}{'rows':>10}{'single s':>12}{'rows/s':>12}{'parallel s':>12}{'rows/s':>12}{'speedup':>9}")
+    for row in stats['tables']:
+        single, parallel = row['single'], row['parallel']
+        speedup = single['median'] / parallel['median'] if parallel['median'] else float('inf')
+        print(f"{row['table']:<14}{single['rows']:>10}{single['median']:>12.6f}{single['rows_per_second']:>12.0f}"
+              f"{parallel['median']:>12.6f}{parallel['rows_per_second']:>12.0f}{speedup:>8.2f}x")
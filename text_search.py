@@ -0,0 +1,133 @@
+import re
+import statistics
+import time
+from collections import Counter
+
+from fake_data_inserter import TABLE_COLUMNS
+
+# Free-text columns the workload searches
+TEXT_COLUMNS = [('products', 'name'), ('merchants', 'merchant_name'), ('users', 'full_name')]
+
+# term: a whole word; prefix: the start of a word; phrase: two adjacent words
+KINDS = ['term', 'prefix', 'phrase']
+PREFIX_LENGTH = 3
+
+# Values are picked by document frequency rank: the most common, the median and the rarest one
+RANKS = [0.0, 0.5, 1.0]
+
+
+def tokens(text):
+    # Lower-cased words, roughly what the engines' standard analyzers produce
+    return re.findall(r'\w+', str(text).lower())
+
+
+def scan_pattern(kind, value):
+    # Regex used by the scan side of a case; \b and \W behave the same in MySQL (ICU), Java, PCRE and Python
+    words = value.split()
+    if kind == 'prefix':
+        return r'\b' + re.escape(value)
+    return r'\b' + r'\W+'.join(re.escape(word) for word in words) + r'\b'
+
+
+def index_query(kind, value):
+    # Query string for the engines' text index syntax (MySQL boolean mode, MongoDB $search and Lucene all agree)
+    if kind == 'prefix':
+        return value + '*'
+    if kind == 'phrase':
+        return f'"{value}"'
+    return value
+
+
+def matches(kind, value, text):
+    return re.search(scan_pattern(kind, value), str(text), re.IGNORECASE) is not None
+
+
+def document_counts(kind, docs):
+    if kind == 'term':
+        return Counter(word for doc in docs for word in set(doc))
+    if kind == 'prefix':
+        return Counter(prefix for doc in docs
+                       for prefix in {word[:PREFIX_LENGTH] for word in doc if len(word) >= PREFIX_LENGTH})
+    return Counter(phrase for doc in docs for phrase in {f"{a} {b}" for a, b in zip(doc, doc[1:])})
+
+
+def pick_cases(tables):
+    # One case per column, kind and rank, with the fraction of rows it matches in the generated data
+    cases = []
+    for table, column in TEXT_COLUMNS:
+        position = TABLE_COLUMNS[table].index(column)
+        docs = [tokens(row[position]) for row in tables[table]]
+        for kind in KINDS:
+            ranked = sorted(document_counts(kind, docs).items(), key=lambda item: (-item[1], item[0]))
+            if not ranked:
+                continue
+            picked = sorted({round(rank * (len(ranked) - 1)) for rank in RANKS})
+            for index in picked:
+                value, count = ranked[index]
+                cases.append({'table': table, 'column': column, 'kind': kind, 'value': value,
+                              'selectivity': count / len(docs)})
+    return cases
+
+
+def case_label(case):
+    return f"{case['kind']}:{case['table']}.{case['column']}:{case['value']}"
+
+
+def measure(connection, label, func):
+    # Like the read queries, but the rows of the last call are kept to compare index and scan results
+    returned = []
+
+    def call():
+        returned[:] = [func()]
+
+    connection.wire.reset()
+    samples = connection.sampler.collect(call, connection.prepare_cache)
+    connection.samples[label] = samples
+    connection.wire_stats[label] = connection.wire.per_iteration(len(samples))
+    return statistics.median(samples), returned[0]
+
+
+def run_text_workload(backend, cases):
+    # Builds the full-text indexes, runs every case through them and as a regex scan, then drops them again
+    connection = backend.connection
+    connection.samples = {}
+    connection.wire_stats = {}
+    connection.breakdowns = {}
+    start = time.perf_counter()
+    backend.create_text_indexes()
+    backend.wait_for_indexes()
+    build_seconds = time.perf_counter() - start
+    results = []
+    try:
+        for case in cases:
+            label = case_label(case)
+            row = dict(case, index_median=None, index_rows=None)
+            args = (case['table'], case['column'], case['kind'], case['value'])
+            # Some indexes have no query form for a kind, e.g. prefixes in a MongoDB text index
+            if case['kind'] in backend.text_kinds:
+                row['index_median'], rows = measure(connection, label + '/index',
+                                                    lambda: backend.text_search(*args, use_index=True))
+                row['index_rows'] = len(rows)
+            row['scan_median'], rows = measure(connection, label + '/scan',
+                                               lambda: backend.text_search(*args, use_index=False))
+            row['scan_rows'] = len(rows)
+            results.append(row)
+    finally:
+        backend.drop_text_indexes()
+    return {'build_seconds': build_seconds, 'cases': results}
+
+
+def print_text_results(stats):
+    print(f"full-text index build: {stats['build_seconds']:.3f}s")
+    print(f"{'kind':<8}{'column':<24}{'value':<18}{'select.':>9}{'index s':>11}{'scan s':>11}{'speedup':>9}"
+          f"{'index rows':>12}{'scan rows':>11}")
+    for row in stats['cases']:
+        if row['index_median'] is None:
+            index, speedup, index_rows = f"{'n/a':>11}", f"{'n/a':>9}", f"{'n/a':>12}"
+        else:
+            index = f"{row['index_median']:>11.6f}"
+            ratio = row['scan_median'] / row['index_median'] if row['index_median'] else float('inf')
+            speedup = f"{ratio:>8.2f}x"
+            index_rows = f"{row['index_rows']:>12}"
+        print(f"{row['kind']:<8}{row['table'] + '.' + row['column']:<24}{row['value'][:16]:<18}"
+              f"{row['selectivity']:>9.4f}{index}{row['scan_median']:>11.6f}{speedup}{index_rows}{row['scan_rows']:>11}")
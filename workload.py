@@ -0,0 +1,153 @@
+import random
+import statistics
+from collections import Counter
+from datetime import datetime, timedelta
+
+# Each query template takes one parameter. The defaults reproduce the original fixed-literal queries;
+# None for q3/q4 means "every merchant/user", as before.
+#   q5 products with min_price <= price < min_price + PRICE_BAND
+#   q6 orders created at or after since (a created_at timestamp), None for all orders
+#   q7 the limit merchants with the highest revenue
+#   q8 the PAGE_SIZE orders after the keyset cursor (created_at, order_id) in that order, None for the first page
+QUERY_PARAMS = {
+    'q1': 'continent',
+    'q2': 'status',
+    'q3': 'merchant_id',
+    'q4': 'user_id',
+    'q5': 'min_price',
+    'q6': 'since',
+    'q7': 'limit',
+    'q8': 'after',
+}
+DEFAULT_PARAMS = {'q1': 'North America', 'q2': 'Shipped', 'q3': None, 'q4': None,
+                  'q5': 50, 'q6': None, 'q7': 10, 'q8': None}
+
+PRICE_BAND = 10
+PAGE_SIZE = 50
+# q6 windows, in days back from the newest order of the dataset
+TIME_WINDOWS = [1, 7, 30, 90, 180]
+TOP_N = [1, 5, 10, 50, 100]
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+DISTRIBUTIONS = ['fixed', 'uniform', 'zipf']
+
+
+def param_selectivity(tables):
+    # Fraction of the driving table each parameter value selects, from the generated rows:
+    #   q1 users in the continent, q2 orders with the status, q3 products of the merchant, q4 orders of the user
+    continent_of = {country[0]: country[2] for country in tables['countries']}
+    users_per_continent = Counter(continent_of.get(user[5]) for user in tables['users'])
+    orders_per_status = Counter(order[2] for order in tables['orders'])
+    products_per_merchant = Counter(product[1] for product in tables['products'])
+    orders_per_user = Counter(order[1] for order in tables['orders'])
+
+    num_users = max(len(tables['users']), 1)
+    num_orders = max(len(tables['orders']), 1)
+    num_products = max(len(tables['products']), 1)
+    num_merchants = max(len(tables['merchants']), 1)
+    products_per_band = Counter(product[3] // PRICE_BAND * PRICE_BAND for product in tables['products'])
+    created = sorted((order[3], order[0]) for order in tables['orders'])
+    newest = datetime.strptime(created[-1][0], TIME_FORMAT) if created else datetime.now()
+    since = [(newest - timedelta(days=days)).strftime(TIME_FORMAT) for days in TIME_WINDOWS]
+    return {
+        'q1': {continent: users_per_continent.get(continent, 0) / num_users
+               for continent in set(continent_of.values())},
+        'q2': {status: count / num_orders for status, count in orders_per_status.items()},
+        'q3': {merchant[0]: products_per_merchant.get(merchant[0], 0) / num_products
+               for merchant in tables['merchants']},
+        'q4': {user[0]: orders_per_user.get(user[0], 0) / num_orders for user in tables['users']},
+        'q5': {band: count / num_products for band, count in products_per_band.items()},
+        'q6': {value: sum(1 for created_at, order_id in created if created_at >= value) / num_orders
+               for value in since},
+        'q7': {limit: min(limit, num_merchants) / num_merchants for limit in TOP_N},
+        # Cursors at every page boundary, so paging through the values visits every page once
+        'q8': {created[i - 1]: min(PAGE_SIZE, len(created) - i) / num_orders
+               for i in range(PAGE_SIZE, len(created), PAGE_SIZE)},
+    }
+
+
+def as_int_tables(tables):
+    # read_csv returns strings; ids are compared as ints by every connector except Redis
+    int_columns = {'countries': [0], 'users': [0, 5], 'merchants': [0, 2, 3], 'orders': [0, 1],
+                   'products': [0, 1, 3]}
+    return {table: [tuple(int(value) if i in columns else value for i, value in enumerate(row))
+                    for row in tables[table]]
+            for table, columns in int_columns.items()}
+
+
+class ParameterStream:
+    # Draws one parameter value per benchmark iteration and remembers every draw, in order,
+    # so draw i belongs to sample i of the query
+    def __init__(self, distribution, selectivity, fixed=None, zipf_s=1.1, seed=None):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown distribution {distribution!r}, expected one of {DISTRIBUTIONS}")
+        self.distribution = distribution
+        self.selectivity = selectivity
+        self.fixed = fixed
+        self.rng = random.Random(seed)
+        # Zipf ranks the values by selectivity, so the most frequent draws are the least selective ones
+        self.values = sorted(selectivity, key=lambda value: (-selectivity[value], str(value)))
+        self.weights = [1 / rank ** zipf_s for rank in range(1, len(self.values) + 1)]
+        self.drawn = []
+
+    def next(self):
+        if self.distribution == 'fixed' or not self.values:
+            value = self.fixed
+        elif self.distribution == 'uniform':
+            value = self.rng.choice(self.values)
+        else:
+            value = self.rng.choices(self.values, weights=self.weights)[0]
+        self.drawn.append(value)
+        return value
+
+    def selectivity_of(self, value):
+        return 1.0 if value is None else self.selectivity.get(value, 0.0)
+
+
+def make_streams(selectivity, distribution, fixed=None, zipf_s=1.1, seed=None):
+    # selectivity as returned by param_selectivity
+    fixed = dict(DEFAULT_PARAMS, **(fixed or {}))
+    return {query: ParameterStream(distribution, selectivity[query], fixed[query], zipf_s,
+                                   None if seed is None else seed + i)
+            for i, query in enumerate(QUERY_PARAMS)}
+
+
+def named_params(query, value):
+    # Driver parameters of one query; q8's cursor is passed as its two columns
+    if query == 'q8':
+        after_created_at, after_order_id = value if value is not None else (None, None)
+        return {'after_created_at': after_created_at, 'after_order_id': after_order_id}
+    return {QUERY_PARAMS[query]: value}
+
+
+def bind(func, query, params):
+    # Zero-argument callable for the sampler: a fresh draw per iteration when params has a stream for query
+    stream = params.get(query) if params else None
+    if stream is None:
+        default = DEFAULT_PARAMS[query]
+        return lambda: func(default)
+    return lambda: func(stream.next())
+
+
+def selectivity_report(samples, streams):
+    # Per query and drawn value: how often it was drawn, its selectivity and its median latency
+    report = {}
+    for query, times in samples.items():
+        stream = streams.get(query)
+        if stream is None or not times:
+            continue
+        by_value = {}
+        for value, elapsed in zip(stream.drawn, times):
+            by_value.setdefault(value, []).append(elapsed)
+        report[query] = sorted(({'value': value, 'draws': len(values), 'selectivity': stream.selectivity_of(value),
+                                 'median': statistics.median(values)} for value, values in by_value.items()),
+                               key=lambda row: row['selectivity'])
+    return report
+
+
+def print_selectivity_report(report):
+    print(f"{'query':<8}{'parameter':<22}{'draws':>7}{'selectivity':>13}{'median s':>12}")
+    for query, rows in report.items():
+        for row in rows:
+            print(f"{query:<8}{str(row['value'])[:20]:<22}{row['draws']:>7}{row['selectivity']:>13.4f}"
+                  f"{row['median']:>12.6f}")
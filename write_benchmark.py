@@ -0,0 +1,90 @@
+import random
+import statistics
+import time
+
+# Orders written by the workload get ids from here on, far above any generated order,
+# and are all deleted again by the delete step
+FIRST_ORDER_ID = 10_000_000
+
+# Every inserted order is moved through both transitions, so the update step runs two updates per order
+STATUS_TRANSITIONS = [('Pending', 'Shipped'), ('Shipped', 'Delivered')]
+
+PERCENTILES = [50, 95, 99]
+
+
+def percentile(sorted_samples, point):
+    # Nearest-rank percentile
+    index = max(0, min(len(sorted_samples) - 1, int(round(point / 100 * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+def latency_stats(samples, elapsed):
+    ordered = sorted(samples)
+    stats = {'ops': len(samples), 'throughput': len(samples) / elapsed if elapsed else 0.0,
+             'mean': statistics.mean(samples), 'max': ordered[-1]}
+    for point in PERCENTILES:
+        stats[f'p{point}'] = percentile(ordered, point)
+    return stats
+
+
+def make_orders(count, num_users, seed=None):
+    rng = random.Random(seed)
+    return [(FIRST_ORDER_ID + i, rng.randint(1, num_users), 'Pending',
+             time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(1_700_000_000 + rng.randint(0, 31_536_000))))
+            for i in range(count)]
+
+
+def timed_ops(connection, op, calls):
+    # Each call is one write and its commit, timed on its own; throughput uses the wall time of the whole step
+    connection.wire.reset()
+    samples = []
+    start = time.perf_counter()
+    for call in calls:
+        op_start = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - op_start)
+    elapsed = time.perf_counter() - start
+    connection.samples[op] = samples
+    connection.wire_stats[op] = connection.wire.per_iteration(len(samples))
+    return latency_stats(samples, elapsed)
+
+
+def run_write_workload(backend, index_config, orders):
+    # Inserts the orders, moves each one through the status transitions and deletes them again,
+    # so the database ends up as it started
+    connection = backend.connection
+    connection.samples = {}
+    connection.wire_stats = {}
+    connection.breakdowns = {}
+    backend.prepare_writes(index_config)
+    inserts = [lambda order=order: backend.insert_order(order) for order in orders]
+    updates = [lambda order_id=order[0], status=new: backend.update_order_status(order_id, status)
+               for old, new in STATUS_TRANSITIONS for order in orders]
+    deletes = [lambda order_id=order[0]: backend.delete_order(order_id) for order in orders]
+    return {
+        'insert': timed_ops(connection, 'insert', inserts),
+        'update': timed_ops(connection, 'update', updates),
+        'delete': timed_ops(connection, 'delete', deletes),
+    }
+
+
+def print_write_stats(stats):
+    print(f"{'op':<10}{'ops':>8}{'ops/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for op, row in stats.items():
+        print(f"{op:<10}{row['ops']:>8}{row['throughput']:>12.1f}{row['p50'] * 1000:>10.3f}"
+              f"{row['p95'] * 1000:>10.3f}{row['p99'] * 1000:>10.3f}{row['max'] * 1000:>10.3f}")
+
+
+def print_write_comparison(baseline_config, stats_by_index):
+    # Write cost of each index configuration relative to the baseline: throughput ratio below 1 means slower writes
+    baseline = stats_by_index.get(baseline_config)
+    if baseline is None:
+        return
+    print(f"{'index config':<14}{'op':<10}{'ops/s':>12}{'vs ' + baseline_config:>14}{'p99 ms':>10}{'p99 ratio':>11}")
+    for index_config, stats in stats_by_index.items():
+        for op, row in stats.items():
+            base = baseline[op]
+            throughput_ratio = row['throughput'] / base['throughput'] if base['throughput'] else float('inf')
+            p99_ratio = row['p99'] / base['p99'] if base['p99'] else float('inf')
+            print(f"{index_config:<14}{op:<10}{row['throughput']:>12.1f}{throughput_ratio:>13.2f}x"
+                  f"{row['p99'] * 1000:>10.3f}{p99_ratio:>10.2f}x")